@@ -2,7 +2,8 @@
 from django.contrib import admin
 
 from .models import Pozicija, PozicijosBrezinys, KainosEilute
-from .services.previews import regenerate_missing_preview
+from .services.preview_queue import enqueue_preview
+from .services.listing import annotate_virtual
 
 
 @admin.register(Pozicija)
@@ -12,23 +13,20 @@ class PozicijaAdmin(admin.ModelAdmin):
     list_filter = ("klientas", "projektas")
     ordering = ("-created",)
 
-    @admin.display(description="Brėžiniai")
+    def get_queryset(self, request):
+        # skaičius – subquery anotacija, ne obj.breziniai.count() kiekvienai eilutei
+        return annotate_virtual(super().get_queryset(request), ["brez_count"])
+
+    @admin.display(description="Brėžiniai", ordering="brez_count")
     def brez_count(self, obj: Pozicija) -> int:
-        # jei related_name kitas – čia pataisyti į tavo realų (dažniausiai "breziniai")
-        return obj.breziniai.count()
+        return obj.brez_count
 
 
 @admin.action(description="Regeneruoti peržiūras (PNG) pasirinktiems")
 def regenerate_previews_action(modeladmin, request, queryset):
-    ok, total = 0, 0
-    for b in queryset:
-        total += 1
-        res = regenerate_missing_preview(b)
-        # suderinam su abiem variantais: res gali būti bool arba objektas su .ok
-        ok_flag = getattr(res, "ok", bool(res))
-        if ok_flag:
-            ok += 1
-    modeladmin.message_user(request, f"Sėkmingai: {ok}/{total}")
+    # tik į eilę – generuoja run_preview_worker, admin request'as neblokuojamas
+    queued = sum(1 for b in queryset if enqueue_preview(b, force=True) is not None)
+    modeladmin.message_user(request, f"Į eilę įtraukta: {queued}/{queryset.count()}")
 
 
 @admin.register(PozicijosBrezinys)
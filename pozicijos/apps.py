@@ -1,5 +1,6 @@
 # pozicijos/apps.py
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 class PozicijosConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
@@ -7,4 +8,7 @@ class PozicijosConfig(AppConfig):
 
     def ready(self):
         # užregistruojam signalus
-        from . import signals  # noqa: F401
+        from . import signals
+
+        # po migrate – FTS trigger'iai (SQLite juos numeta perkurdamas lentelę)
+        post_migrate.connect(signals.restore_search_triggers, sender=self)
@@ -5,6 +5,7 @@ from django import forms
 from django.forms import inlineformset_factory
 
 from .models import Pozicija, KainosEilute
+from .services.kainos import busena_for_start
 
 
 BUSENA_UI_CHOICES = [
@@ -23,7 +24,8 @@ class KainosEiluteForm(forms.ModelForm):
     """
     Intervalinė kainodara (be fiksuotos kainos UI):
 
-    - UI: Būsena = Aktuali / Neaktuali (Neaktuali -> DB "sena")
+    - UI: Būsena = Aktuali / Neaktuali (Neaktuali -> DB "sena"; Aktuali su būsima
+      galioja_nuo -> DB "laukianti", aktuali taps per manage.py kainu_galiojimas)
     - Privaloma: Kiekis nuo IR Kiekis iki (kai eilutė realiai pildoma)
     - Matas: Vnt. / kg / komplektas
 
@@ -90,15 +92,16 @@ class KainosEiluteForm(forms.ModelForm):
                 w.attrs.setdefault("placeholder", "")
 
         # inicializuojam busena_ui iš DB (empty_form -> bus "aktuali", kas ir ok)
+        # ('laukianti' – aktuali su būsima galioja_nuo, UI rodoma kaip Aktuali)
         db_busena = getattr(self.instance, "busena", None) or "aktuali"
-        self.fields["busena_ui"].initial = "aktuali" if db_busena == "aktuali" else "neaktuali"
+        self.fields["busena_ui"].initial = "aktuali" if db_busena in ("aktuali", "laukianti") else "neaktuali"
 
     def clean(self):
         cleaned = super().clean()
 
         # UI -> DB busena
         bus_ui = cleaned.get("busena_ui") or "aktuali"
-        cleaned["busena"] = "aktuali" if bus_ui == "aktuali" else "sena"
+        cleaned["busena"] = busena_for_start(cleaned.get("galioja_nuo")) if bus_ui == "aktuali" else "sena"
 
         kn = cleaned.get("kiekis_nuo")
         kk = cleaned.get("kiekis_iki")
@@ -125,7 +128,7 @@ class KainosEiluteForm(forms.ModelForm):
 
         # busena_ui -> inst.busena
         bus_ui = self.cleaned_data.get("busena_ui") or "aktuali"
-        inst.busena = "aktuali" if bus_ui == "aktuali" else "sena"
+        inst.busena = busena_for_start(inst.galioja_nuo) if bus_ui == "aktuali" else "sena"
 
         # kad neliktų fiksuotos logikos DB lygyje (UI jos nebėra)
         if hasattr(inst, "yra_fiksuota"):
@@ -1,18 +1,29 @@
 # pozicijos/kainos_views.py
 from __future__ import annotations
 
+import hmac
 from urllib.parse import urlencode
 
+from django.conf import settings
 from django.contrib import messages
-from django.db import transaction
-from django.http import HttpRequest, HttpResponse
+from django.http import HttpRequest, HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, redirect, render
 from django.urls import reverse
+from django.views.decorators.csrf import csrf_exempt
 from django.views.decorators.http import require_http_methods, require_POST
 
-from .models import Pozicija, KainosEilute
+from .models import Pozicija, KainosEilute, KainosEiluteArchyvas
 from .forms_kainos import KainaFormSet
-from .services.kainos import set_aktuali
+from .services.export import iter_csv
+from .services.kainos import save_kainos_formset, set_aktuali
+from .services.price_audit import KIND_LABELS, cached_catalogue_audit
+from .services.quotes import (
+    QUOTE_RESULT_HEADER,
+    QUOTE_RESULT_KEYS,
+    QuoteInput,
+    parse_quote_input,
+    price_quote_rows,
+)
 
 
 def _get_filters(request: HttpRequest) -> tuple[str, str]:
@@ -79,23 +90,9 @@ def kainos_list(request: HttpRequest, pk: int) -> HttpResponse:
     if request.method == "POST":
         formset = KainaFormSet(request.POST, instance=pozicija, queryset=qs, prefix=prefix)
         if formset.is_valid():
-            with transaction.atomic():
-                # Trinimai
-                for form in formset.deleted_forms:
-                    if form.instance.pk:
-                        form.instance.delete()
-
-                # Save / create
-                instances = formset.save(commit=False)
-                for inst in instances:
-                    inst.pozicija = pozicija
-                    inst.save()
-
-                # Konfliktų tvarkymas „aktuali“ logikai
-                for inst in instances:
-                    if inst.busena == "aktuali":
-                        # inst jau išsaugotas; set_aktuali tvarko senas ir atnaujina pozicija.kaina_eur
-                        set_aktuali(inst, save=False)
+            # Trinimai, bulk create/update ir „aktuali“ konfliktai – keli statement'ai visam formset'ui
+            user = request.user if getattr(request.user, "is_authenticated", False) else None
+            save_kainos_formset(formset, pozicija, user=user)
 
             messages.success(request, "Kainos išsaugotos.")
             return _redirect_with_filters(pozicija.pk, busena, matas)
@@ -140,12 +137,127 @@ def kaina_delete(request: HttpRequest, id: int) -> HttpResponse:
 
 
 def kaina_history(request: HttpRequest, id: int) -> HttpResponse:
-    kaina = get_object_or_404(KainosEilute, pk=id)
-    history_qs = kaina.history.all().order_by("-history_date")
+    """Istorija lieka ir archyvuotoms eilutėms (KainosEiluteArchyvas – tas pats id)."""
+    kaina = (
+        KainosEilute.objects.select_related("pozicija").filter(pk=id).first()
+        or get_object_or_404(KainosEiluteArchyvas.objects.select_related("pozicija"), pk=id)
+    )
+    history_qs = KainosEilute.history.filter(id=id).order_by("-history_date")
 
     context = {
         "pozicija": kaina.pozicija,
         "kaina": kaina,
         "history": history_qs,
+        "archyvuota": getattr(kaina, "archyvuota", None),
     }
     return render(request, "pozicijos/kaina_history.html", context)
+
+
+@require_http_methods(["GET", "POST"])
+def kainos_quote(request: HttpRequest) -> HttpResponse:
+    """
+    Masinis įkainojimas: (poz_kodas, kiekis, matas) sąrašas -> kainos.
+
+    POST:
+      - failas (file) arba tekstas (lines) iš formos, arba JSON body (application/json,
+        su CSRF antrašte – kitoms sistemoms skirtas kainos_quote_api);
+      - ?format=json -> JSON atsakymas, kitaip – srautinis CSV.
+    """
+    if request.method == "GET":
+        return render(request, "pozicijos/kainos_quote.html")
+
+    if request.content_type == "application/json":
+        text = request.body.decode("utf-8", errors="replace")
+    elif request.FILES.get("file"):
+        text = request.FILES["file"].read().decode("utf-8-sig", errors="replace")
+    else:
+        text = request.POST.get("lines", "")
+
+    parsed = parse_quote_input(text)
+    if request.content_type == "application/json" and parsed.input_error:
+        return JsonResponse({"error": parsed.input_error}, status=400)
+    if not parsed.rows and not parsed.errors:
+        messages.error(request, "Nepateikta nė viena eilutė.")
+        return render(request, "pozicijos/kainos_quote.html", {"lines": text})
+
+    rows = price_quote_rows(parsed.rows)
+    fmt = (request.GET.get("format") or request.POST.get("format") or "csv").lower()
+
+    if fmt == "json":
+        return _quote_json(parsed, rows)
+
+    def with_errors():
+        yield from rows
+        for e in parsed.errors:
+            yield [e.row_number, None, None, None, None, None, None, None, None, e.message]
+
+    response = StreamingHttpResponse(iter_csv(QUOTE_RESULT_HEADER, with_errors()), content_type="text/csv; charset=utf-8")
+    response["Content-Disposition"] = 'attachment; filename="kainos_pasiulymas.csv"'
+    return response
+
+
+def _quote_json(parsed: QuoteInput, rows) -> JsonResponse:
+    return JsonResponse({
+        "lines": [dict(zip(QUOTE_RESULT_KEYS, r)) for r in rows],
+        "errors": [{"row": e.row_number, "message": e.message} for e in parsed.errors],
+    })
+
+
+def _api_token_ok(request: HttpRequest) -> bool:
+    scheme, _sep, token = request.headers.get("Authorization", "").partition(" ")
+    if scheme.lower() != "bearer" or not token:
+        return False
+    # compare_digest su kiekvienu raktu – laikas nepriklauso nuo to, kiek simbolių sutapo
+    return any(hmac.compare_digest(token.encode(), t.encode()) for t in settings.KAINOS_API_TOKENS)
+
+
+@csrf_exempt
+@require_POST
+def kainos_quote_api(request: HttpRequest) -> JsonResponse:
+    """
+    Masinis įkainojimas kitoms sistemoms: JSON body -> JSON (kaip kainos_quote ?format=json).
+    Be sesijos ir CSRF – autentifikacija tik per "Authorization: Bearer <raktas>"
+    (settings.KAINOS_API_TOKENS). Blogas JSON ar jo forma – 400.
+    """
+    if not _api_token_ok(request):
+        return JsonResponse({"error": "Neteisingas arba trūkstamas API raktas."}, status=401)
+    if request.content_type != "application/json":
+        return JsonResponse({"error": "Laukiama application/json."}, status=415)
+
+    text = request.body.decode("utf-8", errors="replace")
+    if text.lstrip("\ufeff").lstrip()[:1] not in ("[", "{"):
+        return JsonResponse({"error": "Laukiamas JSON sąrašas arba objektas."}, status=400)
+
+    parsed = parse_quote_input(text)
+    if parsed.input_error or (not parsed.rows and not parsed.errors):
+        return JsonResponse({"error": parsed.input_error or "Nepateikta nė viena eilutė."}, status=400)
+    return _quote_json(parsed, price_quote_rows(parsed.rows))
+
+
+AUDIT_MAX_ROWS = 1000
+
+
+def kainos_audit(request: HttpRequest) -> HttpResponse:
+    """
+    Viso katalogo aktualių kainų intervalų auditas (persidengimai, tarpai,
+    apversti intervalai, pasikartojantys fiksuoti kiekiai). ?kind=... – tik vienas tipas.
+    Rezultatas kešuojamas iki kainų pasikeitimo; ?refresh=1 – perskaičiuoti.
+    """
+    kind = (request.GET.get("kind") or "").strip()
+    result = cached_catalogue_audit(refresh=request.GET.get("refresh") == "1")
+
+    issues = [i for i in result.issues if not kind or i.kind == kind]
+    shown = issues[:AUDIT_MAX_ROWS]
+    kodai = dict(
+        Pozicija.objects.filter(pk__in={i.pozicija_id for i in shown}).values_list("id", "poz_kodas")
+    )
+
+    context = {
+        "result": result,
+        "kind": kind,
+        "kinds": [(k, label, result.counts.get(k, 0)) for k, label in KIND_LABELS.items()],
+        "issues": [(i, kodai.get(i.pozicija_id) or i.pozicija_id) for i in shown],
+        "total": len(issues),
+        "truncated": len(issues) > AUDIT_MAX_ROWS,
+    }
+    return render(request, "pozicijos/kainos_audit.html", context)
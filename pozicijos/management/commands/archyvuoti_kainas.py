@@ -0,0 +1,47 @@
+# pozicijos/management/commands/archyvuoti_kainas.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from pozicijos.services.price_archive import (
+    ARCHIVE_AFTER_DAYS,
+    ARCHIVE_BATCH_SIZE,
+    archive_old_lines,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Perkelia senas ('sena') kainų eilutes, nekeistas ilgiau nei --days dienų, "
+        "į archyvo lentelę (KainosEiluteArchyvas) partijomis. Istorija ir kainų "
+        "periodai datai lieka pasiekiami."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--days", type=int, default=ARCHIVE_AFTER_DAYS,
+            help=f"Eilutės senumas dienomis nuo paskutinio pakeitimo (numatyta {ARCHIVE_AFTER_DAYS})",
+        )
+        parser.add_argument("--batch-size", type=int, default=ARCHIVE_BATCH_SIZE)
+        parser.add_argument("--limit", type=int, help="Daugiausia tiek eilučių per paleidimą")
+        parser.add_argument("--dry-run", action="store_true", help="Tik suskaičiuoti, nieko nekeisti")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        result = archive_old_lines(
+            options["days"],
+            batch_size=options["batch_size"],
+            limit=options["limit"],
+            dry_run=options["dry_run"],
+        )
+        elapsed = time.perf_counter() - started
+
+        if options["dry_run"]:
+            self.stdout.write(
+                f"Būtų archyvuota eilučių: {result.moved} ({len(result.pozicijos)} pozicijų)"
+            )
+            return
+        self.stdout.write(self.style.SUCCESS(
+            f"Archyvuota eilučių: {result.moved} ({len(result.pozicijos)} pozicijų, "
+            f"{result.batches} partijų); {elapsed:.2f} s"
+        ))
@@ -0,0 +1,35 @@
+# pozicijos/management/commands/audit_kainos.py
+import time
+
+from django.core.management.base import BaseCommand
+
+from pozicijos.services.price_audit import KIND_LABELS, audit_price_lines
+
+
+class Command(BaseCommand):
+    help = (
+        "Viso katalogo kainų intervalų auditas vienu surikiuotu perėjimu: "
+        "persidengimai, tarpai, apversti intervalai, pasikartojantys fiksuoti kiekiai."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--kind", choices=sorted(KIND_LABELS), help="Rodyti tik šį problemos tipą")
+        parser.add_argument("--busena", default="aktuali", help="Kurios būsenos eilutes tikrinti (numatyta: aktuali)")
+        parser.add_argument("--limit", type=int, default=200, help="Kiek problemų išspausdinti (0 – visas)")
+
+    def handle(self, *args, **options):
+        started = time.perf_counter()
+        result = audit_price_lines(busena=options["busena"])
+        elapsed = time.perf_counter() - started
+
+        issues = [i for i in result.issues if not options["kind"] or i.kind == options["kind"]]
+        limit = options["limit"] or len(issues)
+        for i in issues[:limit]:
+            ids = ", ".join(f"#{pk}" for pk in i.line_ids)
+            self.stdout.write(f"[{i.kind}] pozicija id={i.pozicija_id}, matas={i.matas!r}: {i.detail} ({ids})")
+        if len(issues) > limit:
+            self.stdout.write(f"... ir dar {len(issues) - limit}")
+
+        summary = ", ".join(f"{KIND_LABELS[k]}: {result.counts.get(k, 0)}" for k in KIND_LABELS)
+        style = self.style.SUCCESS if not result.issues else self.style.WARNING
+        self.stdout.write(style(f"Eilučių: {result.lines}, problemų: {len(result.issues)} ({summary}); {elapsed:.3f} s"))
@@ -0,0 +1,62 @@
+# pozicijos/management/commands/backfill_skaitiniai.py
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from pozicijos.models import Pozicija
+from pozicijos.services.list_cache import bump_data_version
+from pozicijos.services.measures import SHADOW_NUMERIC_FIELDS, fill_shadow_fields
+
+
+class Command(BaseCommand):
+    help = (
+        "Užpildo skaitines plotas/svoris/kiekis rėme kopijas (*_num, *_vnt) "
+        "iš tekstinių laukų. Saugu paleisti pakartotinai."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--chunk-size", type=int, default=1000, help="Kiek įrašų vienu bulk_update (default 1000)")
+        parser.add_argument("--dry-run", action="store_true", help="Nieko neišsaugoti, tik suskaičiuoti.")
+
+    def handle(self, *args, **options):
+        chunk_size = max(1, options["chunk_size"])
+        dry_run = options["dry_run"]
+
+        src_fields = list(SHADOW_NUMERIC_FIELDS)
+        shadow_fields = [f for pair in SHADOW_NUMERIC_FIELDS.values() for f in pair]
+
+        qs = Pozicija.objects.only("id", *src_fields, *shadow_fields).order_by("id")
+
+        total = 0
+        changed = 0
+        unparsed = 0
+        batch: list[Pozicija] = []
+
+        def flush():
+            if batch and not dry_run:
+                with transaction.atomic():
+                    Pozicija.objects.bulk_update(batch, shadow_fields)
+            batch.clear()
+
+        for poz in qs.iterator(chunk_size=chunk_size):
+            total += 1
+            if fill_shadow_fields(poz):
+                changed += 1
+                batch.append(poz)
+            for src, (num_field, _unit) in SHADOW_NUMERIC_FIELDS.items():
+                if getattr(poz, src) and getattr(poz, num_field) is None:
+                    unparsed += 1
+            if len(batch) >= chunk_size:
+                flush()
+        flush()
+
+        # bulk_update signalų nekelia – sąrašo kešas (ir *_num filtrai) kitaip liktų seni iki TTL
+        if changed and not dry_run:
+            bump_data_version()
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Baigta. Peržiūrėta: {total}, atnaujinta: {changed} (dry_run={dry_run})"
+        ))
+        if unparsed:
+            self.stdout.write(self.style.WARNING(
+                f"Reikšmių be skaičiaus (paliktos NULL): {unparsed}"
+            ))
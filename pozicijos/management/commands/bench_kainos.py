@@ -0,0 +1,159 @@
+# pozicijos/management/commands/bench_kainos.py
+import random
+import statistics
+import time
+from datetime import date, timedelta
+from decimal import Decimal
+
+from django.core.management.base import BaseCommand
+from django.db import connection, transaction
+
+from pozicijos.models import KainosEilute, Pozicija
+from pozicijos.services.kainos import aktualios_kainos, headline_kainos, set_aktuali
+from pozicijos.services.pricing import fetch_compiled
+
+MATAI = ("Vnt.", "kg", "komplektas")
+
+
+class _Rollback(Exception):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        "Kainų paieškos benchmark'as pozicijai su tūkstančiais istorinių eilučių: "
+        "kainos_list rikiavimas, aktualios_kainos, kainų variklio užkrovimas, headline "
+        "ir set_aktuali. Duomenys kuriami transakcijoje ir atšaukiami. "
+        "--compare – tas pats be KainosEilute indeksų (DROP INDEX toje pačioje transakcijoje)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--lines", type=int, default=5000, help="Eilučių vienai pozicijai (numatyta 5000)")
+        parser.add_argument("--pozicijos", type=int, default=20, help="Kiek tokių pozicijų sukurti (numatyta 20)")
+        parser.add_argument("--repeat", type=int, default=30, help="Kiek kartų kartoti kiekvieną matavimą")
+        parser.add_argument("--compare", action="store_true", help="Pakartoti be indeksų ir palyginti")
+        parser.add_argument("--plan", action="store_true", help="Išspausdinti užklausų planus su indeksais (tik SQLite)")
+
+    def handle(self, *args, **options):
+        try:
+            with transaction.atomic():
+                ids = self._seed(options["pozicijos"], options["lines"])
+                if options["plan"] and connection.vendor == "sqlite":
+                    for name, fn in self._cases(ids).items():
+                        self._print_plan(name, fn)
+                with_idx = self._run(ids, options)
+                self._report("Su indeksais", with_idx)
+
+                if options["compare"]:
+                    self._drop_indexes()
+                    without = self._run(ids, options)
+                    self._report("Be indeksų", without)
+                    self.stdout.write("")
+                    for name, ms in with_idx.items():
+                        base = without[name]
+                        self.stdout.write(f"  {name:<22} x{base / ms:6.1f}" if ms else f"  {name:<22} —")
+                raise _Rollback
+        except _Rollback:
+            pass
+
+    # --- duomenys ---
+
+    def _seed(self, count: int, lines: int) -> list:
+        rnd = random.Random(18)
+        pozicijos = Pozicija.objects.bulk_create(
+            [Pozicija(poz_kodas=f"BENCH-{i}", klientas="BENCH") for i in range(count)]
+        )
+        today = date.today()
+        objs = []
+        for p in pozicijos:
+            for j in range(lines):
+                matas = MATAI[j % len(MATAI)]
+                fiks = rnd.random() < 0.3
+                nuo = rnd.choice((1, 10, 50, 100, 500))
+                objs.append(KainosEilute(
+                    pozicija=p,
+                    kaina=Decimal(rnd.randint(100, 99999)) / 100,
+                    matas=matas,
+                    yra_fiksuota=fiks,
+                    fiksuotas_kiekis=nuo if fiks else None,
+                    kiekis_nuo=None if fiks else nuo,
+                    kiekis_iki=None if fiks else nuo * 10 - 1,
+                    galioja_nuo=today - timedelta(days=lines - j),
+                    galioja_iki=today - timedelta(days=lines - j - 1),
+                    busena="sena",
+                    prioritetas=rnd.randint(0, 3),
+                ))
+            # paskutinės eilutės kiekvienoje grupėje – aktualios
+            for line in objs[-12:]:
+                line.busena = "aktuali"
+                line.galioja_iki = None
+        KainosEilute.objects.bulk_create(objs, batch_size=2000)
+        self.stdout.write(f"Sukurta: {count} pozicijų × {lines} eilučių")
+        return [p.pk for p in pozicijos]
+
+    def _drop_indexes(self):
+        qn = connection.ops.quote_name
+        with connection.cursor() as cur:
+            for idx in KainosEilute._meta.indexes:
+                cur.execute(f"DROP INDEX {qn(idx.name)}")
+
+    # --- matavimai ---
+
+    def _cases(self, ids: list) -> dict:
+        pozicija = Pozicija.objects.get(pk=ids[0])
+        return {
+            "kainos_list": lambda: list(
+                KainosEilute.objects.filter(pozicija=pozicija, busena="aktuali").order_by(
+                    "matas", "yra_fiksuota", "kiekis_nuo", "fiksuotas_kiekis", "prioritetas", "-created",
+                )
+            ),
+            "aktualios_kainos": lambda: list(aktualios_kainos(pozicija)),
+            "fetch_compiled": lambda: fetch_compiled(ids),
+            "headline_kainos": lambda: headline_kainos(ids),
+            "audit_group": lambda: list(
+                KainosEilute.objects.filter(pozicija=pozicija, busena="aktuali", matas="Vnt.")
+                .order_by("-yra_fiksuota", "fiksuotas_kiekis", "kiekis_nuo", "kiekis_iki")
+                .values_list("id", flat=True)
+            ),
+        }
+
+    def _run(self, ids: list, options) -> dict:
+        repeat = max(1, options["repeat"])
+        out = {name: self._time(fn, repeat) for name, fn in self._cases(ids).items()}
+
+        sena = list(
+            KainosEilute.objects.filter(pozicija_id__in=ids, busena="sena")
+            .order_by("-galioja_nuo")[:repeat + 1]
+        )
+        rows = iter(sena)
+        out["set_aktuali"] = self._time(lambda: set_aktuali(next(rows)), min(repeat, len(sena) - 1))
+        return out
+
+    def _time(self, fn, repeat: int) -> float:
+        fn()  # apšilimas
+        samples = []
+        for _ in range(repeat):
+            t0 = time.perf_counter()
+            fn()
+            samples.append((time.perf_counter() - t0) * 1000)
+        return statistics.median(samples) if samples else 0.0
+
+    def _print_plan(self, name: str, fn):
+        from django.test.utils import CaptureQueriesContext
+
+        with CaptureQueriesContext(connection) as ctx:
+            fn()
+        self.stdout.write(self.style.MIGRATE_HEADING(name))
+        with connection.cursor() as cur:
+            for q in ctx.captured_queries:
+                sql = q["sql"]
+                if not sql.lstrip().upper().startswith(("SELECT", "WITH")):
+                    continue
+                cur.execute("EXPLAIN QUERY PLAN " + sql)
+                for row in cur.fetchall():
+                    self.stdout.write(f"    {row[-1]}")
+
+    def _report(self, title: str, results: dict):
+        self.stdout.write(self.style.MIGRATE_HEADING(title))
+        for name, ms in results.items():
+            self.stdout.write(f"  {name:<22} {ms:8.2f} ms")
@@ -0,0 +1,87 @@
+# pozicijos/management/commands/explain_list_queries.py
+import warnings
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.test import RequestFactory
+
+from pozicijos.models import Pozicija
+from pozicijos.schemas.columns import COLUMNS
+from pozicijos.services.listing import (
+    SORTABLE_FIELDS,
+    apply_filters,
+    apply_sorting,
+    DEFAULT_PAGE_SIZE,
+)
+
+
+# Pavyzdinės reikšmės kiekvienam filtro tipui (planas nuo reikšmės nepriklauso)
+SAMPLE_BY_FILTER = {
+    "text": "a",
+    "range": "1..10",
+    "date": "2025-01-01",
+}
+
+
+class Command(BaseCommand):
+    help = (
+        "Paleidžia EXPLAIN QUERY PLAN kiekvienai sąrašo filtro × rikiavimo porai "
+        "(tokiai, kokią siunčia list.html) ir parodo, kurios vis dar daro pilną "
+        "lentelės skenavimą (SCAN) arba rikiuoja per laikiną B-tree. Tik SQLite."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--all", action="store_true", help="Rodyti ir tvarkingas poras, ne tik problemas")
+        parser.add_argument("--plan", action="store_true", help="Išspausdinti pilną planą probleminėms poroms")
+
+    def handle(self, *args, **options):
+        if connection.vendor != "sqlite":
+            raise CommandError("EXPLAIN QUERY PLAN analizė palaikoma tik SQLite.")
+
+        rf = RequestFactory()
+        table = Pozicija._meta.db_table
+
+        filters: list[tuple[str, dict]] = [("—", {})]
+        filters.append(("q", {"q": "a"}))
+        for c in COLUMNS:
+            sample = SAMPLE_BY_FILTER.get(c.get("filter"))
+            if sample is not None:
+                filters.append((c["key"], {f"f[{c['key']}]": sample}))
+
+        sorts: list[tuple[str, dict]] = [("(default)", {})]
+        for key in SORTABLE_FIELDS:
+            for direction in ("asc", "desc"):
+                sorts.append((f"{key} {direction}", {"sort": key, "dir": direction}))
+
+        total = 0
+        problems = 0
+        for f_label, f_params in filters:
+            for s_label, s_params in sorts:
+                total += 1
+                request = rf.get("/", {**f_params, **s_params})
+                with warnings.catch_warnings():
+                    # date filtras ant DateTimeField -> "naive datetime" įspėjimas; planui nesvarbu
+                    warnings.simplefilter("ignore", RuntimeWarning)
+                    qs = apply_sorting(apply_filters(Pozicija.objects.all(), request), request)
+                    plan = qs[:DEFAULT_PAGE_SIZE].explain()
+
+                issues = []
+                for line in plan.splitlines():
+                    text = line.strip(" |-`")
+                    if text.startswith(f"SCAN {table}") and "USING" not in text:
+                        issues.append("full scan")
+                    if "TEMP B-TREE" in text:
+                        issues.append("temp b-tree sort")
+
+                if issues:
+                    problems += 1
+                    self.stdout.write(self.style.WARNING(
+                        f"[{', '.join(sorted(set(issues)))}] filtras={f_label}, sort={s_label}"
+                    ))
+                    if options["plan"]:
+                        self.stdout.write(plan)
+                elif options["all"]:
+                    self.stdout.write(self.style.SUCCESS(f"[OK] filtras={f_label}, sort={s_label}"))
+
+        style = self.style.SUCCESS if not problems else self.style.NOTICE
+        self.stdout.write(style(f"Patikrinta porų: {total}, su problemomis: {problems}"))
@@ -0,0 +1,45 @@
+# pozicijos/management/commands/kainu_galiojimas.py
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pozicijos.services.kainos import expire_and_promote
+
+
+class Command(BaseCommand):
+    help = (
+        "Suderina kainų eilučių būseną su galiojimo datomis: pasibaigusias aktualias "
+        "pasenina, laukiančias (galioja_nuo atėjo) aktyvuoja ir perskaičiuoja "
+        "paliestų pozicijų kaina_eur. Leisti kasdien po vidurnakčio (cron) arba su --every."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--date", help="Data YYYY-MM-DD (numatyta – šiandien)")
+        parser.add_argument("--dry-run", action="store_true", help="Nieko nerašyti, tik parodyti kiekius")
+        parser.add_argument(
+            "--every",
+            type=int,
+            default=0,
+            metavar="SEK",
+            help="Worker režimas: kartoti kas SEK sekundžių (0 – vieną kartą)",
+        )
+
+    def handle(self, *args, **options):
+        as_of = None
+        if options["date"]:
+            try:
+                as_of = date.fromisoformat(options["date"])
+            except ValueError:
+                raise CommandError("--date turi būti YYYY-MM-DD.")
+
+        while True:
+            res = expire_and_promote(as_of, dry_run=options["dry_run"])
+            prefix = "[DRY-RUN] " if options["dry_run"] else ""
+            self.stdout.write(self.style.SUCCESS(
+                f"{prefix}Pasenintos: {res.expired}, aktyvuotos: {res.promoted}, "
+                f"pakeistos naujomis: {res.superseded}, pozicijų: {len(res.pozicijos)}"
+            ))
+            if options["every"] <= 0:
+                break
+            time.sleep(options["every"])
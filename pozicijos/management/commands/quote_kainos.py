@@ -0,0 +1,70 @@
+# pozicijos/management/commands/quote_kainos.py
+import csv
+import json
+import sys
+import time
+from datetime import date
+
+from django.core.management.base import BaseCommand, CommandError
+
+from pozicijos.services.export import cell_text
+from pozicijos.services.quotes import QUOTE_RESULT_HEADER, QUOTE_RESULT_KEYS, parse_quote_input, price_quote_rows
+
+
+class Command(BaseCommand):
+    help = (
+        "Masinis įkainojimas: CSV/JSON su (poz_kodas, kiekis, matas) -> "
+        "CSV/JSON su kaina, kainos eilutės ID ir pagrindu (fixed / interval / fallback)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("input", help="Įvesties failas (CSV arba JSON); '-' – stdin")
+        parser.add_argument("--output", "-o", help="Išvesties failas (numatyta – stdout)")
+        parser.add_argument("--format", choices=["csv", "json"], default="csv")
+        parser.add_argument("--as-of", help="Kainų data YYYY-MM-DD (numatyta – šiandien)")
+
+    def handle(self, *args, **options):
+        if options["input"] == "-":
+            text = sys.stdin.read()
+        else:
+            try:
+                with open(options["input"], encoding="utf-8-sig") as fh:
+                    text = fh.read()
+            except OSError as e:
+                raise CommandError(f"Nepavyko atidaryti '{options['input']}': {e}")
+
+        as_of = None
+        if options["as_of"]:
+            try:
+                as_of = date.fromisoformat(options["as_of"])
+            except ValueError:
+                raise CommandError("--as-of turi būti YYYY-MM-DD.")
+
+        started = time.perf_counter()
+        parsed = parse_quote_input(text)
+        if parsed.input_error:
+            raise CommandError(parsed.input_error)
+        rows = list(price_quote_rows(parsed.rows, as_of=as_of))
+        elapsed = time.perf_counter() - started
+
+        out = open(options["output"], "w", encoding="utf-8", newline="") if options["output"] else self.stdout
+        try:
+            if options["format"] == "json":
+                json.dump([dict(zip(QUOTE_RESULT_KEYS, r)) for r in rows], out, default=str, ensure_ascii=False, indent=2)
+                out.write("\n")
+            else:
+                writer = csv.writer(out, delimiter=";")
+                writer.writerow(QUOTE_RESULT_HEADER)
+                for r in rows:
+                    writer.writerow([cell_text(v) for v in r])
+        finally:
+            if options["output"]:
+                out.close()
+
+        for e in parsed.errors:
+            self.stderr.write(self.style.WARNING(f"Eilutė {e.row_number}: {e.message}"))
+        priced = sum(1 for r in rows if r[7] is not None)
+        self.stderr.write(self.style.SUCCESS(
+            f"Eilučių: {len(rows)}, įkainota: {priced}, klaidų įvestyje: {len(parsed.errors)}, "
+            f"laikas: {elapsed:.3f} s"
+        ))
@@ -0,0 +1,33 @@
+# pozicijos/management/commands/rebuild_kainu_intervalai.py
+from django.core.management.base import BaseCommand
+
+from pozicijos.models import KainosIntervalas, Pozicija
+from pozicijos.services.price_snapshot import rebuild_snapshot
+
+
+class Command(BaseCommand):
+    help = (
+        "Perkuria išvestinę efektyvių kainų lentelę (KainosIntervalas) visoms "
+        "arba nurodytoms pozicijoms. Įprastai ji palaikoma automatiškai (signals)."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--pozicija", type=int, action="append", help="Tik ši pozicija (galima kartoti)")
+        parser.add_argument("--chunk-size", type=int, default=500)
+
+    def handle(self, *args, **options):
+        if options["pozicija"]:
+            ids = options["pozicija"]
+        else:
+            ids = list(Pozicija.objects.order_by("id").values_list("id", flat=True))
+
+        chunk = max(1, options["chunk_size"])
+        created = 0
+        for i in range(0, len(ids), chunk):
+            created += rebuild_snapshot(ids[i:i + chunk])
+            self.stdout.write(f"  {min(i + chunk, len(ids))}/{len(ids)} pozicijų", ending="\r")
+        self.stdout.write("")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Pozicijų: {len(ids)}, periodų: {created} (iš viso lentelėje: {KainosIntervalas.objects.count()})"
+        ))
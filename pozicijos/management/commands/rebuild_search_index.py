@@ -0,0 +1,26 @@
+# pozicijos/management/commands/rebuild_search_index.py
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+
+from pozicijos.services.search import FTS_TABLE, SEARCH_FIELDS, install_fts
+
+
+class Command(BaseCommand):
+    help = (
+        "Perkuria globalios paieškos FTS5 indeksą (SQLite) pagal COLUMNS searchable laukus. "
+        "Paleisti, jei pasikeitė searchable stulpeliai arba indeksas išsiderino."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--database", default=DEFAULT_DB_ALIAS, help="DB alias (default: default)")
+
+    def handle(self, *args, **options):
+        connection = connections[options["database"]]
+        if install_fts(connection):
+            self.stdout.write(
+                self.style.SUCCESS(f"{FTS_TABLE} perkurta: {', '.join(SEARCH_FIELDS)}")
+            )
+        else:
+            self.stdout.write(
+                self.style.WARNING("DB nepalaiko FTS5 – paieška naudos icontains.")
+            )
@@ -0,0 +1,37 @@
+# pozicijos/management/commands/recompute_kaina_eur.py
+from django.core.management.base import BaseCommand
+
+from pozicijos.services.kainos import RECOMPUTE_CHUNK_SIZE, recompute_kaina_eur
+
+
+class Command(BaseCommand):
+    help = (
+        "Perskaičiuoja Pozicija.kaina_eur pagal vieną headline taisyklę "
+        "(aktuali eilutė su kaina: mažiausias prioritetas, tada naujausia). "
+        "Su --verify tik parodo neatitikimus."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--verify", action="store_true", help="Nieko nerašyti, tik parodyti neatitikimus")
+        parser.add_argument("--chunk-size", type=int, default=RECOMPUTE_CHUNK_SIZE)
+        parser.add_argument("--pozicija", type=int, action="append", help="Tik ši pozicija (galima kartoti)")
+        parser.add_argument("--limit", type=int, default=50, help="Kiek neatitikimų išspausdinti")
+
+    def handle(self, *args, **options):
+        verify = options["verify"]
+        res = recompute_kaina_eur(
+            options["pozicija"],
+            verify=verify,
+            chunk_size=max(1, options["chunk_size"]),
+        )
+
+        for d in res.drift[: options["limit"]]:
+            self.stdout.write(f"  pozicija id={d.pozicija_id}: {d.old} -> {d.new}")
+        if len(res.drift) > options["limit"]:
+            self.stdout.write(f"  ... ir dar {len(res.drift) - options['limit']}")
+
+        if verify:
+            style = self.style.SUCCESS if not res.drift else self.style.WARNING
+            self.stdout.write(style(f"Patikrinta: {res.checked}, neatitinka: {len(res.drift)} (--verify, nieko neįrašyta)"))
+        else:
+            self.stdout.write(self.style.SUCCESS(f"Patikrinta: {res.checked}, atnaujinta: {res.updated}"))
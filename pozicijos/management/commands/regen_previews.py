@@ -1,35 +1,172 @@
 # pozicijos/management/commands/regen_previews.py
+import os
+import time
+from collections import Counter
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from pathlib import Path
+
 from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Q
+
 from pozicijos.models import PozicijosBrezinys
-from pozicijos.services.previews import regenerate_missing_preview
+from pozicijos.services.previews import (
+    PREVIEW_EXTS,
+    generate_preview_for_instance,
+    regenerate_missing_preview,
+)
+
+DEFAULT_CHECKPOINT = "regen_previews.checkpoint"
+
+
+def _init_worker():
+    # vaikiniame procese – savi DB prisijungimai (paveldėti iš tėvo nenaudotini)
+    import django
+
+    django.setup()
+    connections.close_all()
+
+
+def _process_chunk(ids, force):
+    """
+    Vieno gabalo apdorojimas (vykdoma worker procese).
+    Grąžina [(id, ok, message, source_bytes)].
+    """
+    out = []
+    for b in PozicijosBrezinys.objects.filter(pk__in=ids):
+        try:
+            size = b.failas.size
+        except Exception:
+            size = 0
+        try:
+            res = generate_preview_for_instance(b) if force else regenerate_missing_preview(b)
+            out.append((b.pk, res.ok, res.message, size))
+        except Exception as e:
+            out.append((b.pk, False, f"Klaida: {e}", size))
+    found = {row[0] for row in out}
+    out.extend((pk, False, "Brėžinys nerastas", 0) for pk in ids if pk not in found)
+    return out
+
+
+def _reason(message: str) -> str:
+    # "PDF preview klaida: <detalės>" -> "PDF preview klaida"
+    return (message or "Nežinoma").split(":", 1)[0].strip()
+
 
 class Command(BaseCommand):
-    help = "Sugeneruoja trūkstamas peržiūras (PNG) PDF/TIFF/kitų brėžinių failams."
+    help = (
+        "Sugeneruoja brėžinių peržiūras lygiagrečiai (--workers procesų, gabalais). "
+        "Be --force – tik trūkstamas, su --force – perkuria visas vietoje. "
+        "Pertrauktas paleidimas tęsiamas nuo checkpoint failo; nepavykę brėžiniai "
+        "tęsiant bandomi iš naujo (nebent --skip-failed)."
+    )
 
     def add_arguments(self, parser):
-        parser.add_argument("--all", action="store_true", help="Regeneruoti visiems (net jei jau yra)")
+        parser.add_argument(
+            "--force", "--all", dest="force", action="store_true",
+            help="Perkurti visas peržiūras (net jei jau yra)",
+        )
+        parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Procesų skaičius (1 – be pool'o)")
+        parser.add_argument("--chunk-size", type=int, default=20, help="Kiek brėžinių vienam worker'io gabalui")
+        parser.add_argument("--checkpoint", default=DEFAULT_CHECKPOINT, help="Apdorotų ID failas tęsimui")
+        parser.add_argument("--restart", action="store_true", help="Ignoruoti esamą checkpoint ir pradėti iš naujo")
+        parser.add_argument(
+            "--skip-failed", action="store_true",
+            help="Nepavykusius irgi įrašyti į checkpoint (tęsiant jų nebebandyti)",
+        )
+        parser.add_argument("--pozicija", type=int, action="append", help="Tik šios pozicijos brėžiniai (galima kartoti)")
+        parser.add_argument("--verbose-errors", action="store_true", help="Išspausdinti kiekvieną nepavykusį brėžinį")
 
     def handle(self, *args, **options):
-        total = 0
+        force = options["force"]
+        checkpoint = Path(options["checkpoint"])
+        if options["restart"] and checkpoint.exists():
+            checkpoint.unlink()
+
+        done_ids = set()
+        if checkpoint.exists():
+            done_ids = {int(x) for x in checkpoint.read_text().split() if x.isdigit()}
+            self.stdout.write(f"Tęsiama: {len(done_ids)} jau apdorota ({checkpoint})")
+
+        qs = PozicijosBrezinys.objects.order_by("id")
+        if options["pozicija"]:
+            qs = qs.filter(pozicija_id__in=options["pozicija"])
+        if not force:
+            # be miniatiūros arba su senu vieno PNG preview (be variantų)
+            qs = qs.filter(Q(preview__isnull=True) | Q(preview="") | Q(preview__endswith=".png"))
+
+        ids, unsupported = [], 0
+        for pk, name in qs.values_list("id", "failas").iterator():
+            if pk in done_ids:
+                continue
+            if os.path.splitext(name or "")[1].lower().lstrip(".") not in PREVIEW_EXTS:
+                unsupported += 1
+                continue
+            ids.append(pk)
+
+        self.stdout.write(
+            f"Apdorosim: {len(ids)} ({'visi' if force else 'trūkstami'}), "
+            f"be peržiūros formato: {unsupported}, workers: {options['workers']}"
+        )
+        if not ids:
+            if checkpoint.exists():
+                checkpoint.unlink()
+            return
+
+        chunk = max(1, options["chunk_size"])
+        chunks = [ids[i:i + chunk] for i in range(0, len(ids), chunk)]
+
         ok = 0
-        for b in PozicijosBrezinys.objects.all().iterator():
-            total += 1
-            if options.get("all"):
-                # jei --all, ignoruojam ar yra, tiesiog bandome generuoti
-                res = regenerate_missing_preview(b)  # šita gerbia „yra/nera“ – tada „force“ nebus
-                if not res.ok:
-                    # jei nori VISIŠKAI priverstinai, galima perrašyti _save_preview iš delete(), bet nebūtina
-                    self.stdout.write(self.style.WARNING(f"[SKIP] {b.id} {b.failas.name}: {res.message}"))
-                else:
-                    ok += 1
-                    self.stdout.write(self.style.SUCCESS(f"[OK] {b.id} {b.failas.name}"))
+        total_bytes = 0
+        failures = Counter()
+        started = time.perf_counter()
+
+        with checkpoint.open("a") as cp:
+            def record(results):
+                nonlocal ok, total_bytes
+                for pk, success, message, size in results:
+                    total_bytes += size
+                    if success:
+                        ok += 1
+                    else:
+                        failures[_reason(message)] += 1
+                        if options["verbose_errors"]:
+                            self.stdout.write(self.style.WARNING(f"[KLAIDA] {pk}: {message}"))
+                # nepavykę į checkpoint nepatenka -> tęsiant bandomi dar kartą
+                cp.write("".join(
+                    f"{row[0]}\n" for row in results if row[1] or options["skip_failed"]
+                ))
+                cp.flush()
+                processed = ok + sum(failures.values())
+                self.stdout.write(f"  {processed}/{len(ids)}", ending="\r")
+
+            if options["workers"] <= 1:
+                for c in chunks:
+                    record(_process_chunk(c, force))
             else:
-                # tik trūkstami
-                res = regenerate_missing_preview(b)
-                if not res.ok:
-                    self.stdout.write(self.style.WARNING(f"[MISS] {b.id} {b.failas.name}: {res.message}"))
-                else:
-                    ok += 1
-                    self.stdout.write(self.style.SUCCESS(f"[OK] {b.id} {b.failas.name}"))
-
-        self.stdout.write(self.style.SUCCESS(f"Baigta. Apdorota: {total}, sėkmingai: {ok}"))
+                # tėvo prisijungimai neturi patekti į fork'intus procesus
+                connections.close_all()
+                with ProcessPoolExecutor(max_workers=options["workers"], initializer=_init_worker) as pool:
+                    futures = [pool.submit(_process_chunk, c, force) for c in chunks]
+                    for fut in as_completed(futures):
+                        record(fut.result())
+
+        elapsed = max(time.perf_counter() - started, 1e-9)
+        failed = sum(failures.values())
+        if failed and not options["skip_failed"]:
+            # checkpoint paliekamas: kitas paleidimas (net su --force) kartos tik nepavykusius
+            self.stdout.write("")
+            self.stdout.write(self.style.NOTICE(
+                f"Checkpoint paliktas ({checkpoint}): {failed} nepavykę bus bandomi tęsiant"
+            ))
+        else:
+            checkpoint.unlink()
+
+        self.stdout.write("")
+        processed = ok + failed
+        self.stdout.write(self.style.SUCCESS(
+            f"Baigta. Apdorota: {processed}, sėkmingai: {ok}, nepavyko: {failed}; "
+            f"{elapsed:.1f} s, {processed / elapsed:.1f} failų/s, {total_bytes / elapsed / 1e6:.1f} MB/s"
+        ))
+        for reason, count in failures.most_common():
+            self.stdout.write(f"  {reason}: {count}")
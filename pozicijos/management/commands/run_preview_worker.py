@@ -0,0 +1,61 @@
+# pozicijos/management/commands/run_preview_worker.py
+import time
+
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+from pozicijos.services.preview_queue import (
+    DEFAULT_BATCH_SIZE,
+    WorkerStats,
+    process_batch,
+    requeue_stale,
+    worker_name,
+)
+
+
+class Command(BaseCommand):
+    help = (
+        "Vykdo miniatiūrų generavimo eilę (PreviewJob): ima laukiančias užduotis "
+        "partijomis, generuoja ir įrašo būseną. Be --once veikia nuolat. "
+        "Galima leisti kelis worker'ius vienu metu."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--once", action="store_true", help="Apdoroti eilę ir baigti")
+        parser.add_argument("--batch-size", type=int, default=DEFAULT_BATCH_SIZE)
+        parser.add_argument("--sleep", type=float, default=2.0, help="Pauzė sekundėmis, kai eilė tuščia")
+        parser.add_argument("--max-jobs", type=int, help="Baigti po tiek užduočių (pvz. atminties valymui)")
+
+    def handle(self, *args, **options):
+        name = worker_name()
+        batch = max(1, options["batch_size"])
+        max_jobs = options["max_jobs"]
+        total = WorkerStats()
+
+        self.stdout.write(f"Preview worker {name} paleistas")
+        try:
+            while True:
+                close_old_connections()
+                requeue_stale()
+                stats = process_batch(batch, name)
+                total.done += stats.done
+                total.failed += stats.failed
+                total.retried += stats.retried
+
+                handled = stats.done + stats.failed + stats.retried
+                if handled:
+                    self.stdout.write(
+                        f"  atlikta {stats.done}, klaidų {stats.failed}, kartojama {stats.retried}"
+                    )
+                if max_jobs is not None and total.done + total.failed >= max_jobs:
+                    break
+                if not handled:
+                    if options["once"]:
+                        break
+                    time.sleep(options["sleep"])
+        except KeyboardInterrupt:
+            self.stdout.write("Sustabdyta")
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Baigta. Atlikta: {total.done}, klaidų: {total.failed}, kartota: {total.retried}"
+        ))
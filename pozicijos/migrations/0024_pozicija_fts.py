@@ -0,0 +1,76 @@
+from django.db import migrations
+
+
+# Užfiksuota migracijos metu (COLUMNS searchable=True). Jei sąrašas keisis –
+# indeksą perkurti per `manage.py rebuild_search_index`.
+SEARCH_FIELDS = ["klientas", "projektas", "poz_kodas", "poz_pavad"]
+
+FTS_TABLE = "pozicijos_pozicija_fts"
+SOURCE_TABLE = "pozicijos_pozicija"
+
+# DDL įrašyta čia, o ne importuojama iš services/search.py – vėlesni serviso
+# pakeitimai neturi keisti jau pritaikytos migracijos.
+_COLS = ", ".join(SEARCH_FIELDS)
+_NEW = ", ".join(f"new.{f}" for f in SEARCH_FIELDS)
+_OLD = ", ".join(f"old.{f}" for f in SEARCH_FIELDS)
+
+CREATE_SQL = [
+    f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+    f"{_COLS}, content='{SOURCE_TABLE}', content_rowid='id', "
+    f"tokenize='unicode61 remove_diacritics 2', prefix='2 3')",
+    f"CREATE TRIGGER {FTS_TABLE}_ai AFTER INSERT ON {SOURCE_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_COLS}) VALUES (new.id, {_NEW}); END",
+    f"CREATE TRIGGER {FTS_TABLE}_ad AFTER DELETE ON {SOURCE_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_COLS}) VALUES ('delete', old.id, {_OLD}); END",
+    f"CREATE TRIGGER {FTS_TABLE}_au AFTER UPDATE OF {_COLS} ON {SOURCE_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_COLS}) VALUES ('delete', old.id, {_OLD}); "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_COLS}) VALUES (new.id, {_NEW}); END",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+DROP_SQL = [
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ai",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_ad",
+    f"DROP TRIGGER IF EXISTS {FTS_TABLE}_au",
+    f"DROP TABLE IF EXISTS {FTS_TABLE}",
+]
+
+
+def _fts5_supported(connection) -> bool:
+    if connection.vendor != "sqlite":
+        return False
+    with connection.cursor() as cur:
+        try:
+            cur.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+            cur.execute("DROP TABLE temp._fts5_probe")
+        except Exception:
+            return False
+    return True
+
+
+def create_fts(apps, schema_editor):
+    # ne SQLite / be FTS5 – nieko nedarom, paieška lieka icontains
+    if not _fts5_supported(schema_editor.connection):
+        return
+    with schema_editor.connection.cursor() as cur:
+        for sql in DROP_SQL + CREATE_SQL:
+            cur.execute(sql)
+
+
+def drop_fts(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    with schema_editor.connection.cursor() as cur:
+        for sql in DROP_SQL:
+            cur.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pozicijos", "0023_pozicija_paslaugu_pastabos"),
+    ]
+
+    operations = [
+        migrations.RunPython(create_fts, drop_fts),
+    ]
@@ -0,0 +1,55 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Skaitinės plotas/svoris/kiekis rėme kopijos. Esami įrašai užpildomi
+    0035_pozicija_numeric_backfill (arba: python manage.py backfill_skaitiniai).
+    """
+
+    dependencies = [
+        ("pozicijos", "0024_pozicija_fts"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pozicija",
+            name="plotas_num",
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=4, editable=False, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name="pozicija",
+            name="plotas_vnt",
+            field=models.CharField(blank=True, default="", editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name="pozicija",
+            name="svoris_num",
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=4, editable=False, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name="pozicija",
+            name="svoris_vnt",
+            field=models.CharField(blank=True, default="", editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name="pozicija",
+            name="detaliu_kiekis_reme_num",
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=4, editable=False, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name="pozicija",
+            name="detaliu_kiekis_reme_vnt",
+            field=models.CharField(blank=True, default="", editable=False, max_length=20),
+        ),
+        migrations.AddField(
+            model_name="pozicija",
+            name="faktinis_kiekis_reme_num",
+            field=models.DecimalField(blank=True, db_index=True, decimal_places=4, editable=False, max_digits=14, null=True),
+        ),
+        migrations.AddField(
+            model_name="pozicija",
+            name="faktinis_kiekis_reme_vnt",
+            field=models.CharField(blank=True, default="", editable=False, max_length=20),
+        ),
+    ]
@@ -0,0 +1,124 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Sąrašo indeksai pagal schemas/columns.py: (laukas, id) kiekvienam
+    filtruojamam / rikiuojamam stulpeliui. Pavieniai *_num indeksai
+    nebereikalingi – juos dengia sudėtiniai.
+    """
+
+    dependencies = [
+        ("pozicijos", "0025_pozicija_numeric_shadow"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="pozicija",
+            name="plotas_num",
+            field=models.DecimalField(blank=True, decimal_places=4, editable=False, max_digits=14, null=True),
+        ),
+        migrations.AlterField(
+            model_name="pozicija",
+            name="svoris_num",
+            field=models.DecimalField(blank=True, decimal_places=4, editable=False, max_digits=14, null=True),
+        ),
+        migrations.AlterField(
+            model_name="pozicija",
+            name="detaliu_kiekis_reme_num",
+            field=models.DecimalField(blank=True, decimal_places=4, editable=False, max_digits=14, null=True),
+        ),
+        migrations.AlterField(
+            model_name="pozicija",
+            name="faktinis_kiekis_reme_num",
+            field=models.DecimalField(blank=True, decimal_places=4, editable=False, max_digits=14, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["klientas", "id"], name="pz_klientas_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["projektas", "id"], name="pz_projektas_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["poz_kodas", "id"], name="pz_poz_kodas_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["poz_pavad", "id"], name="pz_poz_pavad_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["metalas", "id"], name="pz_metalas_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["plotas_num", "id"], name="pz_plotas_num_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["svoris_num", "id"], name="pz_svoris_num_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["kabinimo_budas", "id"], name="pz_kabinimo_budas_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["kabinimas_reme", "id"], name="pz_kabinimas_reme_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["detaliu_kiekis_reme_num", "id"], name="pz_detaliu_kiekis_reme_num_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["faktinis_kiekis_reme_num", "id"], name="pz_faktinis_kiekis_reme_nu_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["paruosimas", "id"], name="pz_paruosimas_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["padengimas", "id"], name="pz_padengimas_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["padengimo_standartas", "id"], name="pz_padengimo_standartas_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["spalva", "id"], name="pz_spalva_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["maskavimo_tipas", "id"], name="pz_maskavimo_tipas_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["testai_kokybe", "id"], name="pz_testai_kokybe_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["atlikimo_terminas", "id"], name="pz_atlikimo_terminas_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["pakavimo_tipas", "id"], name="pz_pakavimo_tipas_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["kaina_eur", "id"], name="pz_kaina_eur_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["created", "id"], name="pz_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="pozicija",
+            index=models.Index(fields=["updated", "id"], name="pz_updated_idx"),
+        ),
+    ]
@@ -0,0 +1,55 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Išvestinė efektyvių kainų lentelė (KainosIntervalas). Užpildymas:
+    manage.py rebuild_kainu_intervalai
+    """
+
+    dependencies = [
+        ("pozicijos", "0026_pozicija_list_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="KainosIntervalas",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("matas", models.CharField(blank=True, default="", max_length=50, verbose_name="Matas")),
+                ("yra_fiksuota", models.BooleanField(default=False, verbose_name="Fiksuota")),
+                ("kiekis_nuo", models.IntegerField(blank=True, null=True, verbose_name="Kiekis nuo")),
+                ("kiekis_iki", models.IntegerField(blank=True, null=True, verbose_name="Kiekis iki")),
+                ("galioja_nuo", models.DateField(verbose_name="Galioja nuo")),
+                ("galioja_iki", models.DateField(verbose_name="Galioja iki")),
+                ("kaina", models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name="Kaina")),
+                ("prioritetas", models.IntegerField(default=0, verbose_name="Prioritetas")),
+                (
+                    "kainos_eilute",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="+",
+                        to="pozicijos.kainoseilute",
+                    ),
+                ),
+                (
+                    "pozicija",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="kainu_intervalai",
+                        to="pozicijos.pozicija",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["pozicija", "matas", "galioja_nuo"],
+                "indexes": [
+                    models.Index(
+                        fields=["pozicija", "matas", "galioja_nuo", "galioja_iki"],
+                        name="pz_kint_poz_matas_idx",
+                    ),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,58 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    KainosEilute indeksai pagal kainų paieškos kelius: sąrašo rikiavimas,
+    set_aktuali grupės, kainų variklio / headline rikiavimas ir galiojimo job'as.
+    Daliniai (busena='aktuali' / 'laukianti') ten, kur DB juos palaiko.
+    """
+
+    dependencies = [
+        ("pozicijos", "0027_kainos_intervalas"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="kainoseilute",
+            index=models.Index(
+                fields=[
+                    "pozicija", "busena", "matas", "yra_fiksuota", "kiekis_nuo",
+                    "fiksuotas_kiekis", "prioritetas", "-created",
+                ],
+                name="pz_ke_list_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="kainoseilute",
+            index=models.Index(
+                fields=["pozicija", "matas", "-yra_fiksuota", "fiksuotas_kiekis", "kiekis_nuo", "kiekis_iki"],
+                name="pz_ke_akt_group_idx",
+                condition=models.Q(busena="aktuali"),
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="kainoseilute",
+            index=models.Index(
+                fields=["pozicija", "prioritetas", "-created", "-id"],
+                name="pz_ke_akt_prio_idx",
+                condition=models.Q(busena="aktuali"),
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="kainoseilute",
+            index=models.Index(
+                fields=["galioja_iki"],
+                name="pz_ke_akt_iki_idx",
+                condition=models.Q(busena="aktuali"),
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="kainoseilute",
+            index=models.Index(
+                fields=["galioja_nuo"],
+                name="pz_ke_lauk_nuo_idx",
+                condition=models.Q(busena="laukianti"),
+            ),
+        ),
+    ]
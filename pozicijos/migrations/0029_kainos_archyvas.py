@@ -0,0 +1,61 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Šaltas senų kainų eilučių archyvas (KainosEiluteArchyvas). KainosIntervalas
+    nuoroda į eilutę – be DB constraint'o, kad archyvuotų eilučių periodai išliktų.
+    Perkėlimas: manage.py archyvuoti_kainas
+    """
+
+    dependencies = [
+        ("pozicijos", "0028_kainoseilute_lookup_indexes"),
+    ]
+
+    operations = [
+        migrations.AlterField(
+            model_name="kainosintervalas",
+            name="kainos_eilute",
+            field=models.ForeignKey(
+                db_constraint=False,
+                on_delete=django.db.models.deletion.DO_NOTHING,
+                related_name="+",
+                to="pozicijos.kainoseilute",
+            ),
+        ),
+        migrations.CreateModel(
+            name="KainosEiluteArchyvas",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False, verbose_name="KainosEilute ID")),
+                ("kaina", models.DecimalField(blank=True, decimal_places=2, max_digits=12, null=True, verbose_name="Kaina")),
+                ("matas", models.CharField(blank=True, default="", max_length=50, verbose_name="Matas")),
+                ("yra_fiksuota", models.BooleanField(default=False, verbose_name="Fiksuota")),
+                ("fiksuotas_kiekis", models.IntegerField(blank=True, null=True, verbose_name="Fiksuotas kiekis")),
+                ("kiekis_nuo", models.IntegerField(blank=True, null=True, verbose_name="Kiekis nuo")),
+                ("kiekis_iki", models.IntegerField(blank=True, null=True, verbose_name="Kiekis iki")),
+                ("galioja_nuo", models.DateField(blank=True, null=True, verbose_name="Galioja nuo")),
+                ("galioja_iki", models.DateField(blank=True, null=True, verbose_name="Galioja iki")),
+                ("busena", models.CharField(blank=True, default="", max_length=50, verbose_name="Būsena")),
+                ("prioritetas", models.IntegerField(default=0, verbose_name="Prioritetas")),
+                ("pastaba", models.CharField(blank=True, default="", max_length=255, verbose_name="Pastaba")),
+                ("created", models.DateTimeField(verbose_name="Sukurta")),
+                ("updated", models.DateTimeField(verbose_name="Atnaujinta")),
+                ("archyvuota", models.DateTimeField(auto_now_add=True, verbose_name="Archyvuota")),
+                (
+                    "pozicija",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="kainos_archyvas",
+                        to="pozicijos.pozicija",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-created"],
+                "indexes": [
+                    models.Index(fields=["pozicija", "matas"], name="pz_ke_arch_poz_matas_idx"),
+                ],
+            },
+        ),
+    ]
@@ -0,0 +1,49 @@
+import django.db.models.deletion
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Miniatiūrų generavimo eilė (PreviewJob). Vykdymas: manage.py run_preview_worker
+    """
+
+    dependencies = [
+        ("pozicijos", "0029_kainos_archyvas"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="PreviewJob",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                (
+                    "busena",
+                    models.CharField(
+                        choices=[("laukia", "Laukia"), ("vykdoma", "Vykdoma"), ("atlikta", "Atlikta"), ("klaida", "Klaida")],
+                        default="laukia",
+                        max_length=20,
+                        verbose_name="Būsena",
+                    ),
+                ),
+                ("force", models.BooleanField(default=False, verbose_name="Perkurti esamą")),
+                ("bandymai", models.PositiveIntegerField(default=0, verbose_name="Bandymai")),
+                ("pranesimas", models.CharField(blank=True, default="", max_length=500, verbose_name="Pranešimas")),
+                ("worker", models.CharField(blank=True, default="", max_length=100, verbose_name="Worker")),
+                ("pradeta", models.DateTimeField(blank=True, null=True, verbose_name="Pradėta")),
+                ("created", models.DateTimeField(auto_now_add=True, verbose_name="Sukurta")),
+                ("updated", models.DateTimeField(auto_now=True, verbose_name="Atnaujinta")),
+                (
+                    "brezinys",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="preview_job",
+                        to="pozicijos.pozicijosbrezinys",
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["created"],
+                "indexes": [models.Index(fields=["busena", "created"], name="pz_prevjob_busena_idx")],
+            },
+        ),
+    ]
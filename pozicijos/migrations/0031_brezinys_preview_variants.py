@@ -0,0 +1,31 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Miniatiūrų dydžių variantai (WebP + JPEG). Esamoms PNG miniatiūroms:
+    manage.py regen_previews (trūkstami variantai) arba --force.
+    """
+
+    dependencies = [
+        ("pozicijos", "0030_preview_job"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="pozicijosbrezinys",
+            name="preview_variants",
+            field=models.JSONField(blank=True, default=list, editable=False, verbose_name="Miniatiūrų variantai"),
+        ),
+        migrations.AlterField(
+            model_name="pozicijosbrezinys",
+            name="preview",
+            field=models.ImageField(
+                blank=True,
+                help_text="Automatiškai sugeneruota miniatiūra (didžiausias JPEG variantas).",
+                null=True,
+                upload_to="pozicijos/breziniai/previews/",
+                verbose_name="Miniatiūra",
+            ),
+        ),
+    ]
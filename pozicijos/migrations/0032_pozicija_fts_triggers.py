@@ -0,0 +1,50 @@
+from django.db import migrations
+
+
+# 0025 / 0026 perkuria pozicijos_pozicija (SQLite schema editor: nauja lentelė +
+# kopija + RENAME), o kartu tyliai numeta 0024 FTS trigger'ius. Čia jie
+# grąžinami ir indeksas perstatomas. Vėliau panašiai numestus trigger'ius
+# atstato post_migrate (services/search.ensure_fts_triggers).
+
+SEARCH_FIELDS = ["klientas", "projektas", "poz_kodas", "poz_pavad"]
+
+FTS_TABLE = "pozicijos_pozicija_fts"
+SOURCE_TABLE = "pozicijos_pozicija"
+
+_COLS = ", ".join(SEARCH_FIELDS)
+_NEW = ", ".join(f"new.{f}" for f in SEARCH_FIELDS)
+_OLD = ", ".join(f"old.{f}" for f in SEARCH_FIELDS)
+
+TRIGGER_SQL = [
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {SOURCE_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_COLS}) VALUES (new.id, {_NEW}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {SOURCE_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_COLS}) VALUES ('delete', old.id, {_OLD}); END",
+    f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {_COLS} ON {SOURCE_TABLE} BEGIN "
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {_COLS}) VALUES ('delete', old.id, {_OLD}); "
+    f"INSERT INTO {FTS_TABLE}(rowid, {_COLS}) VALUES (new.id, {_NEW}); END",
+    f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')",
+]
+
+
+def restore_triggers(apps, schema_editor):
+    connection = schema_editor.connection
+    if connection.vendor != "sqlite":
+        return
+    with connection.cursor() as cur:
+        cur.execute("SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = %s", (FTS_TABLE,))
+        if cur.fetchone() is None:
+            return  # FTS5 nebuvo sukurta (nepalaikoma) – nieko netaisom
+        for sql in TRIGGER_SQL:
+            cur.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pozicijos", "0031_brezinys_preview_variants"),
+    ]
+
+    operations = [
+        migrations.RunPython(restore_triggers, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,28 @@
+from django.db import migrations
+
+
+class Migration(migrations.Migration):
+    """
+    Tekstinių stulpelių (laukas, id) indeksai iš 0026 nereikalingi: tekstiniai
+    filtrai yra icontains (LIKE '%…%'), B-tree jiems netinka, o šie stulpeliai
+    retai rikiuojami. Lieka range/date (*_num, kaina_eur, datos) ir index=True
+    stulpeliai (klientas, projektas, poz_kodas) – žr. schemas/columns.py.
+    """
+
+    dependencies = [
+        ("pozicijos", "0032_pozicija_fts_triggers"),
+    ]
+
+    operations = [
+        migrations.RemoveIndex(model_name="pozicija", name="pz_poz_pavad_idx"),
+        migrations.RemoveIndex(model_name="pozicija", name="pz_metalas_idx"),
+        migrations.RemoveIndex(model_name="pozicija", name="pz_kabinimo_budas_idx"),
+        migrations.RemoveIndex(model_name="pozicija", name="pz_kabinimas_reme_idx"),
+        migrations.RemoveIndex(model_name="pozicija", name="pz_paruosimas_idx"),
+        migrations.RemoveIndex(model_name="pozicija", name="pz_padengimas_idx"),
+        migrations.RemoveIndex(model_name="pozicija", name="pz_padengimo_standartas_idx"),
+        migrations.RemoveIndex(model_name="pozicija", name="pz_spalva_idx"),
+        migrations.RemoveIndex(model_name="pozicija", name="pz_maskavimo_tipas_idx"),
+        migrations.RemoveIndex(model_name="pozicija", name="pz_testai_kokybe_idx"),
+        migrations.RemoveIndex(model_name="pozicija", name="pz_pakavimo_tipas_idx"),
+    ]
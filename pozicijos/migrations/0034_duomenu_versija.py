@@ -0,0 +1,22 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+    """
+    Bendri kešų versijų skaitliukai (sąrašo fragmentai, kainų variklis):
+    anksčiau laikyti numatytame LocMemCache, kurio kiti procesai nemato.
+    """
+
+    dependencies = [
+        ("pozicijos", "0033_pozicija_drop_text_indexes"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DuomenuVersija",
+            fields=[
+                ("raktas", models.CharField(max_length=50, primary_key=True, serialize=False, verbose_name="Raktas")),
+                ("versija", models.PositiveBigIntegerField(default=1, verbose_name="Versija")),
+            ],
+        ),
+    ]
@@ -0,0 +1,56 @@
+from django.db import migrations
+from django.db.models import F
+
+from pozicijos.services.measures import SHADOW_NUMERIC_FIELDS, parse_measure
+
+
+CHUNK_SIZE = 1000
+
+
+def backfill_numeric(apps, schema_editor):
+    """
+    0025 pridėjo *_num / *_vnt stulpelius tuščius – be šito range filtrai ir
+    skaitinis rikiavimas esamiems įrašams neveiktų, kol kas nors paleis
+    backfill_skaitiniai. Perskaičiuojami visi įrašai (ir parse_measure
+    pakeitimai: intervalai / sandaugos dabar -> NULL).
+    """
+    Pozicija = apps.get_model("pozicijos", "Pozicija")
+    DuomenuVersija = apps.get_model("pozicijos", "DuomenuVersija")
+
+    shadow_fields = [f for pair in SHADOW_NUMERIC_FIELDS.values() for f in pair]
+    qs = Pozicija.objects.only("id", *SHADOW_NUMERIC_FIELDS, *shadow_fields).order_by("id")
+
+    batch = []
+    changed = 0
+    for poz in qs.iterator(chunk_size=CHUNK_SIZE):
+        dirty = False
+        for src, (num_field, unit_field) in SHADOW_NUMERIC_FIELDS.items():
+            value, unit = parse_measure(getattr(poz, src))
+            if getattr(poz, num_field) != value or getattr(poz, unit_field) != unit:
+                setattr(poz, num_field, value)
+                setattr(poz, unit_field, unit)
+                dirty = True
+        if dirty:
+            batch.append(poz)
+        if len(batch) >= CHUNK_SIZE:
+            Pozicija.objects.bulk_update(batch, shadow_fields)
+            changed += len(batch)
+            batch = []
+    if batch:
+        Pozicija.objects.bulk_update(batch, shadow_fields)
+        changed += len(batch)
+
+    # sąrašo fragmentų kešas (services/list_cache) – kad nebūtų rodomi seni *_num filtrai
+    if changed:
+        DuomenuVersija.objects.filter(raktas="sarasas").update(versija=F("versija") + 1)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("pozicijos", "0034_duomenu_versija"),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_numeric, migrations.RunPython.noop),
+    ]
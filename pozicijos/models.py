@@ -1,10 +1,19 @@
 from __future__ import annotations
 
 import os
+from typing import Optional
 
 from django.db import models
 from simple_history.models import HistoricalRecords
 
+from .schemas.columns import indexed_fields
+from .services.measures import SHADOW_NUMERIC_FIELDS, fill_shadow_fields
+
+
+def _list_index_name(field: str) -> str:
+    # Django riba – 30 simbolių
+    return f"pz_{field}"[:26] + "_idx"
+
 
 class Pozicija(models.Model):
     MASKAVIMO_TIPAS_CHOICES = [
@@ -107,17 +116,48 @@ class Pozicija(models.Model):
 
     pastabos = models.TextField("Pastabos", blank=True, default="")
 
+    # Skaitinės tekstinių laukų kopijos (pildomos save() metu, žr. services/measures.py).
+    # Naudojamos range filtrams ir rikiavimui; UI jų neredaguoja. Indeksai – Meta.indexes.
+    plotas_num = models.DecimalField(max_digits=14, decimal_places=4, null=True, blank=True, editable=False)
+    plotas_vnt = models.CharField(max_length=20, blank=True, default="", editable=False)
+    svoris_num = models.DecimalField(max_digits=14, decimal_places=4, null=True, blank=True, editable=False)
+    svoris_vnt = models.CharField(max_length=20, blank=True, default="", editable=False)
+    detaliu_kiekis_reme_num = models.DecimalField(max_digits=14, decimal_places=4, null=True, blank=True, editable=False)
+    detaliu_kiekis_reme_vnt = models.CharField(max_length=20, blank=True, default="", editable=False)
+    faktinis_kiekis_reme_num = models.DecimalField(max_digits=14, decimal_places=4, null=True, blank=True, editable=False)
+    faktinis_kiekis_reme_vnt = models.CharField(max_length=20, blank=True, default="", editable=False)
+
     created = models.DateTimeField("Sukurta", auto_now_add=True)
     updated = models.DateTimeField("Atnaujinta", auto_now=True)
 
-    history = HistoricalRecords()
+    # šešėliniai laukai išvedami iš tekstinių – istorijoje jų nekartojam
+    history = HistoricalRecords(
+        excluded_fields=[f for pair in SHADOW_NUMERIC_FIELDS.values() for f in pair],
+    )
 
     class Meta:
         ordering = ["-created"]
+        # (laukas, id) range/date ir index=True sąrašo stulpeliams
+        # (schemas/columns.py indexed_fields). Patikra: manage.py explain_list_queries
+        indexes = [
+            models.Index(fields=[f, "id"], name=_list_index_name(f))
+            for f in indexed_fields()
+        ]
 
     def __str__(self):
         return f"{self.poz_kodas or self.id} — {self.poz_pavad}".strip()
 
+    def save(self, *args, **kwargs):
+        update_fields = kwargs.get("update_fields")
+        if update_fields is None:
+            fill_shadow_fields(self)
+        else:
+            # pvz. save(update_fields=["kaina_eur", "updated"]) – šešėlinių neliečiam
+            changed = fill_shadow_fields(self, fields=set(update_fields))
+            if changed:
+                kwargs["update_fields"] = list(update_fields) + changed
+        super().save(*args, **kwargs)
+
     # ---- Kainos API (naudojama views) ----
     def aktualios_kainos(self):
         qs = self.kainos_eilutes.all()
@@ -131,39 +171,19 @@ class Pozicija(models.Model):
             qs = qs.order_by(*order_fields)
         return qs
 
-    def get_kaina_for_qty(self, qty):
+    def get_kaina_for_qty(self, qty, matas=None, as_of=None):
+        """
+        AKTUALI kaina kiekiui nurodytame mate (numatyta – DEFAULT_MATAS):
+        fiksuota -> intervalinė -> pirma kaina su reikšme. Taisyklės – services/pricing.py
+        (senos eilutės ir kiti matai nebežiūrimi). Daugeliui pozicijų iškart – quote_many().
+        """
+        from .services.pricing import DEFAULT_MATAS, quote
+
         try:
             q = int(qty) if qty is not None else None
         except (TypeError, ValueError):
             q = None
-
-        lines = list(self.aktualios_kainos())
-
-        if q is not None:
-            for l in lines:
-                if getattr(l, "yra_fiksuota", False) and getattr(l, "fiksuotas_kiekis", None) == q:
-                    return getattr(l, "kaina", None)
-
-        if q is not None:
-            for l in lines:
-                kn = getattr(l, "kiekis_nuo", None)
-                kk = getattr(l, "kiekis_iki", None)
-                if kn is None and kk is None:
-                    continue
-                if kn is None:
-                    ok = q <= kk
-                elif kk is None:
-                    ok = q >= kn
-                else:
-                    ok = (kn <= q <= kk)
-                if ok:
-                    return getattr(l, "kaina", None)
-
-        for l in lines:
-            k = getattr(l, "kaina", None)
-            if k is not None:
-                return k
-        return None
+        return quote(self.pk, q, matas or DEFAULT_MATAS, as_of).kaina
 
 
 class PozicijosBrezinys(models.Model):
@@ -177,8 +197,11 @@ class PozicijosBrezinys(models.Model):
         upload_to="pozicijos/breziniai/previews/",
         null=True,
         blank=True,
-        help_text="Automatiškai sugeneruota PNG miniatiūra.",
+        help_text="Automatiškai sugeneruota miniatiūra (didžiausias JPEG variantas).",
     )
+    # Dydžių variantai (services/previews.py): [{"w": 1000, "h": 750, "webp": "...", "jpg": "..."}, ...],
+    # nuo didžiausio iki mažiausio; keliai – storage'o vardai
+    preview_variants = models.JSONField("Miniatiūrų variantai", default=list, blank=True, editable=False)
 
     class Meta:
         ordering = ["-uploaded"]
@@ -209,6 +232,38 @@ class PozicijosBrezinys(models.Model):
                 return ""
         return ""
 
+    def _preview_relpath(self, width: Optional[int] = None, ext: str = "png") -> str:
+        """
+        Miniatiūros kelias storage'e: previews/<vardas>_<id>[_<plotis>].<ext>
+        (id – kad vienodi vardai nesusidurtų). Be width – senas vieno PNG kelias.
+        """
+        stem = os.path.splitext(os.path.basename(getattr(self.failas, "name", "") or ""))[0]
+        if not stem or not self.pk:
+            return ""
+        suffix = f"_{width}" if width else ""
+        return f"pozicijos/breziniai/previews/{stem}_{self.pk}{suffix}.{ext}"
+
+    def preview_paths(self) -> set:
+        """Visi šio brėžinio miniatiūrų failai (variantai, preview, senas PNG)."""
+        paths = {v.get(k) for v in self.preview_variants or [] for k in ("webp", "jpg")}
+        paths.add(self.preview.name if self.preview else None)
+        paths.add(self._preview_relpath())
+        return {p for p in paths if p}
+
+    def _srcset(self, key: str) -> str:
+        storage = self.preview.storage
+        return ", ".join(
+            f"{storage.url(v[key])} {v['w']}w" for v in reversed(self.preview_variants or []) if v.get(key)
+        )
+
+    @property
+    def webp_srcset(self) -> str:
+        return self._srcset("webp")
+
+    @property
+    def jpeg_srcset(self) -> str:
+        return self._srcset("jpg")
+
 
 class KainosEilute(models.Model):
     pozicija = models.ForeignKey(Pozicija, on_delete=models.CASCADE, related_name="kainos_eilutes")
@@ -225,6 +280,12 @@ class KainosEilute(models.Model):
     galioja_nuo = models.DateField("Galioja nuo", null=True, blank=True)
     galioja_iki = models.DateField("Galioja iki", null=True, blank=True)
 
+    # Būsenos:
+    #  - 'aktuali'   – galioja dabar (šiandienos skaitymo keliai filtruoja tik pagal ją);
+    #  - 'laukianti' – aktyvuota, bet galioja_nuo dar ateityje (UI rodoma kaip Aktuali);
+    #                  'aktuali' tampa per manage.py kainu_galiojimas tą dieną;
+    #  - 'sena'      – pasibaigusi arba pakeista nauja (UI – Neaktuali).
+    # Datos į būseną suvedamos tik kainu_galiojimas – jį leisti kasdien (cron / --every).
     busena = models.CharField("Būsena", max_length=50, blank=True, default="")
     prioritetas = models.IntegerField("Prioritetas", default=0)
     pastaba = models.CharField("Pastaba", max_length=255, blank=True, default="")
@@ -236,6 +297,180 @@ class KainosEilute(models.Model):
 
     class Meta:
         ordering = ["-created"]
+        # Pagal kainų paieškos kelius (services/kainos.py, services/pricing.py, kainos_views).
+        # Daliniai indeksai (busena='aktuali') – tik gyvoms eilutėms, todėl jų dydis
+        # nepriklauso nuo susikaupusių senų eilučių; DB be dalinių indeksų juos praleidžia.
+        indexes = [
+            # kainos_list (su busena filtru) / aktualios_kainos: ta pati 6 stulpelių tvarka be rikiavimo
+            models.Index(
+                fields=[
+                    "pozicija", "busena", "matas", "yra_fiksuota", "kiekis_nuo", "fiksuotas_kiekis",
+                    "prioritetas", "-created",
+                ],
+                name="pz_ke_list_idx",
+            ),
+            # set_aktuali grupės (matas, fiksuota, kiekis / intervalas) ir price_audit rikiavimas
+            models.Index(
+                fields=["pozicija", "matas", "-yra_fiksuota", "fiksuotas_kiekis", "kiekis_nuo", "kiekis_iki"],
+                name="pz_ke_akt_group_idx",
+                condition=models.Q(busena="aktuali"),
+            ),
+            # pricing.fetch_compiled / headline_kainos: prioritetas, naujausia
+            models.Index(
+                fields=["pozicija", "prioritetas", "-created", "-id"],
+                name="pz_ke_akt_prio_idx",
+                condition=models.Q(busena="aktuali"),
+            ),
+            # kainu_galiojimas: pasibaigusios aktualios / prasidėjusios laukiančios
+            models.Index(
+                fields=["galioja_iki"],
+                name="pz_ke_akt_iki_idx",
+                condition=models.Q(busena="aktuali"),
+            ),
+            models.Index(
+                fields=["galioja_nuo"],
+                name="pz_ke_lauk_nuo_idx",
+                condition=models.Q(busena="laukianti"),
+            ),
+        ]
 
     def __str__(self):
         return f"{self.pozicija_id} | {self.kaina} {self.matas}".strip()
+
+
+class KainosIntervalas(models.Model):
+    """
+    Išvestinė lentelė (services/price_snapshot.py): kokia kaina galiojo kuriuo
+    laikotarpiu – viena eilutė pozicijai × matui × kiekio juostai × periodui.
+    Periodai vienoje juostoje nepersidengia; atviri galai – date.min / date.max,
+    todėl "kaina datai D" = vienas indeksuotas range scan be NULL logikos.
+    Ranka neredaguojama – perkuriama pasikeitus KainosEilute.
+    """
+
+    pozicija = models.ForeignKey(Pozicija, on_delete=models.CASCADE, related_name="kainu_intervalai")
+    # be DB constraint'o: eilutė gali būti perkelta į KainosEiluteArchyvas (tas pats id),
+    # o jos periodai lieka galioti ataskaitoms datai
+    kainos_eilute = models.ForeignKey(
+        KainosEilute, on_delete=models.DO_NOTHING, db_constraint=False, related_name="+"
+    )
+
+    matas = models.CharField("Matas", max_length=50, blank=True, default="")
+    yra_fiksuota = models.BooleanField("Fiksuota", default=False)
+    kiekis_nuo = models.IntegerField("Kiekis nuo", null=True, blank=True)
+    kiekis_iki = models.IntegerField("Kiekis iki", null=True, blank=True)
+
+    galioja_nuo = models.DateField("Galioja nuo")
+    galioja_iki = models.DateField("Galioja iki")
+
+    kaina = models.DecimalField("Kaina", max_digits=12, decimal_places=2, null=True, blank=True)
+    prioritetas = models.IntegerField("Prioritetas", default=0)
+
+    class Meta:
+        ordering = ["pozicija", "matas", "galioja_nuo"]
+        indexes = [
+            models.Index(
+                fields=["pozicija", "matas", "galioja_nuo", "galioja_iki"],
+                name="pz_kint_poz_matas_idx",
+            ),
+        ]
+
+    def __str__(self):
+        return f"{self.pozicija_id} | {self.kaina} {self.matas} {self.galioja_nuo}..{self.galioja_iki}"
+
+
+class KainosEiluteArchyvas(models.Model):
+    """
+    Šalta senų ('sena') kainų eilučių saugykla (services/price_archive.py,
+    manage.py archyvuoti_kainas). id – tas pats, koks buvo KainosEilute, todėl
+    istorija (KainosEilute.history) ir KainosIntervalas nuorodos lieka galioti.
+    """
+
+    id = models.BigIntegerField("KainosEilute ID", primary_key=True)
+    pozicija = models.ForeignKey(Pozicija, on_delete=models.CASCADE, related_name="kainos_archyvas")
+
+    kaina = models.DecimalField("Kaina", max_digits=12, decimal_places=2, null=True, blank=True)
+    matas = models.CharField("Matas", max_length=50, blank=True, default="")
+
+    yra_fiksuota = models.BooleanField("Fiksuota", default=False)
+    fiksuotas_kiekis = models.IntegerField("Fiksuotas kiekis", null=True, blank=True)
+
+    kiekis_nuo = models.IntegerField("Kiekis nuo", null=True, blank=True)
+    kiekis_iki = models.IntegerField("Kiekis iki", null=True, blank=True)
+
+    galioja_nuo = models.DateField("Galioja nuo", null=True, blank=True)
+    galioja_iki = models.DateField("Galioja iki", null=True, blank=True)
+
+    busena = models.CharField("Būsena", max_length=50, blank=True, default="")
+    prioritetas = models.IntegerField("Prioritetas", default=0)
+    pastaba = models.CharField("Pastaba", max_length=255, blank=True, default="")
+
+    created = models.DateTimeField("Sukurta")
+    updated = models.DateTimeField("Atnaujinta")
+    archyvuota = models.DateTimeField("Archyvuota", auto_now_add=True)
+
+    class Meta:
+        ordering = ["-created"]
+        indexes = [
+            models.Index(fields=["pozicija", "matas"], name="pz_ke_arch_poz_matas_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.pozicija_id} | {self.kaina} {self.matas} (archyvas)".strip()
+
+
+class PreviewJob(models.Model):
+    """
+    Miniatiūros generavimo užduotis (DB eilė, be išorinio broker'io).
+    Viena eilutė brėžiniui – pakartotinis įtraukimas tik grąžina ją į 'laukia'.
+    Vykdo manage.py run_preview_worker (services/preview_queue.py).
+    """
+
+    LAUKIA = "laukia"
+    VYKDOMA = "vykdoma"
+    ATLIKTA = "atlikta"
+    KLAIDA = "klaida"
+    BUSENOS = [
+        (LAUKIA, "Laukia"),
+        (VYKDOMA, "Vykdoma"),
+        (ATLIKTA, "Atlikta"),
+        (KLAIDA, "Klaida"),
+    ]
+
+    brezinys = models.OneToOneField(PozicijosBrezinys, on_delete=models.CASCADE, related_name="preview_job")
+    busena = models.CharField("Būsena", max_length=20, choices=BUSENOS, default=LAUKIA)
+    force = models.BooleanField("Perkurti esamą", default=False)
+    bandymai = models.PositiveIntegerField("Bandymai", default=0)
+    pranesimas = models.CharField("Pranešimas", max_length=500, blank=True, default="")
+    worker = models.CharField("Worker", max_length=100, blank=True, default="")
+    pradeta = models.DateTimeField("Pradėta", null=True, blank=True)
+
+    created = models.DateTimeField("Sukurta", auto_now_add=True)
+    updated = models.DateTimeField("Atnaujinta", auto_now=True)
+
+    class Meta:
+        ordering = ["created"]
+        indexes = [
+            models.Index(fields=["busena", "created"], name="pz_prevjob_busena_idx"),
+        ]
+
+    def __str__(self):
+        return f"{self.brezinys_id} | {self.busena}"
+
+    @property
+    def is_pending(self) -> bool:
+        return self.busena in (self.LAUKIA, self.VYKDOMA)
+
+
+class DuomenuVersija(models.Model):
+    """
+    Kešų versijų skaitliukai, bendri visiems procesams (gunicorn worker'iams,
+    management komandoms). Didinami toje pačioje transakcijoje kaip ir
+    pakeisti duomenys, todėl kitas procesas naują versiją mato kartu su jais.
+    Naudojimas – services/versions.py.
+    """
+
+    raktas = models.CharField("Raktas", max_length=50, primary_key=True)
+    versija = models.PositiveBigIntegerField("Versija", default=1)
+
+    def __str__(self):
+        return f"{self.raktas}: {self.versija}"
@@ -21,6 +21,7 @@ from reportlab.pdfgen import canvas
 from reportlab.platypus import Table, TableStyle
 
 from .models import Pozicija
+from .services.measures import SHADOW_NUMERIC_FIELDS
 
 
 def _get_lang(request) -> str:
@@ -182,6 +183,7 @@ def _build_field_rows(pozicija: Pozicija, lang: str) -> list[tuple[str, str]]:
     rows: list[tuple[str, str]] = []
 
     skip = {"id", "created", "updated", "atlikimo_terminas_data"}
+    skip |= {f for pair in SHADOW_NUMERIC_FIELDS.values() for f in pair}
     labels_map = FIELD_LABELS.get(lang, FIELD_LABELS["lt"])
 
     for field in pozicija._meta.fields:
@@ -3,11 +3,16 @@ Visų pozicijų sąrašo stulpelių schema.
 
 - key:    modelio laukas arba property
 - label:  stulpelio pavadinimas
-- type:   "char" | "number" | "date" | "virtual"
+- type:   "char" | "number" | "date" | "virtual" (skaičiuojamas anotacija, žr. services/listing.py)
 - filter: "text" | "range" | "date" | None
 - searchable: ar dalyvauja globalioje q paieškoje
 - width:  numanomam stulpelio pločiui (px)
 - default: ar rodomas pagal nutylėjimą
+- order_field / filter_field: DB laukas rikiavimui / filtrui, jei ne key
+  (pvz. tekstinis "plotas" -> skaitinis "plotas_num")
+- index:  True – (laukas, id) indeksas ir tekstiniam stulpeliui (dažnas rikiavimas).
+          Tekstiniai filtrai yra icontains (LIKE '%…%') ir B-tree nenaudoja, todėl
+          be index=True indeksuojami tik range/date stulpeliai; False – niekada.
 """
 
 COLUMNS: list[dict] = [
@@ -20,6 +25,7 @@ COLUMNS: list[dict] = [
         "searchable": True,
         "width": 180,
         "default": True,
+        "index": True,
     },
     {
         "key": "projektas",
@@ -29,6 +35,7 @@ COLUMNS: list[dict] = [
         "searchable": True,
         "width": 160,
         "default": True,
+        "index": True,
     },
     {
         "key": "poz_kodas",
@@ -38,6 +45,7 @@ COLUMNS: list[dict] = [
         "searchable": True,
         "width": 150,
         "default": True,
+        "index": True,
     },
     {
         "key": "poz_pavad",
@@ -68,6 +76,8 @@ COLUMNS: list[dict] = [
         "width": 90,
         "default": False,
         "align": "right",
+        "order_field": "plotas_num",
+        "filter_field": "plotas_num",
     },
     {
         "key": "svoris",
@@ -78,6 +88,8 @@ COLUMNS: list[dict] = [
         "width": 90,
         "default": False,
         "align": "right",
+        "order_field": "svoris_num",
+        "filter_field": "svoris_num",
     },
 
     # ---------------- Kabinimas ----------------
@@ -108,6 +120,8 @@ COLUMNS: list[dict] = [
         "width": 110,
         "default": False,
         "align": "right",
+        "order_field": "detaliu_kiekis_reme_num",
+        "filter_field": "detaliu_kiekis_reme_num",
     },
     {
         "key": "faktinis_kiekis_reme",
@@ -118,6 +132,8 @@ COLUMNS: list[dict] = [
         "width": 120,
         "default": False,
         "align": "right",
+        "order_field": "faktinis_kiekis_reme_num",
+        "filter_field": "faktinis_kiekis_reme_num",
     },
 
     # ---------------- Paslauga (paviršius / dažymas) ----------------
@@ -221,6 +237,7 @@ COLUMNS: list[dict] = [
         "searchable": False,
         "width": 260,
         "default": False,
+        "index": False,
     },
 
     # ---------------- Sisteminiai ----------------
@@ -248,18 +265,39 @@ COLUMNS: list[dict] = [
         "key": "brez_count",
         "label": "Brėžiniai",
         "type": "virtual",
-        "filter": None,
+        "filter": "range",
         "searchable": False,
         "width": 90,
         "default": False,
+        "align": "right",
     },
     {
         "key": "dok_count",
         "label": "Dokumentai",
         "type": "virtual",
-        "filter": None,
+        "filter": "range",
         "searchable": False,
         "width": 100,
         "default": False,
+        "align": "right",
     },
 ]
+
+
+def indexed_fields() -> list[str]:
+    """
+    DB laukai, kuriems Pozicija.Meta.indexes kuria (laukas, id) indeksus:
+    range/date stulpeliai (filtras ir rikiavimas naudoja indeksą) ir tekstiniai
+    su index=True (tik rikiavimui / keyset). (laukas, id) tinka ir filtrui,
+    ir keyset rikiavimui abiem kryptimis. Patikra: manage.py explain_list_queries.
+    """
+    out: list[str] = []
+    for c in COLUMNS:
+        if c.get("type") == "virtual" or c.get("index") is False:
+            continue
+        if c.get("filter") not in ("range", "date") and not c.get("index"):
+            continue
+        for name in (c.get("order_field", c["key"]), c.get("filter_field", c["key"])):
+            if name not in out:
+                out.append(name)
+    return out
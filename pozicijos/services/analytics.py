@@ -0,0 +1,287 @@
+# pozicijos/services/analytics.py
+from __future__ import annotations
+
+import math
+from array import array
+from dataclasses import dataclass, field
+from itertools import islice
+from typing import Callable, Dict, Iterable, List, Optional, Sequence
+
+from django.db.models import FloatField, Q, QuerySet
+from django.db.models.functions import Cast
+from django.utils import timezone
+
+try:
+    import numpy as np
+except Exception:
+    np = None
+
+from ..models import KainosEilute, KainosEiluteArchyvas
+
+
+# Eilutės kaina „už vienetą“ (ją galima dalinti iš ploto / svorio); matas 'kg' – jau kaina už kg
+PIECE_MATAI = ("", "vnt", "vnt.")
+KG_MATAI = ("kg",)
+
+# plotas_vnt / svoris_vnt (services/measures.parse_measure) -> daugiklis iki m² / kg.
+# Skaičius be mato laikomas m² / kg (taip laukai pildomi formoje); kiti matai – NaN.
+AREA_UNITS = {"": 1.0, "m2": 1.0, "dm2": 1e-2, "cm2": 1e-4, "mm2": 1e-6}
+MASS_UNITS = {"": 1.0, "kg": 1.0, "g": 1e-3, "t": 1e3}
+
+QUANTILES = (("p10", 0.10), ("p25", 0.25), ("median", 0.50), ("p75", 0.75), ("p90", 0.90))
+MAX_GROUPS = 30
+_CHUNK = 5000
+
+BACKEND = "numpy" if np is not None else "python"
+
+
+@dataclass
+class _Categories:
+    """Tekstinis stulpelis -> sveikųjų kodų masyvas + žodynas (kaip pandas factorize)."""
+
+    labels: List[str] = field(default_factory=list)
+    codes: array = field(default_factory=lambda: array("q"))
+    _index: Dict[str, int] = field(default_factory=dict)
+
+    def _code(self, value: str) -> int:
+        value = (value or "").strip()
+        code = self._index.get(value)
+        if code is None:
+            code = self._index[value] = len(self.labels)
+            self.labels.append(value)
+        return code
+
+    def extend(self, values: Iterable[str]) -> None:
+        self.codes.extend(map(self._code, values))
+
+
+@dataclass
+class PriceFrame:
+    """Aktualios kainų eilutės stulpeliais (array, be Python objektų eilutei)."""
+
+    kaina: array = field(default_factory=lambda: array("d"))
+    plotas: array = field(default_factory=lambda: array("d"))
+    svoris: array = field(default_factory=lambda: array("d"))
+    matas: _Categories = field(default_factory=_Categories)
+    plotas_vnt: _Categories = field(default_factory=_Categories)
+    svoris_vnt: _Categories = field(default_factory=_Categories)
+    klientas: _Categories = field(default_factory=_Categories)
+    metalas: _Categories = field(default_factory=_Categories)
+    padengimas: _Categories = field(default_factory=_Categories)
+
+    def __len__(self) -> int:
+        return len(self.kaina)
+
+
+def _num(value) -> float:
+    return math.nan if value is None else float(value)
+
+
+def load_price_frame(pozicijos: Optional[QuerySet] = None) -> PriceFrame:
+    """
+    Vienas query (KainosEilute JOIN Pozicija) -> PriceFrame. plotas / svoris –
+    iš skaitinių šešėlinių laukų (*_num, *_vnt), nes originalai laisvas tekstas.
+    """
+    qs = KainosEilute.objects.filter(busena="aktuali", kaina__isnull=False)
+    if pozicijos is not None:
+        qs = qs.filter(pozicija__in=pozicijos.values("pk"))
+    # skaičiai – iškart float (be Decimal objekto kiekvienam langeliui)
+    rows = qs.order_by().values_list(
+        Cast("kaina", FloatField()),
+        "matas",
+        "pozicija__klientas", "pozicija__metalas", "pozicija__padengimas",
+        Cast("pozicija__plotas_num", FloatField()),
+        Cast("pozicija__svoris_num", FloatField()),
+        "pozicija__plotas_vnt", "pozicija__svoris_vnt",
+    )
+
+    frame = PriceFrame()
+    it = rows.iterator(chunk_size=_CHUNK)
+    while True:
+        chunk = list(islice(it, _CHUNK))
+        if not chunk:
+            break
+        # gabalas transponuojamas į stulpelius – append'ai vyksta stulpeliui, ne langeliui
+        kaina, matas, klientas, metalas, padengimas, plotas, svoris, plotas_vnt, svoris_vnt = zip(*chunk)
+        frame.kaina.extend(kaina)
+        frame.plotas.extend(map(_num, plotas))
+        frame.svoris.extend(map(_num, svoris))
+        frame.matas.extend(m.casefold() for m in matas)
+        frame.plotas_vnt.extend(plotas_vnt)
+        frame.svoris_vnt.extend(svoris_vnt)
+        frame.klientas.extend(klientas)
+        frame.metalas.extend(metalas)
+        frame.padengimas.extend(padengimas)
+    return frame
+
+
+def load_trend(pozicijos: Optional[QuerySet] = None) -> tuple[array, array]:
+    """
+    Vieneto kainų istorija -> (mėnesio kodai, kainos). Imamos visos eilutės
+    (aktuali / laukianti / sena ir archyvas), mėnuo – nuo kada kaina galioja
+    (galioja_nuo; be jo – eilutės sukūrimo data).
+    """
+    menuo, kaina = array("q"), array("d")
+    piece = Q()
+    for m in PIECE_MATAI:
+        piece |= Q(matas__iexact=m)
+    for model in (KainosEilute, KainosEiluteArchyvas):
+        qs = model.objects.filter(kaina__isnull=False).filter(piece)
+        if pozicijos is not None:
+            qs = qs.filter(pozicija__in=pozicijos.values("pk"))
+        rows = qs.order_by().values_list(Cast("kaina", FloatField()), "galioja_nuo", "created")
+        for k, nuo, created in rows.iterator(chunk_size=_CHUNK):
+            d = nuo or timezone.localtime(created).date()
+            menuo.append(d.year * 12 + d.month - 1)
+            kaina.append(k)
+    return menuo, kaina
+
+
+# =============================================================================
+#  Grupiniai kvantiliai: numpy (vektorizuotai) arba gryname Python'e
+# =============================================================================
+
+def _quantiles_numpy(codes: Sequence[int], values: Sequence[float]) -> dict:
+    c = np.frombuffer(codes, dtype=np.int64) if isinstance(codes, array) else np.asarray(codes)
+    v = np.frombuffer(values, dtype=np.float64) if isinstance(values, array) else np.asarray(values, dtype=float)
+    ok = ~np.isnan(v)
+    c, v = c[ok], v[ok]
+    if not len(v):
+        return {"codes": [], "count": [], **{name: [] for name, _q in QUANTILES}, "mean": []}
+
+    order = np.lexsort((v, c))
+    c, v = c[order], v[order]
+    starts = np.flatnonzero(np.r_[True, c[1:] != c[:-1]])
+    counts = np.diff(np.r_[starts, len(v)])
+
+    out = {"codes": c[starts].tolist(), "count": counts.tolist()}
+    for name, q in QUANTILES:
+        pos = starts + q * (counts - 1)
+        lo = np.floor(pos).astype(np.int64)
+        hi = np.ceil(pos).astype(np.int64)
+        out[name] = (v[lo] + (v[hi] - v[lo]) * (pos - lo)).tolist()
+    out["mean"] = (np.add.reduceat(v, starts) / counts).tolist()
+    return out
+
+
+def _quantiles_python(codes: Sequence[int], values: Sequence[float]) -> dict:
+    idx = sorted((i for i in range(len(values)) if not math.isnan(values[i])), key=lambda i: (codes[i], values[i]))
+    v = array("d", (values[i] for i in idx))
+    c = [codes[i] for i in idx]
+
+    starts = [i for i in range(len(c)) if i == 0 or c[i] != c[i - 1]]
+    counts = [b - a for a, b in zip(starts, starts[1:] + [len(c)])]
+
+    out = {"codes": [c[s] for s in starts], "count": counts}
+    for name, q in QUANTILES:
+        col = []
+        for s, n in zip(starts, counts):
+            pos = s + q * (n - 1)
+            lo, hi = math.floor(pos), math.ceil(pos)
+            col.append(v[lo] + (v[hi] - v[lo]) * (pos - lo))
+        out[name] = col
+    out["mean"] = [math.fsum(v[s:s + n]) / n for s, n in zip(starts, counts)]
+    return out
+
+
+def grouped_quantiles(codes: Sequence[int], values: Sequence[float]) -> dict:
+    """
+    Kiekvienai grupei (codes) – count, p10..p90, median, mean (NaN praleidžiami).
+    Kvantiliai – tiesinė interpoliacija (kaip numpy.percentile numatytai).
+    """
+    if np is not None:
+        return _quantiles_numpy(codes, values)
+    return _quantiles_python(codes, values)
+
+
+def per_unit(frame: PriceFrame, divisor: str) -> array:
+    """
+    Kaina už m² / kg: vieneto kainos eilutės dalinamos iš pozicijos ploto / svorio,
+    perskaičiuoto į m² / kg pagal jo matą (AREA_UNITS / MASS_UNITS; nežinomas
+    matas – NaN); 'kg' eilutės (divisor='svoris') – jau kaina už kg. Kitur – NaN.
+    """
+    units = getattr(frame, divisor + "_vnt")
+    known = AREA_UNITS if divisor == "plotas" else MASS_UNITS
+    factors = array("d", (known.get(u, math.nan) for u in units.labels))
+    piece = {i for i, m in enumerate(frame.matas.labels) if m in PIECE_MATAI}
+    direct = {i for i, m in enumerate(frame.matas.labels) if divisor == "svoris" and m in KG_MATAI}
+
+    if np is not None:
+        codes = np.frombuffer(frame.matas.codes, dtype=np.int64)
+        k = np.frombuffer(frame.kaina, dtype=np.float64)
+        d = np.frombuffer(getattr(frame, divisor), dtype=np.float64)
+        if len(factors):
+            d = d * np.frombuffer(factors, dtype=np.float64)[np.frombuffer(units.codes, dtype=np.int64)]
+        is_piece = np.isin(codes, list(piece))
+        with np.errstate(divide="ignore", invalid="ignore"):
+            ratio = np.where(is_piece & (d > 0), k / d, np.nan)
+        ratio = np.where(np.isin(codes, list(direct)), k, ratio)
+        return array("d", ratio.tobytes())
+
+    out = array("d", bytes(8 * len(frame)))
+    den = getattr(frame, divisor)
+    for i, (code, k, d, u) in enumerate(zip(frame.matas.codes, frame.kaina, den, units.codes)):
+        d *= factors[u]
+        if code in direct:
+            out[i] = k
+        elif code in piece and d > 0:
+            out[i] = k / d
+        else:
+            out[i] = math.nan
+    return out
+
+
+# =============================================================================
+#  Ataskaitos
+# =============================================================================
+
+def _labelled(stats: dict, label_for: Callable[[int], str], top: Optional[int] = MAX_GROUPS) -> dict:
+    """Grupių kodai -> pavadinimai; daugiausia `top` didžiausių grupių (pagal kiekį)."""
+    order = range(len(stats["codes"]))
+    if top is not None:
+        order = sorted(order, key=lambda i: -stats["count"][i])[:top]
+    out = {"labels": [label_for(stats["codes"][i]) for i in order]}
+    for key, col in stats.items():
+        if key == "codes":
+            continue
+        out[key] = [col[i] if key == "count" else round(col[i], 4) for i in order]
+    return out
+
+
+def _by(cats: _Categories, empty_label: str) -> Callable[[int], str]:
+    return lambda code: cats.labels[code] or empty_label
+
+
+def _month(code: int) -> str:
+    return f"{code // 12}-{code % 12 + 1:02d}"
+
+
+def price_analytics(pozicijos: Optional[QuerySet] = None) -> dict:
+    """
+    Analitikos suvestinė: aktualios eilutės vienu DB skaitymu, tendencija – iš kainų istorijos:
+      - per_m2 / per_kg: kaina už m² / kg pagal metalą ir padengimą;
+      - klientai: kainų pasiskirstymas pagal klientą;
+      - trend: vieneto kainų kvantiliai pagal mėnesį, nuo kurio kaina galioja
+        (visa istorija, žr. load_trend).
+    """
+    frame = load_price_frame(pozicijos)
+    per_m2 = per_unit(frame, "plotas")
+    per_kg = per_unit(frame, "svoris")
+
+    def grouped(cats: _Categories, values: array, empty_label: str = "Nenurodyta") -> dict:
+        return _labelled(grouped_quantiles(cats.codes, values), _by(cats, empty_label))
+
+    return {
+        "backend": BACKEND,
+        "lines": len(frame),
+        "per_m2": {
+            "metalas": grouped(frame.metalas, per_m2),
+            "padengimas": grouped(frame.padengimas, per_m2),
+        },
+        "per_kg": {
+            "metalas": grouped(frame.metalas, per_kg),
+            "padengimas": grouped(frame.padengimas, per_kg),
+        },
+        "klientai": grouped(frame.klientas, frame.kaina, "Nepriskirta"),
+        "trend": _labelled(grouped_quantiles(*load_trend(pozicijos)), _month, top=None),
+    }
@@ -0,0 +1,165 @@
+# pozicijos/services/export.py
+from __future__ import annotations
+
+import csv
+import re
+import zipfile
+from datetime import date, datetime
+from decimal import Decimal
+from typing import Iterable, Iterator, List
+from xml.sax.saxutils import escape
+
+
+# Kiek eilučių vienu kartu traukiam iš DB (QuerySet.iterator) ir kas kiek
+# eilučių XLSX rašytojas atiduoda sukauptus baitus.
+EXPORT_CHUNK_SIZE = 2000
+
+
+def cell_text(value) -> str:
+    if value is None:
+        return ""
+    if isinstance(value, datetime):
+        return value.strftime("%Y-%m-%d %H:%M")
+    if isinstance(value, date):
+        return value.isoformat()
+    if isinstance(value, bool):
+        return "Taip" if value else "Ne"
+    return str(value)
+
+
+# =============================================================================
+#  CSV
+# =============================================================================
+
+class _Echo:
+    """csv.writer'iui: write() grąžina eilutę, o ne ją kaupia."""
+
+    def write(self, value):
+        return value
+
+
+def iter_csv(header: List[str], rows: Iterable[list]) -> Iterator[str]:
+    """
+    CSV su ';' skyrikliu ir UTF-8 BOM (kad Excel teisingai atidarytų lietuviškas raides).
+    Atiduodama po eilutę – atmintis nepriklauso nuo eilučių skaičiaus.
+    """
+    writer = csv.writer(_Echo(), delimiter=";")
+    yield "\ufeff" + writer.writerow(header)
+    for row in rows:
+        yield writer.writerow([cell_text(v) for v in row])
+
+
+# =============================================================================
+#  XLSX (minimalus srautinis rašytojas, be papildomų bibliotekų)
+# =============================================================================
+
+_CONTENT_TYPES = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Types xmlns="http://schemas.openxmlformats.org/package/2006/content-types">'
+    '<Default Extension="rels" ContentType="application/vnd.openxmlformats-package.relationships+xml"/>'
+    '<Default Extension="xml" ContentType="application/xml"/>'
+    '<Override PartName="/xl/workbook.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.sheet.main+xml"/>'
+    '<Override PartName="/xl/worksheets/sheet1.xml" '
+    'ContentType="application/vnd.openxmlformats-officedocument.spreadsheetml.worksheet+xml"/>'
+    '</Types>'
+)
+_ROOT_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/officeDocument" '
+    'Target="xl/workbook.xml"/>'
+    '</Relationships>'
+)
+_WORKBOOK = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<workbook xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main" '
+    'xmlns:r="http://schemas.openxmlformats.org/officeDocument/2006/relationships">'
+    '<sheets><sheet name="Pozicijos" sheetId="1" r:id="rId1"/></sheets>'
+    '</workbook>'
+)
+_WORKBOOK_RELS = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<Relationships xmlns="http://schemas.openxmlformats.org/package/2006/relationships">'
+    '<Relationship Id="rId1" '
+    'Type="http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet" '
+    'Target="worksheets/sheet1.xml"/>'
+    '</Relationships>'
+)
+_SHEET_HEAD = (
+    '<?xml version="1.0" encoding="UTF-8" standalone="yes"?>'
+    '<worksheet xmlns="http://schemas.openxmlformats.org/spreadsheetml/2006/main">'
+    '<sheetData>'
+)
+_SHEET_TAIL = '</sheetData></worksheet>'
+
+
+class _DrainBuffer:
+    """
+    Neseek'inamas "failas" zipfile'ui: rašymai kaupiami, o drain() juos atiduoda
+    ir išvalo. zipfile tokiam srautui naudoja data descriptor'ius.
+    """
+
+    def __init__(self):
+        self._chunks: list[bytes] = []
+        self._pos = 0
+
+    def write(self, data) -> int:
+        self._chunks.append(bytes(data))
+        self._pos += len(data)
+        return len(data)
+
+    def tell(self) -> int:
+        return self._pos
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        out = b"".join(self._chunks)
+        self._chunks.clear()
+        return out
+
+
+# XML 1.0 neleidžiami simboliai (valdymo simboliai iš senų importų ir pan.) –
+# vienas toks langelis padaro visą sheet1.xml nebeatidaromą
+_XML_ILLEGAL_RE = re.compile(r"[\x00-\x08\x0b\x0c\x0e-\x1f\ufffe\uffff]")
+
+
+def _xlsx_row(values) -> str:
+    cells = []
+    for v in values:
+        if v is None or v == "":
+            cells.append("<c/>")
+        elif isinstance(v, (int, float, Decimal)) and not isinstance(v, bool):
+            cells.append(f'<c t="n"><v>{v}</v></c>')
+        else:
+            text = escape(_XML_ILLEGAL_RE.sub("", cell_text(v)))
+            cells.append(f'<c t="inlineStr"><is><t xml:space="preserve">{text}</t></is></c>')
+    return "<row>" + "".join(cells) + "</row>"
+
+
+def iter_xlsx(header: List[str], rows: Iterable[list]) -> Iterator[bytes]:
+    """
+    Srautinis XLSX: vienas lapas, inline string'ai (be sharedStrings), be stilių.
+    Baitai atiduodami kas EXPORT_CHUNK_SIZE eilučių – atmintis ribota.
+    """
+    buf = _DrainBuffer()
+    with zipfile.ZipFile(buf, mode="w", compression=zipfile.ZIP_DEFLATED) as zf:
+        zf.writestr("[Content_Types].xml", _CONTENT_TYPES)
+        zf.writestr("_rels/.rels", _ROOT_RELS)
+        zf.writestr("xl/workbook.xml", _WORKBOOK)
+        zf.writestr("xl/_rels/workbook.xml.rels", _WORKBOOK_RELS)
+        yield buf.drain()
+
+        with zf.open("xl/worksheets/sheet1.xml", mode="w", force_zip64=True) as sheet:
+            sheet.write((_SHEET_HEAD + _xlsx_row(header)).encode("utf-8"))
+            for i, row in enumerate(rows, start=1):
+                sheet.write(_xlsx_row(row).encode("utf-8"))
+                if i % EXPORT_CHUNK_SIZE == 0:
+                    data = buf.drain()
+                    if data:
+                        yield data
+            sheet.write(_SHEET_TAIL.encode("utf-8"))
+    yield buf.drain()
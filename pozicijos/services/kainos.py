@@ -1,38 +1,173 @@
 # pozicijos/services/kainos.py
 from __future__ import annotations
 
+from collections import defaultdict
+from dataclasses import dataclass, field
 from datetime import date, timedelta
-from typing import Optional
+from decimal import Decimal
+from typing import Dict, Iterable, List, Optional
 
 from django.db import transaction
-from django.db.models import Q, QuerySet
+from django.db.models import Exists, F, OuterRef, Q, QuerySet, Window
+from django.db.models.functions import RowNumber
+from django.utils import timezone
+from simple_history.utils import bulk_create_with_history, bulk_update_with_history
 
 from ..models import KainosEilute, Pozicija
+from .list_cache import bump_data_version
+from .price_snapshot import schedule_snapshot_rebuild
+from .pricing import LIVE_BUSENOS, invalidate_pozicija_prices, quote
 
 
-def _group_filter_for(row: KainosEilute) -> Q:
+# Laukai, kuriuos formset'as gali pakeisti (bulk_update sąrašas)
+_FORMSET_UPDATE_FIELDS = [
+    "kaina",
+    "matas",
+    "kiekis_nuo",
+    "kiekis_iki",
+    "galioja_nuo",
+    "galioja_iki",
+    "pastaba",
+    "busena",
+    "yra_fiksuota",
+    "fiksuotas_kiekis",
+    "updated",
+]
+
+
+def _group_key(row: KainosEilute) -> tuple:
     """
     Apibrėžia „grupę“, kurioje gali būti tik viena AKTUALI kaina.
 
-    Grupė apibrėžiama:
-      - ta pati pozicija
+    Grupė apibrėžiama (pozicijos ribose):
       - tas pats matas
       - tas pats tipas (fiksuota / intervalinė)
       - fiksuotai: tas pats fiksuotas_kiekis
       - intervalinei: tas pats (kiekis_nuo, kiekis_iki)
     """
-    q = Q(pozicija=row.pozicija, matas=row.matas)
-
     if row.yra_fiksuota:
-        q &= Q(yra_fiksuota=True, fiksuotas_kiekis=row.fiksuotas_kiekis)
-    else:
-        q &= Q(
-            yra_fiksuota=False,
-            kiekis_nuo=row.kiekis_nuo,
-            kiekis_iki=row.kiekis_iki,
+        return (row.matas, True, row.fiksuotas_kiekis)
+    return (row.matas, False, row.kiekis_nuo, row.kiekis_iki)
+
+
+def busena_for_start(galioja_nuo: Optional[date], as_of: Optional[date] = None) -> str:
+    """
+    Aktyvuojamos eilutės būsena: jei galiojimas dar neprasidėjo – 'laukianti'
+    (aktuali taps per expire_and_promote, žr. manage.py kainu_galiojimas), kitaip 'aktuali'.
+    """
+    as_of = as_of or date.today()
+    if galioja_nuo and galioja_nuo > as_of:
+        return "laukianti"
+    return "aktuali"
+
+
+def current_lines_q(as_of: Optional[date] = None) -> Q:
+    """
+    Galiojančių kainų eilučių sąlyga. Be as_of (šiandien) – tik busena='aktuali':
+    datas į būseną suveda kainu_galiojimas (expire_and_promote), todėl karštiems
+    keliams datų predikatų nereikia. Su as_of – aktualios ir laukiančios,
+    galiojančios tą dieną (užklausos praeičiai / ateičiai).
+    """
+    if as_of is None:
+        return Q(busena="aktuali")
+    return (
+        Q(busena__in=LIVE_BUSENOS)
+        & (Q(galioja_nuo__isnull=True) | Q(galioja_nuo__lte=as_of))
+        & (Q(galioja_iki__isnull=True) | Q(galioja_iki__gte=as_of))
+    )
+
+
+def _demote(old: KainosEilute, new: KainosEilute, retire: bool = True) -> None:
+    """
+    retire=False – nauja eilutė dar laukianti: sena lieka aktuali, tik patrumpinamas
+    jos galiojimas (pasens pati, kai suveiks expire_and_promote).
+    """
+    if retire:
+        old.busena = "sena"
+
+    # Variant B: jeigu nauja turi galioja_nuo – patrumpinam senos galioja_iki
+    if new.galioja_nuo:
+        # Jei sena neturi pabaigos arba baigiasi vėliau nei naujos pradžia
+        if old.galioja_iki is None or old.galioja_iki >= new.galioja_nuo:
+            candidate_end = new.galioja_nuo - timedelta(days=1)
+            # neleidžiam, kad pabaiga būtų prieš pradžią (jei sena turi nuo)
+            if not old.galioja_nuo or candidate_end >= old.galioja_nuo:
+                old.galioja_iki = candidate_end
+
+
+def _lines_changed(pozicija_id: int) -> None:
+    """bulk_* signalų nekelia – kešus invaliduojam ranka."""
+    invalidate_pozicija_prices(pozicija_id)
+    schedule_snapshot_rebuild(pozicija_id)
+    bump_data_version()
+
+
+@transaction.atomic
+def set_aktuali_batch(pozicija: Pozicija, rows: Iterable[KainosEilute], user=None) -> List[KainosEilute]:
+    """
+    set_aktuali daugeliui jau išsaugotų eilučių iškart (pvz. visam formset'ui):
+
+    - vienas query – visos pozicijos AKTUALIOS eilutės;
+    - grupių konfliktai sprendžiami atmintyje ta pačia tvarka, kaip būtų
+      kviečiant set_aktuali() kiekvienai eilutei paeiliui (vėlesnė laimi);
+    - pasenintos eilutės įrašomos vienu bulk_update, istorija – bulk'u;
+    - pozicija.kaina_eur perskaičiuojama vieną kartą pabaigoje.
+
+    Eilutė, kurios galioja_nuo dar ateityje, tampa 'laukianti': tos grupės
+    aktualios nepasenamos, tik patrumpinamas jų galiojimas.
+
+    Grąžina pakeistas (pasenintas / patrumpintas) eilutes.
+    """
+    rows = [r for r in rows if r.pk]
+    if not rows:
+        return []
+
+    today = date.today()
+    persisted = {r.pk: (r.busena, r.galioja_iki) for r in rows}
+
+    active: Dict[int, KainosEilute] = {
+        r.pk: r for r in KainosEilute.objects.filter(pozicija=pozicija, busena="aktuali")
+    }
+    for r in rows:
+        active[r.pk] = r
+
+    groups: Dict[tuple, List[KainosEilute]] = defaultdict(list)
+    for r in active.values():
+        groups[_group_key(r)].append(r)
+
+    to_update: Dict[int, KainosEilute] = {}
+    for row in rows:
+        # kaip nuoseklūs set_aktuali() kvietimai: vėlesnė eilutė vėl tampa aktuali
+        # (arba laukianti, jei jos galiojimas dar neprasidėjo)
+        row.busena = busena_for_start(row.galioja_nuo, today)
+        row.galioja_iki = persisted[row.pk][1]
+        if row.busena != persisted[row.pk][0]:
+            to_update[row.pk] = row
+        else:
+            to_update.pop(row.pk, None)
+
+        retire = row.busena == "aktuali"
+        for old in groups[_group_key(row)]:
+            if old.pk != row.pk and old.busena == "aktuali":
+                _demote(old, row, retire=retire)
+                to_update[old.pk] = old
+
+    if to_update:
+        now = timezone.now()
+        for obj in to_update.values():
+            obj.updated = now
+        bulk_update_with_history(
+            list(to_update.values()),
+            KainosEilute,
+            ["busena", "galioja_iki", "updated"],
+            default_user=user,
         )
+        _lines_changed(pozicija.pk)
 
-    return q
+    # --- SUSIEJIMAS SU SĄRAŠO KAINOS STULPELIU ---
+    sync_kaina_eur(pozicija, user=user)
+
+    return [obj for obj in to_update.values() if obj.pk not in persisted]
 
 
 @transaction.atomic
@@ -40,49 +175,179 @@ def set_aktuali(row: KainosEilute, save: bool = True) -> KainosEilute:
     """
     Pažymi eilutę kaip AKTUALI ir pasirūpina, kad toje grupėje liktų tik viena.
 
-    - Jei save=True, eilutei nustato busena='aktuali' ir ją išsaugo.
+    - Jei save=True, eilutei nustato busena='aktuali' ir ją išsaugo
+      (jei galioja_nuo ateityje – 'laukianti', žr. busena_for_start).
     - Visoms kitoms tos grupės AKTUALI eilutėms:
         * busena -> 'sena'
         * jei įmanoma, patrumpina jų galiojimą (galioja_iki = nauja.galioja_nuo - 1d)
     - Papildomai:
-        * atnaujina pozicija.kaina_eur => susiejimas su sąrašo „Kaina“ stulpeliu.
+        * atnaujina pozicija.kaina_eur pagal headline taisyklę (headline_kainos).
     """
     if save:
         row.busena = "aktuali"
         row.save()
 
-    # Randam kitas AKTUALIAS konfliktuojančias eilutes
-    group_q = _group_filter_for(row)
-    others = (
+    if row.pozicija_id is not None:
+        set_aktuali_batch(row.pozicija, [row])
+    return row
+
+
+@transaction.atomic
+def save_kainos_formset(formset, pozicija: Pozicija, user=None) -> List[KainosEilute]:
+    """
+    Išsaugo validų KainaFormSet keliais statement'ais, ne po vieną eilutę:
+
+    - ištrintos – vienu QuerySet.delete();
+    - naujos – bulk_create_with_history, pakeistos – bulk_update_with_history;
+    - AKTUALIŲ konfliktai – vienu set_aktuali_batch();
+    - kaina_eur – vieną kartą pabaigoje.
+    """
+    instances = formset.save(commit=False)
+
+    deleted_pks = [obj.pk for obj in formset.deleted_objects if obj.pk]
+    if deleted_pks:
+        KainosEilute.objects.filter(pk__in=deleted_pks).delete()
+
+    now = timezone.now()
+    new, changed = [], []
+    for inst in instances:
+        inst.pozicija = pozicija
+        if inst.pk is None:
+            new.append(inst)
+        else:
+            inst.updated = now
+            changed.append(inst)
+
+    if new:
+        new = bulk_create_with_history(new, KainosEilute, default_user=user)
+    if changed:
+        bulk_update_with_history(changed, KainosEilute, _FORMSET_UPDATE_FIELDS, default_user=user)
+    if new or changed:
+        _lines_changed(pozicija.pk)
+
+    aktualios = [i for i in changed + new if i.busena in ("aktuali", "laukianti")]
+    if aktualios:
+        set_aktuali_batch(pozicija, aktualios, user=user)  # perskaičiuoja ir kaina_eur
+    elif deleted_pks or changed:
+        sync_kaina_eur(pozicija, user=user)
+    return changed + new
+
+
+# =============================================================================
+#  Headline kaina (Pozicija.kaina_eur)
+# =============================================================================
+
+# Vienintelė taisyklė sąrašo „Kaina“ stulpeliui: iš galiojančių (current_lines_q)
+# eilučių su kaina – mažiausias prioritetas, tada naujausia (created, id).
+# Pozicijos be jokių kainų eilučių neliečiamos (senas kaina_eur – žr. backfill_kainos).
+HEADLINE_ORDER = ("prioritetas", "-created", "-id")
+
+RECOMPUTE_CHUNK_SIZE = 1000
+
+
+@dataclass
+class KainaEurDrift:
+    pozicija_id: int
+    old: Optional[Decimal]
+    new: Optional[Decimal]
+
+
+@dataclass
+class RecomputeResult:
+    checked: int = 0
+    updated: int = 0
+    drift: List[KainaEurDrift] = field(default_factory=list)
+
+
+def headline_kainos(pozicija_ids: Iterable[int], as_of: Optional[date] = None) -> Dict[int, Optional[Decimal]]:
+    """
+    {pozicija_id: headline kaina} vienu query su ROW_NUMBER() OVER (PARTITION BY pozicija).
+    Pozicijos, turinčios eilučių, bet be galiojančios aktualios – None.
+    """
+    ids = list(pozicija_ids)
+
+    # EXISTS – vienas indekso zondas pozicijai, ne visų (ir senų) eilučių DISTINCT
+    out: Dict[int, Optional[Decimal]] = {
+        pid: None
+        for pid in Pozicija.objects.filter(pk__in=ids)
+        .filter(Exists(KainosEilute.objects.filter(pozicija=OuterRef("pk"))))
+        .values_list("pk", flat=True)
+    }
+    rows = (
         KainosEilute.objects
-        .filter(group_q, busena="aktuali")
-        .exclude(pk=row.pk)
+        .filter(current_lines_q(as_of), pozicija_id__in=ids, kaina__isnull=False)
+        .annotate(
+            rn=Window(
+                RowNumber(),
+                partition_by=[F("pozicija_id")],
+                order_by=[F(f[1:]).desc() if f.startswith("-") else F(f).asc() for f in HEADLINE_ORDER],
+            )
+        )
+        .filter(rn=1)
+        .values_list("pozicija_id", "kaina")
     )
+    out.update(rows)
+    return out
 
-    for old in others:
-        old.busena = "sena"
 
-        # Variant B: jeigu nauja turi galioja_nuo – patrumpinam senos galioja_iki
-        if row.galioja_nuo:
-            # Jei sena neturi pabaigos arba baigiasi vėliau nei naujos pradžia
-            if old.galioja_iki is None or old.galioja_iki >= row.galioja_nuo:
-                candidate_end = row.galioja_nuo - timedelta(days=1)
-                # neleidžiam, kad pabaiga būtų prieš pradžią (jei sena turi nuo)
-                if not old.galioja_nuo or candidate_end >= old.galioja_nuo:
-                    old.galioja_iki = candidate_end
+def recompute_kaina_eur(
+    pozicija_ids: Optional[Iterable[int]] = None,
+    *,
+    verify: bool = False,
+    chunk_size: int = RECOMPUTE_CHUNK_SIZE,
+    as_of: Optional[date] = None,
+    user=None,
+) -> RecomputeResult:
+    """
+    Suderina Pozicija.kaina_eur su headline taisykle gabalais po chunk_size:
+    vienas window query + vienas bulk_update_with_history kiekvienam gabalui.
+    Kiekvienas gabalas – atskira transakcija (SQLite rašymo užraktas laikomas
+    tik gabalo įrašymo metu, ne visą katalogo perskaičiavimą).
+    verify=True – tik surenka neatitikimus, nieko nerašo.
+    """
+    result = RecomputeResult()
+    qs = Pozicija.objects.order_by("id")
+    if pozicija_ids is not None:
+        qs = qs.filter(pk__in=list(pozicija_ids))
 
-        old.save()
+    last_id = 0
+    while True:
+        # pilni objektai – istorijos įrašui reikia visų laukų
+        chunk = list(qs.filter(pk__gt=last_id)[:chunk_size])
+        if not chunk:
+            break
+        last_id = chunk[-1].pk
+        result.checked += len(chunk)
 
-    # --- SUSIEJIMAS SU SĄRAŠO KAINOS STULPELIU ---
-    # Čia darom „santrauką“: pozicija.kaina_eur = naujos AKTUALIOS eilutės suma.
-    # Sąrašo „Kaina“ stulpelis, jei naudoja pozicija.kaina_eur, visada rodys naujausią aktualią kainą.
-    poz = row.pozicija
-    if poz is not None:
-        poz.kaina_eur = row.kaina
-        # jei nori, atnaujinam ir updated lauką; jis pas tave yra modelyje
-        poz.save(update_fields=["kaina_eur", "updated"])
+        expected = headline_kainos([p.pk for p in chunk], as_of=as_of)
+        now = timezone.now()
+        to_update = []
+        for poz in chunk:
+            if poz.pk not in expected:
+                continue
+            new = expected[poz.pk]
+            if poz.kaina_eur != new:
+                result.drift.append(KainaEurDrift(poz.pk, poz.kaina_eur, new))
+                poz.kaina_eur = new
+                poz.updated = now
+                to_update.append(poz)
 
-    return row
+        if to_update and not verify:
+            with transaction.atomic():
+                bulk_update_with_history(to_update, Pozicija, ["kaina_eur", "updated"], default_user=user)
+                # versija kartu su gabalu – kiti procesai nemato pusiau pritaikytų duomenų su sena versija
+                bump_data_version()
+            result.updated += len(to_update)
+
+    return result
+
+
+def sync_kaina_eur(pozicija: Pozicija, user=None) -> None:
+    """Vienos pozicijos kaina_eur pagal headline taisyklę (ir objekte atmintyje)."""
+    recompute_kaina_eur([pozicija.pk], user=user)
+    pozicija.kaina_eur = (
+        Pozicija.objects.filter(pk=pozicija.pk).values_list("kaina_eur", flat=True).first()
+    )
 
 
 def aktualios_kainos(
@@ -91,18 +356,11 @@ def aktualios_kainos(
     as_of: Optional[date] = None,
 ) -> QuerySet[KainosEilute]:
     """
-    Grąžina AKTUALIAS kainas pozicijai (pagal datą ir, jei nurodytas, matą).
+    Grąžina AKTUALIAS kainas pozicijai (ir, jei nurodytas, matui).
+    Be as_of – tik pagal busena, su as_of – tą dieną galiojančios (current_lines_q).
     Naudojama tiek UI, tiek logikai.
     """
-    as_of = as_of or date.today()
-
-    qs = pozicija.kainu_eilutes.filter(
-        busena="aktuali",
-    ).filter(
-        Q(galioja_nuo__isnull=True) | Q(galioja_nuo__lte=as_of)
-    ).filter(
-        Q(galioja_iki__isnull=True) | Q(galioja_iki__gte=as_of)
-    )
+    qs = pozicija.kainos_eilutes.filter(current_lines_q(as_of))
 
     if matas:
         qs = qs.filter(matas=matas)
@@ -133,25 +391,121 @@ def find_for_qty(
     3) Jei keli kandidatai – laimi:
          - mažesnis prioritetas
          - naujesnis created
+
+    Sprendžia services/pricing variklis (sukompiliuotos kainos atmintyje);
+    čia – tik eilutės objektas tam, kas jo reikia.
+    """
+    res = quote(pozicija.pk, qty, matas, as_of, fallback=False)
+    if not res.found:
+        return None
+    return KainosEilute.objects.filter(pk=res.line_id).first()
+
+
+# =============================================================================
+#  Galiojimo pabaiga / pradžia (manage.py kainu_galiojimas)
+# =============================================================================
+
+EXPIRY_BATCH_SIZE = 500
+
+
+@dataclass
+class ExpiryResult:
+    expired: int = 0
+    promoted: int = 0
+    superseded: int = 0
+    pozicijos: List[int] = field(default_factory=list)
+
+
+def _retire_in_bulk(objs: List[KainosEilute], values: dict, reason: str, user=None) -> None:
+    """Vienas UPDATE visam sąrašui + istorija partijomis (bulk_history_create)."""
+    if not objs:
+        return
+    now = timezone.now()
+    for i in range(0, len(objs), EXPIRY_BATCH_SIZE):
+        batch = objs[i:i + EXPIRY_BATCH_SIZE]
+        KainosEilute.objects.filter(pk__in=[o.pk for o in batch]).update(updated=now, **values)
+        for o in batch:
+            for k, v in values.items():
+                setattr(o, k, v)
+            o.updated = now
+        KainosEilute.history.bulk_history_create(
+            batch,
+            update=True,
+            default_user=user,
+            default_change_reason=reason,
+            default_date=now,
+        )
+
+
+def _promotion_rank(line: KainosEilute) -> tuple:
+    start = line.galioja_nuo or date.min
+    return (-start.toordinal(), line.prioritetas, -line.created.timestamp(), -line.pk)
+
+
+@transaction.atomic
+def expire_and_promote(as_of: Optional[date] = None, *, dry_run: bool = False, user=None) -> ExpiryResult:
+    """
+    Suderina busena su galiojimo datomis, kad skaitymo keliams užtektų busena:
+
+    1) aktuali, kurių galioja_iki < as_of            -> 'sena'
+    2) laukianti, kurių galioja_nuo <= as_of         -> 'aktuali'
+       (jei jau ir pasibaigusios – iškart 'sena'); jei grupėje tokių kelios
+       (darbas nebuvo leistas kelias dienas) – aktuali tampa tik vėliausiai
+       prasidėjusi (tada mažesnis prioritetas, naujesnė), kitos – 'sena'
+    3) aktyvuotų grupėse likusios kitos aktualios    -> 'sena'
+
+    Rašoma set-based UPDATE'ais, istorija – partijomis; kaina_eur ir kešai
+    perskaičiuojami tik paliestoms pozicijoms.
     """
     as_of = as_of or date.today()
-    qs = aktualios_kainos(pozicija, matas=matas, as_of=as_of)
+    result = ExpiryResult()
 
-    # 1) Fiksuotos
-    fx = (
-        qs.filter(yra_fiksuota=True, fiksuotas_kiekis=qty)
-        .order_by("prioritetas", "-created")
-        .first()
-    )
-    if fx:
-        return fx
-
-    # 2) Intervalinės
-    iv = (
-        qs.filter(yra_fiksuota=False)
-        .filter(Q(kiekis_nuo__isnull=True) | Q(kiekis_nuo__lte=qty))
-        .filter(Q(kiekis_iki__isnull=True) | Q(kiekis_iki__gte=qty))
-        .order_by("prioritetas", "-created")
-        .first()
-    )
-    return iv
+    expired = list(KainosEilute.objects.filter(busena="aktuali", galioja_iki__lt=as_of))
+    due = list(KainosEilute.objects.filter(
+        Q(galioja_nuo__isnull=True) | Q(galioja_nuo__lte=as_of), busena="laukianti"
+    ))
+    expired += [l for l in due if l.galioja_iki is not None and l.galioja_iki < as_of]
+
+    # 2) vienoje grupėje aktyvuojama tik viena laukianti
+    promoted_by_key = defaultdict(list)
+    for l in due:
+        if l.galioja_iki is None or l.galioja_iki >= as_of:
+            promoted_by_key[(l.pozicija_id, _group_key(l))].append(l)
+    promoted: List[KainosEilute] = []
+    superseded: List[KainosEilute] = []
+    for candidates in promoted_by_key.values():
+        candidates.sort(key=_promotion_rank)
+        promoted.append(candidates[0])
+        superseded.extend(candidates[1:])
+
+    # 3) vienoje grupėje – tik viena aktuali: aktyvuota laimi prieš likusias
+    if promoted:
+        expired_pks = {l.pk for l in expired}
+        poz_ids = sorted({l.pozicija_id for l in promoted})
+        for i in range(0, len(poz_ids), EXPIRY_BATCH_SIZE):
+            for old in KainosEilute.objects.filter(
+                pozicija_id__in=poz_ids[i:i + EXPIRY_BATCH_SIZE], busena="aktuali"
+            ):
+                if old.pk in expired_pks:
+                    continue
+                winners = promoted_by_key.get((old.pozicija_id, _group_key(old)))
+                if winners:
+                    superseded.append(old)
+
+    result.expired = len(expired)
+    result.promoted = len(promoted)
+    result.superseded = len(superseded)
+    result.pozicijos = sorted({l.pozicija_id for l in expired + promoted + superseded})
+    if dry_run or not result.pozicijos:
+        return result
+
+    _retire_in_bulk(expired, {"busena": "sena"}, "Galiojimas pasibaigė", user=user)
+    _retire_in_bulk(superseded, {"busena": "sena"}, "Pakeista nauja aktualia kaina", user=user)
+    _retire_in_bulk(promoted, {"busena": "aktuali"}, "Galiojimas prasidėjo", user=user)
+
+    invalidate_pozicija_prices(None)
+    for pid in result.pozicijos:
+        schedule_snapshot_rebuild(pid)
+    recompute_kaina_eur(result.pozicijos, as_of=as_of, user=user)
+    bump_data_version()
+    return result
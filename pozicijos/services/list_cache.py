@@ -0,0 +1,84 @@
+# pozicijos/services/list_cache.py
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Callable
+
+from django.conf import settings
+from django.core.cache import cache
+
+from . import versions
+from .listing import page_size_from_request, visible_cols_from_request
+
+
+# Globalus duomenų versijos skaitliukas: kiekvienas Pozicija / KainosEilute /
+# PozicijosBrezinys įrašymas ar trynimas jį padidina (signals.py), todėl visi
+# anksčiau kešuoti fragmentai iškart tampa nebepasiekiami (raktas turi versiją).
+#
+# Versija laikoma DB (services/versions.py), ne cache: numatytasis LocMemCache
+# kiekvienam procesui savas, ir kito worker'io pakeitimo čia nebūtų matyti.
+# Patys fragmentai gali likti procese – jų raktas visada su bendra versija.
+DATA_VERSION_KEY = versions.LIST_DATA
+
+LIST_CACHE_TIMEOUT = getattr(settings, "POZICIJOS_LIST_CACHE_TIMEOUT", 300)
+
+# Eilučių (tbody) atsakymas priklauso ir nuo rikiavimo / puslapio;
+# statistika (stats) – tik nuo q ir f[...] filtrų.
+_ROW_PARAMS = ("sort", "dir", "cursor")
+
+
+def get_data_version() -> int:
+    return versions.get_version(DATA_VERSION_KEY)
+
+
+def bump_data_version() -> None:
+    versions.bump_version(DATA_VERSION_KEY)
+
+
+def normalized_list_query(request, rows: bool = True) -> str:
+    """
+    Kanoninė užklausos forma: tušti filtrai išmetami, f[...] ir cols surikiuoti,
+    page_size apribotas – "?a=1&b=" ir "?b=&a=1" duoda tą patį raktą.
+    rows=False – tik paieška ir filtrai (statistikai).
+    """
+    parts: list[str] = []
+    q = (request.GET.get("q") or "").strip()
+    if q:
+        parts.append(f"q={q}")
+
+    filters = sorted(
+        (key, (value or "").strip())
+        for key, value in request.GET.items()
+        if key.startswith("f[") and (value or "").strip()
+    )
+    parts.extend(f"{key}={value}" for key, value in filters)
+
+    if not rows:
+        return "&".join(parts)
+
+    for name in _ROW_PARAMS:
+        value = (request.GET.get(name) or "").strip()
+        if name == "dir" and not request.GET.get("sort"):
+            continue
+        if value:
+            parts.append(f"{name}={value}")
+
+    # stulpelių tvarka tbody neįtakoja (piešiama pagal COLUMNS)
+    parts.append("cols=" + ",".join(sorted(set(visible_cols_from_request(request)))))
+    parts.append(f"page_size={page_size_from_request(request)}")
+    return "&".join(parts)
+
+
+def list_cache_key(request, kind: str, rows: bool = True) -> str:
+    digest = hashlib.md5(normalized_list_query(request, rows=rows).encode("utf-8")).hexdigest()
+    return f"pozicijos:{kind}:v{get_data_version()}:{digest}"
+
+
+def cached_list_fragment(request, kind: str, build: Callable[[], Any], rows: bool = True) -> Any:
+    """Grąžina kešuotą fragmentą (HTML / dict) arba jį sukuria per build()."""
+    key = list_cache_key(request, kind, rows=rows)
+    value = cache.get(key)
+    if value is None:
+        value = build()
+        cache.set(key, value, LIST_CACHE_TIMEOUT)
+    return value
@@ -1,18 +1,73 @@
 from __future__ import annotations
 
+import base64
+import binascii
+import json
+from dataclasses import dataclass
+from datetime import date, datetime
 from decimal import Decimal, InvalidOperation
-from typing import Dict, List
+from typing import Any, Dict, List, Optional, Tuple
 
-from django.db.models import Q, QuerySet
+from django.core.exceptions import FieldDoesNotExist, ValidationError
+from django.db import connection
+from django.db.models import Count, Func, IntegerField, OuterRef, Q, QuerySet, Subquery
+from django.db.models.functions import Coalesce
 
+from ..models import PozicijosBrezinys
 from ..schemas.columns import COLUMNS
+from .search import apply_global_search
 
 
-# Kurie stulpeliai gali būti rikiuojami – pagal key -> realų DB lauką.
-# Virtualūs ('brez_count', 'dok_count', ir pan.) čia nepatenka.
+# Prisegti failai, laikomi "dokumentais" (ne brėžiniais) – dok_count stulpeliui.
+DOC_EXTENSIONS = ("doc", "docx", "xls", "xlsx", "odt", "ods", "txt", "csv", "rtf")
+
+
+def _breziniai_count(where: Optional[Q] = None) -> Coalesce:
+    """COUNT(*) per koreliuotą subquery – viena SQL užklausa visam puslapiui, be N+1."""
+    sq = PozicijosBrezinys.objects.filter(pozicija=OuterRef("pk"))
+    if where is not None:
+        sq = sq.filter(where)
+    sq = sq.order_by().values("pozicija").annotate(c=Count("id")).values("c")
+    return Coalesce(Subquery(sq, output_field=IntegerField()), 0)
+
+
+def _dok_q() -> Q:
+    q = Q()
+    for ext in DOC_EXTENSIONS:
+        q |= Q(failas__iendswith="." + ext)
+    return q
+
+
+# Virtualūs stulpeliai (COLUMNS type="virtual") -> anotacijos išraiška.
+# Anotuojama tik tada, kai stulpelis rodomas, filtruojamas ar pagal jį rikiuojama.
+VIRTUAL_ANNOTATIONS: Dict[str, Any] = {
+    "brez_count": lambda: _breziniai_count(),
+    "dok_count": lambda: _breziniai_count(_dok_q()),
+}
+
+
+def annotate_virtual(qs: QuerySet, keys) -> QuerySet:
+    """Prideda virtualių stulpelių anotacijas (tik tų, kurių dar nėra qs)."""
+    extra = {
+        k: VIRTUAL_ANNOTATIONS[k]()
+        for k in keys
+        if k in VIRTUAL_ANNOTATIONS and k not in qs.query.annotations
+    }
+    return qs.annotate(**extra) if extra else qs
+
+
+# Kurie stulpeliai gali būti rikiuojami – pagal key -> realų DB lauką
+# (virtualiems – anotacijos vardą, žr. VIRTUAL_ANNOTATIONS).
 SORTABLE_FIELDS: Dict[str, str] = {
     c["key"]: c.get("order_field", c["key"])
     for c in COLUMNS
+    if c.get("type") != "virtual" or c["key"] in VIRTUAL_ANNOTATIONS
+}
+
+# Filtro key -> DB laukas (skaitiniams tekstiniams laukams – *_num kopijos).
+FILTER_FIELDS: Dict[str, str] = {
+    c["key"]: c.get("filter_field", c["key"])
+    for c in COLUMNS
     if c.get("type") != "virtual"
 }
 
@@ -178,19 +233,12 @@ def apply_filters(qs: QuerySet, request) -> QuerySet:
     Pritaiko globalų ir per-stulpelinius filtrus.
 
     Globalus:
-      ?q=...  -> klientas/projektas/poz_kodas/poz_pavad (icontains)
+      ?q=...  -> searchable COLUMNS laukai (FTS5 indeksas, jei yra; kitaip icontains)
 
     Per-stulpeliniai:
       ?f[field]=...
     """
-    q_global = request.GET.get("q", "").strip()
-    if q_global:
-        qs = qs.filter(
-            Q(klientas__icontains=q_global)
-            | Q(projektas__icontains=q_global)
-            | Q(poz_kodas__icontains=q_global)
-            | Q(poz_pavad__icontains=q_global)
-        )
+    qs = apply_global_search(qs, request.GET.get("q", ""))
 
     for key, value in request.GET.items():
         if not key.startswith("f["):
@@ -209,14 +257,19 @@ def apply_filters(qs: QuerySet, request) -> QuerySet:
         ]:
             qs = qs.filter(**{f"{field}__icontains": value})
 
-        # Decimal range
-        elif field in ["plotas", "svoris"]:
-            qs = qs.filter(build_numeric_range_q(field, value))
+        # Decimal range (tekstiniai plotas/svoris/kiekiai – per *_num kopijas)
+        elif field in ["plotas", "svoris", "detaliu_kiekis_reme", "faktinis_kiekis_reme", "kaina_eur"]:
+            qs = qs.filter(build_numeric_range_q(FILTER_FIELDS[field], value))
 
         # Integer range (darbo dienos)
         elif field in ["atlikimo_terminas"]:
             qs = qs.filter(build_int_range_q(field, value))
 
+        # Virtualūs skaitliukai (brez_count, dok_count) – range per anotaciją
+        elif field in VIRTUAL_ANNOTATIONS:
+            qs = annotate_virtual(qs, [field])
+            qs = qs.filter(build_int_range_q(field, value))
+
         # visi kiti – tikslus atitikimas
         else:
             qs = qs.filter(**{field: value})
@@ -228,21 +281,248 @@ def apply_filters(qs: QuerySet, request) -> QuerySet:
 #  Rikiavimas
 # =============================================================================
 
+def sort_spec_from_request(request) -> Tuple[str, bool]:
+    """
+    Grąžina (DB laukas, ar mažėjančiai) pagal ?sort=key&dir=asc/desc.
+    Nežinomas ar tuščias sort -> numatytasis (-created).
+    """
+    sort = request.GET.get("sort")
+    field = SORTABLE_FIELDS.get(sort) if sort else None
+    if not field:
+        return "created", True
+    return field, request.GET.get("dir", "asc") == "desc"
+
+
 def apply_sorting(qs: QuerySet, request) -> QuerySet:
     """
     Rikiavimas pagal ?sort=key&dir=asc/desc
+    Visada pridedam id kaip tie-breaker'į ta pačia kryptimi (reikalinga keyset
+    puslapiavimui): (field, id) arba (-field, -id). Taip vienas (field, id)
+    indeksas aptarnauja abi kryptis (skenuojant atgal).
     """
-    sort = request.GET.get("sort")
-    direction = request.GET.get("dir", "asc")
+    field, desc = sort_spec_from_request(request)
+    qs = annotate_virtual(qs, [field])
+    if desc:
+        return qs.order_by("-" + field, "-id")
+    return qs.order_by(field, "id")
 
-    if not sort:
-        return qs.order_by("-created", "-id")
 
-    field = SORTABLE_FIELDS.get(sort)
-    if not field:
-        return qs.order_by("-created", "-id")
+# =============================================================================
+#  Projekcija (tik matomi stulpeliai)
+# =============================================================================
+
+def _model_field_names(model) -> set:
+    return {f.name for f in model._meta.concrete_fields}
+
+
+def project_columns(qs: QuerySet, visible_cols: List[str], request=None) -> QuerySet:
+    """
+    Vietoj pilnų Pozicija objektų (su instrukcija, pastabos ir kt. TextField)
+    grąžina lengvus dict'us tik su id + matomais stulpeliais
+    (+ rikiavimo lauku, kurio reikia keyset cursor'iui).
+
+    Nežinomi ?cols= raktai ignoruojami. Virtualūs stulpeliai turi būti
+    anotuoti iš anksto (annotate_virtual).
+    """
+    real = _model_field_names(qs.model)
+    fields: list[str] = ["id"]
+    for key in visible_cols:
+        if (key in real or key in qs.query.annotations) and key not in fields:
+            fields.append(key)
+    if request is not None:
+        sort_field, _desc = sort_spec_from_request(request)
+        if sort_field not in fields:
+            fields.append(sort_field)
+    return qs.values(*fields)
+
+
+def choice_labels_for(visible_cols: List[str], model) -> Dict[str, dict]:
+    """Matomiems choices laukams: {laukas: {db_reikšmė: etiketė}}."""
+    return {
+        f.name: dict(f.flatchoices)
+        for f in model._meta.concrete_fields
+        if f.choices and f.name in visible_cols
+    }
+
+
+def apply_choice_labels(rows: list, visible_cols: List[str], model) -> list:
+    """
+    values() grąžina DB reikšmes ("nera"), ne get_FOO_display() ("Nėra") –
+    matomiems choices laukams pakeičiam etiketėmis vietoje.
+    """
+    labels = choice_labels_for(visible_cols, model)
+    if not labels:
+        return rows
+    for row in rows:
+        for name, mapping in labels.items():
+            if name in row:
+                row[name] = mapping.get(row[name], row[name])
+    return rows
+
+
+# =============================================================================
+#  Statistika (klientų pasiskirstymas)
+# =============================================================================
+
+class _GrandTotal(Func):
+    """SUM(COUNT(*)) OVER () – bendra suma tame pačiame GROUP BY statement'e."""
+    template = "SUM(COUNT(*)) OVER ()"
+    contains_aggregate = True
+    contains_over_clause = True
+    output_field = IntegerField()
 
-    if direction == "desc":
-        field = "-" + field
+    def get_group_by_cols(self):
+        return []
 
-    return qs.order_by(field, "-id")
+
+def klientas_breakdown(qs: QuerySet) -> dict:
+    """
+    Filtruoto rinkinio pasiskirstymas pagal klientą + bendras skaičius.
+    Kur DB palaiko window funkcijas, total skaičiuojamas tame pačiame statement'e.
+    """
+    data = qs.order_by().values("klientas").annotate(cnt=Count("id"))
+    with_total = connection.features.supports_over_clause
+    if with_total:
+        data = data.annotate(total=_GrandTotal())
+    data = data.order_by("-cnt")
+
+    labels: list[str] = []
+    values: list[int] = []
+    total = 0
+    for row in data:
+        labels.append(row["klientas"] or "Nepriskirta")
+        values.append(row["cnt"])
+        total = row["total"] if with_total else total + row["cnt"]
+
+    return {"labels": labels, "values": values, "total": total}
+
+
+# =============================================================================
+#  Keyset (cursor) puslapiavimas
+# =============================================================================
+
+DEFAULT_PAGE_SIZE = 25
+MAX_PAGE_SIZE = 500
+
+
+class InvalidCursor(ValueError):
+    """?cursor=... sugadintas arba sukurtas kitam rikiavimui."""
+
+
+@dataclass
+class KeysetPage:
+    items: list
+    next_cursor: str = ""
+    # cursor netinkamas – items tuščias, kito puslapio nėra (begalinis scroll baigiasi,
+    # o ne prideda 1 puslapio eilučių dar kartą)
+    cursor_invalid: bool = False
+
+    @property
+    def has_more(self) -> bool:
+        return bool(self.next_cursor)
+
+
+def page_size_from_request(request) -> int:
+    """?page_size=N, apribotas [1, MAX_PAGE_SIZE]; blogos reikšmės -> numatytasis."""
+    try:
+        size = int(request.GET.get("page_size", DEFAULT_PAGE_SIZE))
+    except (TypeError, ValueError):
+        return DEFAULT_PAGE_SIZE
+    return max(1, min(size, MAX_PAGE_SIZE))
+
+
+def _cursor_value(value: Any) -> Any:
+    # isoformat() – ne DjangoJSONEncoder, nes šis nukerta mikrosekundes
+    # ir tada "created = v" palyginimas nebesutaptų.
+    if isinstance(value, (datetime, date)):
+        return value.isoformat()
+    if isinstance(value, Decimal):
+        return str(value)
+    return value
+
+
+def encode_cursor(field: str, value: Any, pk: int) -> str:
+    payload = json.dumps([field, _cursor_value(value), pk], separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(token: str, field: str, model) -> Optional[Tuple[Any, int]]:
+    """
+    Iššifruoja ?cursor=... -> (reikšmė, id); be cursor'io – None (1 puslapis).
+    Sugadintas arba kitam rikiavimui sukurtas cursor – InvalidCursor.
+    """
+    if not token:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(token + "=" * (-len(token) % 4))
+        cur_field, value, pk = json.loads(raw.decode("utf-8"))
+        if cur_field != field:
+            raise InvalidCursor(f"cursor rikiavimui '{cur_field}', ne '{field}'")
+        if value is not None:
+            if field in VIRTUAL_ANNOTATIONS:
+                value = int(value)
+            else:
+                value = model._meta.get_field(field).to_python(value)
+        return value, int(pk)
+    except InvalidCursor:
+        raise
+    except (binascii.Error, UnicodeDecodeError, ValueError, TypeError,
+            FieldDoesNotExist, ValidationError) as e:
+        raise InvalidCursor(str(e)) from e
+
+
+def _keyset_after_q(field: str, desc: bool, value: Any, pk: int) -> Q:
+    """
+    Sąlyga "eilutės po (value, pk)" rikiavimui (field, id) arba (-field, -id).
+
+    NULL vieta priklauso nuo DB: PostgreSQL/Oracle NULL laiko didžiausiu,
+    SQLite/MySQL – mažiausiu. Todėl NULL'ai sąrašo gale, kai
+    (asc ir NULL didžiausias) arba (desc ir NULL mažiausias).
+    """
+    nulls_last = connection.features.nulls_order_largest != desc
+    tie = Q(id__lt=pk) if desc else Q(id__gt=pk)
+
+    if value is None:
+        q = Q(**{f"{field}__isnull": True}) & tie
+        if not nulls_last:
+            q |= Q(**{f"{field}__isnull": False})
+        return q
+
+    op = "lt" if desc else "gt"
+    q = Q(**{f"{field}__{op}": value}) | (Q(**{field: value}) & tie)
+    if nulls_last:
+        q |= Q(**{f"{field}__isnull": True})
+    return q
+
+
+def paginate_keyset(qs: QuerySet, request, page_size: Optional[int] = None) -> KeysetPage:
+    """
+    Keyset puslapiavimas: vietoj OFFSET filtruojam "po paskutinės matytos eilutės",
+    todėl N-tas puslapis kainuoja tiek pat, kiek pirmas.
+
+    qs turi būti jau išrikiuotas per apply_sorting.
+    Kitas puslapis: ?cursor=<KeysetPage.next_cursor>. Netinkamas cursor –
+    tuščias „pabaigos“ puslapis su cursor_invalid=True.
+    """
+    if page_size is None:
+        page_size = page_size_from_request(request)
+    field, desc = sort_spec_from_request(request)
+
+    try:
+        after = decode_cursor(request.GET.get("cursor", ""), field, qs.model)
+    except InvalidCursor:
+        return KeysetPage(items=[], cursor_invalid=True)
+    if after is not None:
+        qs = qs.filter(_keyset_after_q(field, desc, *after))
+
+    rows = list(qs[: page_size + 1])
+    if len(rows) <= page_size:
+        return KeysetPage(items=rows)
+
+    rows = rows[:page_size]
+    last = rows[-1]
+    if isinstance(last, dict):
+        value, pk = last[field], last["id"]
+    else:
+        value, pk = getattr(last, field), last.pk
+    return KeysetPage(items=rows, next_cursor=encode_cursor(field, value, pk))
@@ -0,0 +1,89 @@
+# pozicijos/services/measures.py
+from __future__ import annotations
+
+import re
+from decimal import Decimal, InvalidOperation
+from typing import Optional, Tuple
+
+
+# Tekstiniai laukai, kurie UI laikomi skaitiniais (COLUMNS type=number),
+# ir jų skaitinės "šešėlinės" kopijos: laukas -> (reikšmė, matas).
+SHADOW_NUMERIC_FIELDS: dict[str, Tuple[str, str]] = {
+    "plotas": ("plotas_num", "plotas_vnt"),
+    "svoris": ("svoris_num", "svoris_vnt"),
+    "detaliu_kiekis_reme": ("detaliu_kiekis_reme_num", "detaliu_kiekis_reme_vnt"),
+    "faktinis_kiekis_reme": ("faktinis_kiekis_reme_num", "faktinis_kiekis_reme_vnt"),
+}
+
+# Pirmas skaičius tekste: "1.25", "1,25", "1 250,5", "-3"
+_NUMBER_RE = re.compile(r"[-+]?\d{1,3}(?:[  ]\d{3})+(?:[.,]\d+)?|[-+]?\d+(?:[.,]\d+)?")
+
+_UNIT_ALIASES = {
+    "m²": "m2",
+    "m^2": "m2",
+    "kv.m": "m2",
+    "kv. m": "m2",
+    "kg.": "kg",
+    "vnt": "vnt.",
+}
+
+# Po pirmo skaičiaus – antras per "-", "..", "x", "*": intervalas ("10-20")
+# arba sandauga ("2x3"). Vienos reikšmės iš jų nėra.
+_RANGE_OR_PRODUCT_RE = re.compile(r"\s*(?:\.\.|[-–—x×*])\s*[-+]?\d", re.IGNORECASE)
+
+NUM_MAX_DIGITS = 14
+NUM_DECIMAL_PLACES = 4
+
+
+def parse_measure(raw: Optional[str]) -> Tuple[Optional[Decimal], str]:
+    """
+    "1.25 m2" -> (Decimal("1.25"), "m2")
+    "12,5kg"  -> (Decimal("12.5"), "kg")
+    "~ 40"    -> (Decimal("40"), "")
+    "nėra"    -> (None, "")
+    "10-20"   -> (None, "")   intervalas
+    "2x3 m"   -> (None, "")   sandauga
+
+    Imamas pirmas skaičius; matas – tekstas po jo (mažosiomis, normalizuotas).
+    Per didelės reikšmės (netelpa į DecimalField) -> None.
+    """
+    text = (raw or "").strip()
+    if not text:
+        return None, ""
+
+    m = _NUMBER_RE.search(text)
+    if not m:
+        return None, ""
+    if _RANGE_OR_PRODUCT_RE.match(text, m.end()):
+        return None, ""
+
+    num_str = m.group(0).replace(" ", "").replace(" ", "").replace(",", ".")
+    try:
+        value = Decimal(num_str).quantize(Decimal(1).scaleb(-NUM_DECIMAL_PLACES))
+    except InvalidOperation:
+        return None, ""
+    if len(value.as_tuple().digits) > NUM_MAX_DIGITS:
+        return None, ""
+
+    unit = text[m.end():].strip().lower()
+    unit = _UNIT_ALIASES.get(unit, unit)[:20]
+    return value, unit
+
+
+def fill_shadow_fields(obj, fields=None) -> list[str]:
+    """
+    Užpildo obj.<laukas>_num / _vnt iš tekstinių laukų.
+    Grąžina pakeistų šešėlinių laukų sąrašą (update_fields / bulk_update'ui).
+    """
+    changed: list[str] = []
+    for src, (num_field, unit_field) in SHADOW_NUMERIC_FIELDS.items():
+        if fields is not None and src not in fields:
+            continue
+        value, unit = parse_measure(getattr(obj, src, ""))
+        if getattr(obj, num_field) != value:
+            setattr(obj, num_field, value)
+            changed.append(num_field)
+        if getattr(obj, unit_field) != unit:
+            setattr(obj, unit_field, unit)
+            changed.append(unit_field)
+    return changed
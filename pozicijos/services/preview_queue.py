@@ -0,0 +1,179 @@
+# pozicijos/services/preview_queue.py
+from __future__ import annotations
+
+import logging
+import os
+import socket
+from dataclasses import dataclass
+from datetime import timedelta
+from typing import List, Optional
+
+from django.db import connection, transaction
+from django.db.models import F
+from django.utils import timezone
+
+from ..models import PozicijosBrezinys, PreviewJob
+from .previews import PREVIEW_EXTS, PreviewResult, generate_preview_for_instance, regenerate_missing_preview
+
+logger = logging.getLogger(__name__)
+
+
+# Užduotis, „vykdoma“ ilgiau nei tiek, laikoma pamesta (worker'is nukrito) ir grąžinama į eilę
+STALE_AFTER = timedelta(minutes=10)
+# Išimtys (ne „nepalaikomas formatas“) ir pamesti vykdymai kartojami iki tiek kartų
+MAX_ATTEMPTS = 3
+DEFAULT_BATCH_SIZE = 10
+
+
+@dataclass
+class WorkerStats:
+    done: int = 0
+    failed: int = 0
+    retried: int = 0
+
+
+def worker_name() -> str:
+    return f"{socket.gethostname()}:{os.getpid()}"
+
+
+def needs_preview(b: PozicijosBrezinys) -> bool:
+    return b.ext in PREVIEW_EXTS
+
+
+def enqueue_preview(b: PozicijosBrezinys, force: bool = False) -> Optional[PreviewJob]:
+    """
+    Įtraukia brėžinį į eilę (jei formatas turi miniatiūrą). Dublikatų nėra:
+    laukianti / vykdoma užduotis paliekama kaip yra (force tik sustiprinamas),
+    užbaigta – grąžinama į 'laukia'. force vykdomai užduočiai keičia jos
+    `updated` – run_job tai pamato ir grąžina užduotį į eilę, o ne 'atlikta'.
+    """
+    if not b.pk or not needs_preview(b):
+        return None
+
+    job, created = PreviewJob.objects.get_or_create(brezinys=b, defaults={"force": force})
+    if created:
+        return job
+
+    if job.busena == PreviewJob.VYKDOMA:
+        if force:
+            PreviewJob.objects.filter(pk=job.pk).update(force=True, updated=timezone.now())
+            job.force = True
+        return job
+
+    if job.busena == PreviewJob.LAUKIA:
+        if force and not job.force:
+            PreviewJob.objects.filter(pk=job.pk).update(force=True, updated=timezone.now())
+            job.force = True
+        return job
+
+    job.busena = PreviewJob.LAUKIA
+    job.force = force
+    job.bandymai = 0
+    job.pranesimas = ""
+    job.worker = ""
+    job.pradeta = None
+    job.save()
+    return job
+
+
+def requeue_stale(now=None) -> int:
+    """
+    Pamestos (per ilgai vykdomos) užduotys grąžinamos į eilę. Tai irgi
+    bandymas: brėžinys, kuris worker'į numuša (OOM) ar pakabina, po
+    MAX_ATTEMPTS tampa 'klaida', o ne imamas ratu. Grąžina į eilę grąžintų skaičių.
+    """
+    now = now or timezone.now()
+    stale = PreviewJob.objects.filter(busena=PreviewJob.VYKDOMA, pradeta__lt=now - STALE_AFTER)
+    failed = stale.filter(bandymai__gte=MAX_ATTEMPTS - 1).update(
+        busena=PreviewJob.KLAIDA,
+        bandymai=F("bandymai") + 1,
+        pranesimas=f"Worker'is nebaigė per {STALE_AFTER} ({MAX_ATTEMPTS} kartus)",
+        worker="",
+        updated=now,
+    )
+    if failed:
+        logger.warning("%s preview job(s) failed after %s lost runs", failed, MAX_ATTEMPTS)
+    return stale.update(
+        busena=PreviewJob.LAUKIA, bandymai=F("bandymai") + 1, worker="", updated=now
+    )
+
+
+def claim_jobs(limit: int = DEFAULT_BATCH_SIZE, worker: Optional[str] = None) -> List[PreviewJob]:
+    """
+    Paima iki `limit` laukiančių užduočių šiam worker'iui. Keli worker'iai
+    nesidubliuoja: kur DB palaiko – SELECT ... FOR UPDATE SKIP LOCKED,
+    kitur (SQLite) – sąlyginis UPDATE ... WHERE busena='laukia' (laimi tas,
+    kurio UPDATE pakeitė eilutę).
+    """
+    worker = worker or worker_name()
+    now = timezone.now()
+
+    with transaction.atomic():
+        pending = PreviewJob.objects.filter(busena=PreviewJob.LAUKIA).order_by("created", "id")
+        if connection.features.has_select_for_update_skip_locked:
+            pending = pending.select_for_update(skip_locked=True)
+        ids = list(pending.values_list("id", flat=True)[:limit])
+        if not ids:
+            return []
+        PreviewJob.objects.filter(id__in=ids, busena=PreviewJob.LAUKIA).update(
+            busena=PreviewJob.VYKDOMA, worker=worker, pradeta=now, updated=now
+        )
+
+    return list(
+        PreviewJob.objects.filter(id__in=ids, busena=PreviewJob.VYKDOMA, worker=worker, pradeta=now)
+        .select_related("brezinys")
+    )
+
+
+def run_job(job: PreviewJob) -> PreviewResult:
+    """
+    Sugeneruoja vienos užduoties miniatiūrą ir įrašo rezultatą.
+    Išimtis -> bandoma dar kartą (iki MAX_ATTEMPTS), ok=False -> klaida iškart
+    (nepalaikomas / sugadintas failas nuo kartojimo nepasitaisys).
+    """
+    b = job.brezinys
+    try:
+        res = generate_preview_for_instance(b) if job.force else regenerate_missing_preview(b)
+    except Exception as e:
+        logger.exception("Preview job %s (brezinys id=%s) failed", job.pk, job.brezinys_id)
+        res = PreviewResult(ok=False, message=f"Klaida: {e}")
+        job.bandymai += 1
+        retry = job.bandymai < MAX_ATTEMPTS
+        job.busena = PreviewJob.LAUKIA if retry else PreviewJob.KLAIDA
+    else:
+        job.bandymai += 1
+        job.busena = PreviewJob.ATLIKTA if res.ok else PreviewJob.KLAIDA
+
+    job.pranesimas = (res.message or "")[:500]
+    job.worker = ""
+    # tik jei niekas neperėmė (pvz. requeue_stale + kitas worker'is)
+    ours = PreviewJob.objects.filter(pk=job.pk, busena=PreviewJob.VYKDOMA, pradeta=job.pradeta)
+    now = timezone.now()
+    saved = ours.filter(updated=job.updated).update(
+        busena=job.busena,
+        bandymai=job.bandymai,
+        pranesimas=job.pranesimas,
+        worker="",
+        force=False if job.busena == PreviewJob.ATLIKTA else job.force,
+        updated=now,
+    )
+    # vykdant atėjo enqueue_preview(force=True) -> šis rezultatas gali būti iš seno failo
+    if not saved and ours.update(busena=PreviewJob.LAUKIA, bandymai=0, worker="", force=True, updated=now):
+        job.busena = PreviewJob.LAUKIA
+        job.bandymai = 0
+        job.force = True
+    return res
+
+
+def process_batch(limit: int = DEFAULT_BATCH_SIZE, worker: Optional[str] = None) -> WorkerStats:
+    stats = WorkerStats()
+    for job in claim_jobs(limit, worker):
+        res = run_job(job)
+        if job.busena == PreviewJob.ATLIKTA:
+            stats.done += 1
+        elif job.busena == PreviewJob.LAUKIA:
+            stats.retried += 1
+        else:
+            stats.failed += 1
+            logger.info("Preview not generated for brezinys id=%s: %s", job.brezinys_id, res.message)
+    return stats
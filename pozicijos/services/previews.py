@@ -1,13 +1,15 @@
 # pozicijos/services/previews.py
 from __future__ import annotations
 import io
+import math
 import os
 from dataclasses import dataclass
-from typing import Optional
+from typing import List, Optional
 
+from django.conf import settings
 from django.core.files.base import ContentFile
 
-from PIL import Image
+from PIL import Image, TiffImagePlugin, features
 try:
     import fitz  # PyMuPDF
 except Exception:
@@ -17,10 +19,26 @@ from ..models import PozicijosBrezinys
 
 
 # Bendri parametrai
-THUMB_MAX_W = 1000   # generuojamo PNG maksimalus plotis (px)
-THUMB_MAX_H = 1000   # generuojamo PNG maksimalus aukštis (px)
-PDF_DPI = 144        # PDF rasterizavimo „dpi“ (~ kokybė vs. dydis)
-PNG_QUALITY = 85     # PNG kompresija (Pillow pats parinks tinkamai)
+PREVIEW_SIZES = (1000, 480, 160)  # variantų ilgesnė kraštinė (px), nuo didžiausio
+THUMB_MAX_W = PREVIEW_SIZES[0]    # didžiausio varianto plotis (px)
+THUMB_MAX_H = PREVIEW_SIZES[0]    # didžiausio varianto aukštis (px)
+PDF_DPI = 144        # PDF rasterizavimo „dpi“ viršutinė riba (mažiems lapams)
+WEBP_QUALITY = 80
+JPEG_QUALITY = 82
+WEBP_OK = features.check("webp")
+
+# Dekodavimo biudžetas (worker'io atminties lubos):
+#  - didesni nei MAX_PIXELS vaizdai atmetami (Pillow decompression-bomb riba pakeliama
+#    iki tiek tik _open_bounded viduje – globali Image.MAX_IMAGE_PIXELS nekeičiama);
+#  - išskleistas rastras vienu metu ne didesnis nei DECODE_BUDGET_MB
+#    (JPEG – draft, TIFF – juostomis, kiti per dideli – atmetami).
+MAX_PIXELS = getattr(settings, "POZICIJOS_PREVIEW_MAX_PIKSELIU", 500_000_000)
+DECODE_BUDGET_MB = getattr(settings, "POZICIJOS_PREVIEW_ATMINTIS_MB", 256)
+
+# Formatai, kuriems generuojama miniatiūra (kiti, pvz. STEP, rodomi su ikona)
+TIFF_EXTS = ("tif", "tiff")
+IMAGE_EXTS = ("jpg", "jpeg", "png", "webp", "bmp", "gif")
+PREVIEW_EXTS = ("pdf",) + TIFF_EXTS + IMAGE_EXTS
 
 @dataclass
 class PreviewResult:
@@ -29,53 +47,341 @@ class PreviewResult:
     saved_path: Optional[str] = None  # media relative path (pvz., pozicijos/.../previews/name.png)
 
 
-def _pil_to_png_bytes(img: Image.Image) -> bytes:
-    # konvertuojam į RGB (saugiau) ir sumažinam iki THUMB_MAX_*
-    if img.mode not in ("RGB", "L"):
-        img = img.convert("RGB")
-    img.thumbnail((THUMB_MAX_W, THUMB_MAX_H), Image.Resampling.LANCZOS)
-    buf = io.BytesIO()
-    img.save(buf, format="PNG", optimize=True)
-    return buf.getvalue()
+class PreviewTooLarge(Exception):
+    """Vaizdas viršija pikselių ar atminties biudžetą."""
+
+
+@dataclass
+class PreviewVariant:
+    width: int
+    height: int
+    jpeg: bytes
+    webp: Optional[bytes] = None
 
 
-def _save_preview(b: PozicijosBrezinys, png_bytes: bytes) -> PreviewResult:
-    rel = b._preview_relpath()  # pvz. pozicijos/breziniai/previews/<vardas>.png
+def _to_rgb(img: Image.Image) -> Image.Image:
+    # permatomumas -> baltas fonas (brėžiniai), kita – RGB
+    if img.mode in ("RGBA", "LA") or (img.mode == "P" and "transparency" in img.info):
+        img = img.convert("RGBA")
+        bg = Image.new("RGB", img.size, "white")
+        bg.paste(img, mask=img.getchannel("A"))
+        return bg
+    return img if img.mode == "RGB" else img.convert("RGB")
+
+
+def _encode_variants(img: Image.Image) -> List[PreviewVariant]:
+    """
+    PREVIEW_SIZES variantai (WebP + JPEG atsarginis), kiekvienas mažinamas iš
+    ankstesnio (didesnio), ne iš originalo. Didinimo nėra – mažas originalas
+    duoda vieną savo dydžio variantą.
+    """
+    img = _to_rgb(img)
+    img.thumbnail((THUMB_MAX_W, THUMB_MAX_H), Image.Resampling.LANCZOS, reducing_gap=3.0)
+
+    out: List[PreviewVariant] = []
+    current = img
+    for size in PREVIEW_SIZES:
+        if max(current.size) > size:
+            current = current.copy()
+            current.thumbnail((size, size), Image.Resampling.LANCZOS)
+        elif out:
+            continue  # šitas dydis jau padengtas (originalas mažesnis)
+
+        jpeg = io.BytesIO()
+        current.save(jpeg, format="JPEG", quality=JPEG_QUALITY, progressive=True)
+        webp = None
+        if WEBP_OK:
+            buf = io.BytesIO()
+            current.save(buf, format="WEBP", quality=WEBP_QUALITY, method=4)
+            webp = buf.getvalue()
+        out.append(PreviewVariant(current.width, current.height, jpeg.getvalue(), webp))
+    return out
+
+
+def _save_preview(b: PozicijosBrezinys, variants: List[PreviewVariant]) -> PreviewResult:
+    """
+    Įrašo variantus (previews/<vardas>_<id>_<plotis>.webp|jpg), preview = didžiausias
+    JPEG (jį naudoja ir pasiūlymo PDF), ištrina ankstesnius nebenaudojamus failus.
+    """
     storage = b.failas.storage
-    # užtikrinam katalogą (jei FileSystemStorage)
-    if hasattr(storage, "path"):
+    old_paths = b.preview_paths()
+
+    records = []
+    for v in variants:
+        rec = {"w": v.width, "h": v.height}
+        for key, data in (("webp", v.webp), ("jpg", v.jpeg)):
+            if data is None:
+                continue
+            rel = b._preview_relpath(v.width, key)
+            # jei buvo – perrašom
+            if storage.exists(rel):
+                storage.delete(rel)
+            rec[key] = storage.save(rel, ContentFile(data))
+        records.append(rec)
+
+    b.preview.name = records[0]["jpg"]
+    b.preview_variants = records
+    # išsaugom tik miniatiūrų laukus – kad neperrašytumėm kitų
+    b.save(update_fields=["preview", "preview_variants"])
+
+    for path in old_paths - b.preview_paths():
         try:
-            abs_path = storage.path(rel)
-            abs_folder = os.path.dirname(abs_path)
-            os.makedirs(abs_folder, exist_ok=True)
+            if storage.exists(path):
+                storage.delete(path)
         except Exception:
             pass
-    # įrašom
-    content = ContentFile(png_bytes)
-    # jei buvo – perrašom
-    if storage.exists(rel):
-        storage.delete(rel)
-    saved_name = storage.save(rel, content)
-
-    # sinchronizuojam su ImageField (kad būtų aiškus "source of truth")
+
+    return PreviewResult(ok=True, saved_path=b.preview.name)
+
+
+# =============================================================================
+#  Rastrų dekodavimas su atminties biudžetu
+# =============================================================================
+
+# TIFF žymos, rodančios į kitas failo vietas – juostos kopijoje nenaudojamos
+_TIFF_POINTER_TAGS = {273, 279, 324, 325, 330, 513, 514, 34665, 34853}
+_RAW_STRIP_ROWS = 64  # nesuspaustas vienos juostos TIFF skaidomas po tiek eilučių
+
+
+def _bytes_per_pixel(mode: str) -> int:
+    # Pillow viduje: 1/L/P – baitas, I;16 – du, kiti (RGB irgi) – keturi
+    if mode in ("1", "L", "P"):
+        return 1
+    return 2 if mode.startswith("I;16") else 4
+
+
+def _decoded_bytes(img: Image.Image) -> int:
+    return img.width * img.height * _bytes_per_pixel(img.mode)
+
+
+def _budget_bytes() -> int:
+    return DECODE_BUDGET_MB * 1024 * 1024
+
+
+def _check_pixels(img: Image.Image) -> None:
+    if img.width * img.height > MAX_PIXELS:
+        raise PreviewTooLarge(f"{img.width}×{img.height} px viršija {MAX_PIXELS} px ribą")
+
+
+def _reduce_factor(size) -> int:
+    # sveikas mažinimas iki ~2× didžiausio varianto (tolesnis – LANCZOS)
+    return max(1, max(size) // (2 * max(THUMB_MAX_W, THUMB_MAX_H)))
+
+
+def _reducible(img: Image.Image) -> Image.Image:
+    # Image.reduce palaiko ne visus režimus
+    if img.mode in ("L", "LA", "RGB", "RGBA", "I", "F"):
+        return img
+    if img.mode == "1":
+        return img.convert("L")
+    return _to_rgb(img)
+
+
+def _tiff_units(img: Image.Image):
+    """
+    TIFF pirmo kadro duomenys „vienetais“ (juosta arba tile'ų eilė):
+    (vieneto aukštis, [[(offset, baitai), ...] kiekvienam vienetui], tiled) arba None.
+    """
+    tags = img.tag_v2
+    if tags.get(284, 1) != 1 or tags.get(259, 1) == 6:  # atskiros plokštumos, OJPEG
+        return None
+    w, h = img.size
+    if 273 in tags:
+        unit_h, offsets, counts, per_unit = min(tags.get(278, h), h), tags[273], tags.get(279), 1
+    elif 324 in tags and tags.get(322) and tags.get(323):
+        unit_h, offsets, counts = tags[323], tags[324], tags.get(325)
+        per_unit = -(-w // tags[322])
+    else:
+        return None
+    if not counts or len(counts) != len(offsets) or len(offsets) % per_unit:
+        return None
+
+    if per_unit == 1 and len(offsets) == 1 and tags.get(259, 1) == 1 and h > _RAW_STRIP_ROWS:
+        # nesuspausta viena juosta – eilutės iš eilės, skaidom patys
+        bps = tags.get(258, (1,))
+        bits = bps[0] * tags.get(277, 1) if len(bps) == 1 else sum(bps)
+        row_bytes = -(-w * bits // 8)
+        unit_h = _RAW_STRIP_ROWS
+        parts = [
+            (offsets[0] + y * row_bytes, row_bytes * min(unit_h, h - y))
+            for y in range(0, h, unit_h)
+        ]
+        return unit_h, [[p] for p in parts], False
+
+    parts = list(zip(offsets, counts))
+    units = [parts[i:i + per_unit] for i in range(0, len(parts), per_unit)]
+    if len(units) * unit_h < h:
+        return None
+    return unit_h, units, per_unit > 1
+
+
+def _band_image(img: Image.Image, fp, parts, rows: int, unit_h: int, tiled: bool) -> Image.Image:
+    """
+    Atskira TIFF kopija tik šiai juostai (ta pati IFD, kitas aukštis ir
+    offset'ai, suspausti baitai nukopijuoti) – dekoduojama tik ji.
+    """
+    src = img.tag_v2
+    ifd = TiffImagePlugin.ImageFileDirectory_v2(prefix=src.prefix)
+    for tag, value in src.items():
+        if tag in _TIFF_POINTER_TAGS:
+            continue
+        ifd[tag] = value
+        ifd.tagtype[tag] = src.tagtype[tag]
+
+    data = []
+    for offset, count in parts:
+        fp.seek(offset)
+        data.append(fp.read(count))
+    rel, pos = [], 0
+    for chunk in data:
+        rel.append(pos)
+        pos += len(chunk)
+
+    ifd[257] = rows
+    off_tag, cnt_tag = (324, 325) if tiled else (273, 279)
+    ifd[cnt_tag] = tuple(len(c) for c in data)
+    ifd.tagtype[cnt_tag] = TiffImagePlugin.TiffTags.LONG
+    ifd[off_tag] = tuple(rel)
+    ifd.tagtype[off_tag] = TiffImagePlugin.TiffTags.LONG
+    if tiled:
+        # StripOffsets Pillow perstumia pats, TileOffsets – ne
+        end = 8 + len(ifd.tobytes(8))
+        ifd[off_tag] = tuple(end + r for r in rel)
+    else:
+        ifd[278] = unit_h
+
+    buf = io.BytesIO()
+    ifd.save(buf)
+    buf.write(b"".join(data))
+    buf.seek(0)
+    band = Image.open(buf)
+    band.load()
+    return band
+
+
+def _stream_tiff(img: Image.Image, fp) -> Optional[Image.Image]:
+    """
+    Didelis TIFF juostomis: kiekviena juosta dekoduojama atskirai, iškart
+    sumažinama (Image.reduce) ir įklijuojama į mažą drobę. Atmintyje vienu
+    metu – viena juosta (≤ pusė biudžeto) + sumažintas rezultatas.
+    None – jei failo struktūra juostoms netinka.
+    """
+    layout = _tiff_units(img)
+    if layout is None:
+        return None
+    unit_h, units, tiled = layout
+    w, h = img.size
+    factor = _reduce_factor(img.size)
+
+    max_rows = max(unit_h, (_budget_bytes() // 2) // max(1, w * _bytes_per_pixel(img.mode)))
+    step = factor // math.gcd(factor, unit_h)  # juostos aukštis – factor kartotinis (be siūlių)
+    per_band = max(step, (max_rows // unit_h) // step * step)
+
+    canvas = None
+    for i in range(0, len(units), per_band):
+        y0 = i * unit_h
+        if y0 >= h:
+            break
+        rows = min(per_band * unit_h, h - y0)
+        group = [p for unit in units[i:i + per_band] for p in unit]
+        band = _reducible(_band_image(img, fp, group, rows, unit_h, tiled))
+        if band.size[0] != w:
+            return None
+        small = band.reduce(factor) if factor > 1 else band
+        if canvas is None:
+            canvas = Image.new(small.mode, (-(-w // factor), -(-h // factor)), "white")
+        canvas.paste(small, (0, y0 // factor))
+        del band, small
+    return canvas
+
+
+def _open_bounded(fp, ext: str) -> Image.Image:
+    """
+    Atidaro vaizdą neviršydamas biudžeto: JPEG – draft (dekoduojama iškart
+    1/2…1/8 dydžiu), didelis TIFF – juostomis, kiti – tik jei telpa.
+    Kitaip – PreviewTooLarge.
+
+    Pillow decompression-bomb riba (Image.MAX_IMAGE_PIXELS) čia laikinai lygi
+    MAX_PIXELS – dideli brėžiniai tikrinami mūsų biudžetu; po to atstatoma.
+    """
+    saved = Image.MAX_IMAGE_PIXELS
+    Image.MAX_IMAGE_PIXELS = MAX_PIXELS
     try:
-        if getattr(b, "preview", None) is not None:
-            b.preview.name = saved_name
-            # išsaugom tik preview – kad neperrašytumėm kitų laukų
-            b.save(update_fields=["preview"])
-    except Exception:
-        # preview failas vis tiek yra storage'e – neblokuojam
-        pass
+        return _open_within_budget(fp, ext)
+    finally:
+        Image.MAX_IMAGE_PIXELS = saved
+
 
-    return PreviewResult(ok=True, saved_path=saved_name)
+def _open_within_budget(fp, ext: str) -> Image.Image:
+    fp.seek(0)
+    img = Image.open(fp)
+    _check_pixels(img)
+
+    if img.format == "JPEG":
+        # draft parenka didžiausią 1/2…1/8 mastelį, kuris dar ne mažesnis už prašomą dydį
+        scale = 2 * max(THUMB_MAX_W, THUMB_MAX_H) / max(img.size)
+        if scale < 1:
+            img.draft("RGB", (math.ceil(img.width * scale), math.ceil(img.height * scale)))
+
+    if ext in TIFF_EXTS:
+        try:
+            img.seek(0)  # pirmas kadras
+        except Exception:
+            pass
+        if _decoded_bytes(img) > _budget_bytes():
+            streamed = _stream_tiff(img, fp)
+            if streamed is not None:
+                return streamed
+
+    if _decoded_bytes(img) > _budget_bytes():
+        raise PreviewTooLarge(
+            f"{img.width}×{img.height} px ({_decoded_bytes(img) // 2**20} MB) "
+            f"viršija {DECODE_BUDGET_MB} MB dekodavimo biudžetą"
+        )
+    img.load()
+    return img
+
+
+def _open_pdf(b: PozicijosBrezinys):
+    """
+    PDF iš disko (storage.path) – PyMuPDF skaito tik reikalingas dalis;
+    storage be lokalaus kelio (S3 ir pan.) – per bytes.
+    """
+    try:
+        path = b.failas.storage.path(b.failas.name)
+    except NotImplementedError:
+        path = None
+    if path and os.path.exists(path):
+        return fitz.open(path, filetype="pdf")
+    with b.failas.open("rb") as f:
+        return fitz.open(stream=f.read(), filetype="pdf")
+
+
+def _render_pdf_page(b: PozicijosBrezinys) -> Optional[Image.Image]:
+    """
+    Pirmas puslapis iškart miniatiūros dydžiu: zoom skaičiuojamas iš page.rect
+    (ilgesnė kraštinė -> THUMB_MAX), bet ne daugiau nei PDF_DPI (maži lapai).
+    Pixmap'o baitai perduodami Pillow tiesiai, be PNG kodavimo / dekodavimo.
+    """
+    with _open_pdf(b) as doc:
+        if doc.page_count == 0:
+            return None
+        page = doc.load_page(0)
+        rect = page.rect  # pt, jau su puslapio pasukimu
+        longest = max(rect.width, rect.height) or 1.0
+        zoom = min(max(THUMB_MAX_W, THUMB_MAX_H) / longest, PDF_DPI / 72.0)
+        pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom), colorspace=fitz.csRGB, alpha=False)
+        # stride gali būti ne plotis*3 – perduodam Pillow raw dekoderiui
+        return Image.frombuffer("RGB", (pix.width, pix.height), pix.samples, "raw", "RGB", pix.stride, 1).copy()
 
 
 def generate_preview_for_instance(b: PozicijosBrezinys) -> PreviewResult:
     """
-    Sugeneruoja PNG 'preview' pagal b.failas:
-    - PDF -> pirmas puslapis per PyMuPDF (jei įdiegtas)
-    - TIFF (ir multi-page) -> pirmas kadras per Pillow
-    - Dideli JPEG/PNG ir pan. -> sumažinta kopija (nebūtina, bet naudinga)
+    Sugeneruoja miniatiūrų variantus (WebP + JPEG) pagal b.failas:
+    - PDF -> pirmas puslapis per PyMuPDF (jei įdiegtas), iškart miniatiūros dydžiu
+    - TIFF (ir multi-page) -> pirmas kadras per Pillow (didelis – juostomis)
+    - Dideli JPEG/PNG ir pan. -> sumažinta kopija (JPEG – draft režimu)
+    - Viršijus MAX_PIXELS / DECODE_BUDGET_MB – ok=False su priežastimi
     - Kitam (CAD ir pan.) – neatpažintas: grįžta ok=False (rodys fallback ikoną)
     """
     name_lower = (getattr(b.failas, "name", "") or "").lower()
@@ -90,63 +396,37 @@ def generate_preview_for_instance(b: PozicijosBrezinys) -> PreviewResult:
         if not fitz:
             return PreviewResult(ok=False, message="PyMuPDF neįdiegtas – PDF peržiūra negalima")
         try:
-            # skaitom iš failo
-            # Jei storage turi .path: naudoti path, kitaip – bytes
-            storage = b.failas.storage
-            stream = b.failas.open("rb").read()
-            doc = fitz.open(stream=stream, filetype="pdf")
-            if doc.page_count == 0:
+            img = _render_pdf_page(b)
+            if img is None:
                 return PreviewResult(ok=False, message="PDF tuščias")
-            page = doc.load_page(0)
-            zoom = PDF_DPI / 72.0  # 72pt bazinis
-            mat = fitz.Matrix(zoom, zoom)
-            pix = page.get_pixmap(matrix=mat, alpha=False)  # be alfa
-            png_bytes = pix.tobytes("png")
-            # dar kartą praleidžiam per Pillow, kad unifikuotume max dydį
-            img = Image.open(io.BytesIO(png_bytes))
-            png_bytes = _pil_to_png_bytes(img)
-            return _save_preview(b, png_bytes)
+            return _save_preview(b, _encode_variants(img))
         except Exception as e:
             return PreviewResult(ok=False, message=f"PDF preview klaida: {e}")
 
-    # TIFF
-    if ext in ("tif", "tiff"):
-        try:
-            b.failas.seek(0)
-            img = Image.open(b.failas)
-            try:
-                img.seek(0)  # pirmas kadras
-            except Exception:
-                pass
-            png_bytes = _pil_to_png_bytes(img)
-            return _save_preview(b, png_bytes)
-        except Exception as e:
-            return PreviewResult(ok=False, message=f"TIFF preview klaida: {e}")
-
-    # Standartiniai vaizdai (dideli) – galim sugeneruoti sumažintą preview
-    if ext in ("jpg", "jpeg", "png", "webp", "bmp", "gif"):
+    # TIFF (ir multi-page – pirmas kadras) bei standartiniai vaizdai
+    if ext in TIFF_EXTS or ext in IMAGE_EXTS:
+        label = "TIFF" if ext in TIFF_EXTS else "IMG"
         try:
-            b.failas.seek(0)
-            img = Image.open(b.failas)
-            # jei jau mažas – galima tiesiog praleisti; bet išlaikom vienodą kelią
-            png_bytes = _pil_to_png_bytes(img)
-            return _save_preview(b, png_bytes)
+            # img po _open_bounded jau dekoduotas – failą uždarom iškart, ne GC metu
+            with b.failas.open("rb") as fp:
+                img = _open_bounded(fp, ext)
+            return _save_preview(b, _encode_variants(img))
+        except (PreviewTooLarge, Image.DecompressionBombError) as e:
+            return PreviewResult(ok=False, message=f"Per didelis vaizdas: {e}")
+        except MemoryError:
+            return PreviewResult(ok=False, message=f"Nepakanka atminties: {label} dekodavimas viršijo ribą")
         except Exception as e:
-            return PreviewResult(ok=False, message=f"IMG preview klaida: {e}")
+            return PreviewResult(ok=False, message=f"{label} preview klaida: {e}")
 
     # Kiti formatai (pvz., CAD) – kol kas nepalaikom
     return PreviewResult(ok=False, message=f"Nepalaikomas formatas: .{ext}")
 
 
 def regenerate_missing_preview(b: PozicijosBrezinys) -> PreviewResult:
-    """Sugeneruoja, jei nėra. Jei yra – grįžta ok=True be veiksmų."""
-    try:
-        if getattr(b, "preview", None) and getattr(b.preview, "name", ""):
-            return PreviewResult(ok=True, message="Jau yra", saved_path=b.preview.name)
-    except Exception:
-        pass
-    storage = b.failas.storage
-    rel = b._preview_relpath()
-    if rel and storage.exists(rel):
-        return PreviewResult(ok=True, message="Jau yra", saved_path=rel)
+    """
+    Sugeneruoja, jei nėra variantų (ir seniems vieno PNG preview'ams).
+    Jei yra – grįžta ok=True be veiksmų.
+    """
+    if b.preview_variants and b.preview:
+        return PreviewResult(ok=True, message="Jau yra", saved_path=b.preview.name)
     return generate_preview_for_instance(b)
@@ -0,0 +1,99 @@
+# pozicijos/services/price_archive.py
+from __future__ import annotations
+
+from dataclasses import dataclass, field
+from datetime import timedelta
+from typing import List, Optional
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.utils import timezone
+
+from ..models import KainosEilute, KainosEiluteArchyvas
+from .list_cache import bump_data_version
+
+
+# Kiek dienų po paskutinio pakeitimo 'sena' eilutė dar laikoma karštoje lentelėje
+ARCHIVE_AFTER_DAYS = getattr(settings, "POZICIJOS_KAINOS_ARCHYVAS_DIENOS", 365)
+# SQLite IN (...) parametrų riba – viena partija telpa į vieną DELETE
+ARCHIVE_BATCH_SIZE = 900
+
+# Visi KainosEilute stulpeliai, kurie perkeliami (archyvuota nustatoma automatiškai)
+_COPY_FIELDS = tuple(
+    f.attname for f in KainosEiluteArchyvas._meta.concrete_fields if f.name != "archyvuota"
+)
+
+
+@dataclass
+class ArchiveResult:
+    moved: int = 0
+    batches: int = 0
+    pozicijos: List[int] = field(default_factory=list)
+
+
+def _delete_moved(ids: List[int]) -> None:
+    """
+    Perkeltų eilučių DELETE be ORM collector'iaus: QuerySet.delete() keltų
+    post_delete (kainų variklio / sąrašo invalidacija kiekvienai eilutei) ir
+    simple-history '-' įrašus. ids ≤ ARCHIVE_BATCH_SIZE – telpa į vieną užklausą.
+    """
+    table = connection.ops.quote_name(KainosEilute._meta.db_table)
+    placeholders = ", ".join(["%s"] * len(ids))
+    with connection.cursor() as cursor:
+        cursor.execute(f"DELETE FROM {table} WHERE id IN ({placeholders})", ids)
+
+
+def archive_candidates(days: Optional[int] = None):
+    """'sena' eilutės, nekeistos ilgiau nei `days` dienų."""
+    days = ARCHIVE_AFTER_DAYS if days is None else days
+    cutoff = timezone.now() - timedelta(days=days)
+    return KainosEilute.objects.filter(busena="sena", updated__lt=cutoff)
+
+
+def archive_old_lines(
+    days: Optional[int] = None,
+    *,
+    batch_size: int = ARCHIVE_BATCH_SIZE,
+    limit: Optional[int] = None,
+    dry_run: bool = False,
+) -> ArchiveResult:
+    """
+    Perkelia senas eilutes į KainosEiluteArchyvas partijomis (pk tvarka,
+    kiekviena partija – atskira transakcija: INSERT archyve + DELETE karštoje).
+
+    Trynimas – tiesioginis DELETE ... WHERE id IN (...) (_delete_moved): be
+    post_delete signalų ir '-' istorijos įrašų, nes eilutė neištrinama, o
+    perkeliama – '-' įrašas istorijoje rodytų ją kaip ištrintą. Istorija ir KainosIntervalas
+    periodai lieka (tas pats id), kainų variklis senų eilučių nenaudoja.
+    """
+    qs = archive_candidates(days).order_by("pk")
+    result = ArchiveResult()
+    if dry_run:
+        result.moved = qs.count() if limit is None else min(qs.count(), limit)
+        result.pozicijos = sorted(set(qs.values_list("pozicija_id", flat=True)[:limit]))
+        return result
+
+    touched = set()
+    last_pk = 0
+    batch_size = max(1, batch_size)
+    while limit is None or result.moved < limit:
+        size = batch_size if limit is None else min(batch_size, limit - result.moved)
+        with transaction.atomic():
+            rows = list(qs.filter(pk__gt=last_pk).values(*_COPY_FIELDS)[:size])
+            if not rows:
+                break
+            KainosEiluteArchyvas.objects.bulk_create(
+                [KainosEiluteArchyvas(**r) for r in rows], batch_size=500
+            )
+            ids = [r["id"] for r in rows]
+            _delete_moved(ids)
+
+        last_pk = ids[-1]
+        touched.update(r["pozicija_id"] for r in rows)
+        result.moved += len(rows)
+        result.batches += 1
+
+    if result.moved:
+        bump_data_version()
+    result.pozicijos = sorted(touched)
+    return result
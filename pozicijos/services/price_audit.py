@@ -0,0 +1,231 @@
+# pozicijos/services/price_audit.py
+from __future__ import annotations
+
+import heapq
+from collections import Counter
+from dataclasses import dataclass, field
+from datetime import date, timedelta
+from typing import Iterable, Iterator, List, Optional, Tuple
+
+from django.core.cache import cache
+from django.db.models import F
+
+from ..models import KainosEilute
+from .pricing import get_kainos_version
+
+
+KIND_OVERLAP = "overlap"
+KIND_GAP = "gap"
+KIND_INVERTED = "inverted"
+KIND_DUPLICATE_FIXED = "duplicate_fixed"
+
+KIND_LABELS = {
+    KIND_OVERLAP: "Persidengiantys intervalai",
+    KIND_GAP: "Tarpas tarp intervalų",
+    KIND_INVERTED: "Apverstas intervalas (nuo > iki)",
+    KIND_DUPLICATE_FIXED: "Pasikartojantis fiksuotas kiekis",
+}
+
+_FIELDS = (
+    "id", "pozicija_id", "matas", "yra_fiksuota", "fiksuotas_kiekis",
+    "kiekis_nuo", "kiekis_iki", "galioja_nuo", "galioja_iki",
+)
+
+# Kešuoto katalogo audito galiojimas (s); anksčiau – jei pasikeitė kainų versija
+AUDIT_CACHE_TIMEOUT = 600
+
+_NEG_INF = float("-inf")
+_POS_INF = float("inf")
+
+
+@dataclass(frozen=True)
+class AuditIssue:
+    kind: str
+    pozicija_id: int
+    matas: str
+    line_ids: Tuple[int, ...]
+    detail: str
+
+    @property
+    def label(self) -> str:
+        return KIND_LABELS.get(self.kind, self.kind)
+
+
+@dataclass
+class AuditResult:
+    lines: int = 0
+    issues: List[AuditIssue] = field(default_factory=list)
+    counts: Counter = field(default_factory=Counter)
+
+    def add(self, issue: AuditIssue) -> None:
+        self.issues.append(issue)
+        self.counts[issue.kind] += 1
+
+
+def _dates_overlap(a: dict, b: dict) -> bool:
+    a_start = a["galioja_nuo"] or date.min
+    a_end = a["galioja_iki"] or date.max
+    b_start = b["galioja_nuo"] or date.min
+    b_end = b["galioja_iki"] or date.max
+    return a_start <= b_end and b_start <= a_end
+
+
+def _fmt(v) -> str:
+    return "∞" if v in (None, _POS_INF, _NEG_INF) else str(v)
+
+
+def _fmt_date(d: date) -> str:
+    return "…" if d in (date.min, date.max) else d.isoformat()
+
+
+def _validity_segments(rows: List[dict]) -> Iterator[Tuple[date, date, List[dict]]]:
+    """
+    Galiojimo laikotarpis suskaldomas ties visų eilučių galioja_nuo / galioja_iki
+    ribomis: kiekvienoje atkarpoje galioja vienas ir tas pats eilučių rinkinys
+    (rows tvarka išlaikoma). Dažniausiai visų eilučių langas tas pats – viena atkarpa.
+    """
+    bounds = {r["galioja_nuo"] or date.min for r in rows}
+    bounds.update(r["galioja_iki"] + timedelta(days=1) for r in rows if r["galioja_iki"] and r["galioja_iki"] < date.max)
+    bounds = sorted(bounds)
+    for i, start in enumerate(bounds):
+        end = bounds[i + 1] - timedelta(days=1) if i + 1 < len(bounds) else date.max
+        active = [
+            r for r in rows
+            if (r["galioja_nuo"] or date.min) <= start and (r["galioja_iki"] or date.max) >= start
+        ]
+        if active:
+            yield start, end, active
+
+
+def _find_gaps(intervals: List[Tuple[float, float, dict]], pozicija_id: int, matas: str, result: AuditResult) -> None:
+    """
+    Tarpai tarp intervalų – atskirai kiekvienai galiojimo atkarpai (eilutės, kurios
+    vienu metu negalioja, viena kitos tarpų neuždengia). intervals – (pradžia, pabaiga, eilutė),
+    surikiuoti pagal pradžią. Tas pats tarpas keliose atkarpose – viena problema.
+    """
+    seen = set()
+    segments = list(_validity_segments([r for _s, _e, r in intervals]))
+    for seg_start, seg_end, active in segments:
+        ids = {r["id"] for r in active}
+        coverage_end: Optional[float] = None
+        for start, end, r in intervals:
+            if r["id"] not in ids:
+                continue
+            if coverage_end is not None and start > coverage_end + 1 and (r["id"], coverage_end) not in seen:
+                seen.add((r["id"], coverage_end))
+                when = "" if len(segments) == 1 else f" ({_fmt_date(seg_start)} – {_fmt_date(seg_end)})"
+                result.add(AuditIssue(
+                    KIND_GAP, pozicija_id, matas, (r["id"],),
+                    f"nėra kainos kiekiams {_fmt(coverage_end + 1)}–{_fmt(start - 1)}{when}",
+                ))
+            coverage_end = end if coverage_end is None else max(coverage_end, end)
+
+
+def _sweep_group(rows: List[dict], result: AuditResult) -> None:
+    """
+    Viena (pozicija, matas) grupė, jau surikiuota DB pusėje
+    (fiksuotos pagal kiekį, intervalinės pagal kiekis_nuo NULLS FIRST).
+    Fiksuotoms – kiekviena eilutė lyginama su visomis ankstesnėmis to paties
+    kiekio eilutėmis (ne tik paskutine: A ir C gali persidengti, nors B – su niekuo).
+    Intervalams – sweep su "atvirų" intervalų heap'u pagal pabaigą: pasibaigę
+    (pabaiga < dabartinės pradžios) išmetami nuo viršaus, persidengimai
+    tikrinami tik su likusiais – rikiavimas O(n log n) + O(log n) eilutei
+    (atvirų paprastai 0–1). Tarpai – _find_gaps pagal galiojimo atkarpas.
+    """
+    pozicija_id, matas = rows[0]["pozicija_id"], rows[0]["matas"]
+
+    same_qty: List[dict] = []  # ankstesnės fiksuotos eilutės su tuo pačiu kiekiu
+    open_: List[Tuple[float, int, dict]] = []  # heap (pabaiga, id, eilutė)
+    intervals: List[Tuple[float, float, dict]] = []
+
+    for r in rows:
+        if r["yra_fiksuota"]:
+            if same_qty and same_qty[0]["fiksuotas_kiekis"] != r["fiksuotas_kiekis"]:
+                same_qty = []
+            for other in same_qty:
+                if _dates_overlap(other, r):
+                    result.add(AuditIssue(
+                        KIND_DUPLICATE_FIXED, pozicija_id, matas, (other["id"], r["id"]),
+                        f"kiekis {r['fiksuotas_kiekis']}",
+                    ))
+            same_qty.append(r)
+            continue
+
+        start = _NEG_INF if r["kiekis_nuo"] is None else r["kiekis_nuo"]
+        end = _POS_INF if r["kiekis_iki"] is None else r["kiekis_iki"]
+        if start > end:
+            result.add(AuditIssue(
+                KIND_INVERTED, pozicija_id, matas, (r["id"],),
+                f"{_fmt(r['kiekis_nuo'])} > {_fmt(r['kiekis_iki'])}",
+            ))
+            continue
+
+        while open_ and open_[0][0] < start:
+            heapq.heappop(open_)
+        for _e, _id, other in open_:
+            if _dates_overlap(other, r):
+                result.add(AuditIssue(
+                    KIND_OVERLAP, pozicija_id, matas, (other["id"], r["id"]),
+                    f"[{_fmt(other['kiekis_nuo'])}–{_fmt(other['kiekis_iki'])}] ∩ "
+                    f"[{_fmt(r['kiekis_nuo'])}–{_fmt(r['kiekis_iki'])}]",
+                ))
+        heapq.heappush(open_, (end, r["id"], r))
+        intervals.append((start, end, r))
+
+    if len(intervals) > 1:
+        _find_gaps(intervals, pozicija_id, matas, result)
+
+
+def _grouped(rows: Iterable[dict]) -> Iterator[List[dict]]:
+    group: List[dict] = []
+    key = None
+    for r in rows:
+        k = (r["pozicija_id"], r["matas"])
+        if k != key and group:
+            yield group
+            group = []
+        key = k
+        group.append(r)
+    if group:
+        yield group
+
+
+def audit_price_lines(busena: str = "aktuali", pozicija_ids: Optional[Iterable[int]] = None) -> AuditResult:
+    """
+    Vienas surikiuotas query per visas (aktualias) eilutes + vienas perėjimas
+    grupėmis (pozicija, matas): persidengimai, tarpai, apversti intervalai,
+    pasikartojantys fiksuoti kiekiai. Tarpai tik tarp intervalų (ne prieš
+    pirmą / po paskutinio – ten veikia fallback).
+    """
+    qs = KainosEilute.objects.filter(busena=busena)
+    if pozicija_ids is not None:
+        qs = qs.filter(pozicija_id__in=list(pozicija_ids))
+    rows = qs.order_by(
+        "pozicija_id",
+        "matas",
+        "-yra_fiksuota",
+        "fiksuotas_kiekis",
+        F("kiekis_nuo").asc(nulls_first=True),
+        F("kiekis_iki").asc(nulls_last=True),
+        "id",
+    ).values(*_FIELDS)
+
+    result = AuditResult()
+    for group in _grouped(rows.iterator(chunk_size=5000)):
+        result.lines += len(group)
+        _sweep_group(group, result)
+    return result
+
+
+def cached_catalogue_audit(refresh: bool = False) -> AuditResult:
+    """
+    Viso katalogo aktualių eilučių auditas, kešuotas pagal kainų versiją
+    (pricing.KAINOS_VERSION_KEY – bendra procesams): kol kainos nesikeitė,
+    puslapio atidarymas audito nekartoja. refresh=True – perskaičiuoti dabar.
+    """
+    key = f"pozicijos:kainos_audit:v{get_kainos_version()}"
+    result = None if refresh else cache.get(key)
+    if result is None:
+        result = audit_price_lines()
+        cache.set(key, result, AUDIT_CACHE_TIMEOUT)
+    return result
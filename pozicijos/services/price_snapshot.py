@@ -0,0 +1,206 @@
+# pozicijos/services/price_snapshot.py
+from __future__ import annotations
+
+import threading
+import weakref
+from collections import defaultdict
+from datetime import date, timedelta
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from django.db import DEFAULT_DB_ALIAS, transaction
+from django.db.models import QuerySet
+from django.utils import timezone
+
+from ..models import KainosEilute, KainosEiluteArchyvas, KainosIntervalas
+
+
+# Atviri galiojimo galai lentelėje saugomi kaip kraštinės datos (ne NULL)
+OPEN_START = date.min
+OPEN_END = date.max
+
+# SQLite IN (...) parametrų riba
+_CHUNK = 900
+
+
+def _band_key(line: KainosEilute) -> tuple:
+    """Kiekio juosta: fiksuotai – (kiekis, kiekis), intervalinei – (nuo, iki)."""
+    if line.yra_fiksuota:
+        return (line.matas, True, line.fiksuotas_kiekis, line.fiksuotas_kiekis)
+    return (line.matas, False, line.kiekis_nuo, line.kiekis_iki)
+
+
+def _demotion_dates(line_ids: List[int]) -> Dict[int, date]:
+    """
+    SENOMS eilutėms – diena, kurią jos paskutinį kartą tapo 'sena'
+    (pirmas 'sena' istorijos įrašas po paskutinio 'aktuali'). Vienas query į istoriją.
+    """
+    out: Dict[int, date] = {}
+    for i in range(0, len(line_ids), _CHUNK):
+        rows = (
+            KainosEilute.history
+            .filter(id__in=line_ids[i:i + _CHUNK])
+            .order_by("id", "history_date", "history_id")
+            .values_list("id", "busena", "history_date")
+        )
+        state: Dict[int, Tuple[bool, Optional[date]]] = {}
+        for pk, busena, when in rows:
+            was_active, demoted = state.get(pk, (False, None))
+            if busena == "aktuali":
+                state[pk] = (True, None)
+            elif was_active and demoted is None:
+                state[pk] = (True, timezone.localdate(when))
+        out.update({pk: d for pk, (_a, d) in state.items() if d is not None})
+    return out
+
+
+def _effective_span(line: KainosEilute, demoted_on: Dict[int, date]) -> Optional[Tuple[date, date]]:
+    start = line.galioja_nuo or OPEN_START
+    end = line.galioja_iki or OPEN_END
+    if line.busena not in ("aktuali", "laukianti"):
+        # sena eilutė galiojo tik iki pasenimo (jei istorijoje to nėra – nelaikom efektyvia)
+        when = demoted_on.get(line.pk)
+        if when is None:
+            return None
+        end = min(end, when - timedelta(days=1))
+    if end < start:
+        return None
+    return start, end
+
+
+def _rank(line: KainosEilute) -> tuple:
+    # aktuali / laukianti prieš seną, tada mažesnis prioritetas, tada naujesnė
+    return (line.busena not in ("aktuali", "laukianti"), line.prioritetas, -line.created.timestamp(), -line.pk)
+
+
+def build_intervals(lines: Iterable[KainosEilute], demoted_on: Dict[int, date]) -> List[KainosIntervalas]:
+    """
+    Vienos ar kelių pozicijų eilutės -> nepersidengiantys efektyvūs periodai
+    kiekvienoje (pozicija, matas, juosta). Laiko ašis suskaidoma ties visų
+    eilučių pradžiomis / pabaigomis; kiekvienam gabalui laimi geriausio rango
+    eilutė, vienodi gretimi gabalai sujungiami.
+    """
+    groups: Dict[tuple, List[Tuple[date, date, KainosEilute]]] = defaultdict(list)
+    for line in lines:
+        span = _effective_span(line, demoted_on)
+        if span is not None:
+            groups[(line.pozicija_id, *_band_key(line))].append((span[0], span[1], line))
+
+    out: List[KainosIntervalas] = []
+    for (pozicija_id, matas, fiks, nuo, iki), spans in groups.items():
+        cuts = sorted(
+            {s for s, _e, _l in spans}
+            | {e + timedelta(days=1) for _s, e, _l in spans if e < OPEN_END}
+        )
+        current: Optional[KainosIntervalas] = None
+        for idx, seg_start in enumerate(cuts):
+            seg_end = cuts[idx + 1] - timedelta(days=1) if idx + 1 < len(cuts) else OPEN_END
+            covering = [l for s, e, l in spans if s <= seg_start and e >= seg_end]
+            if not covering:
+                current = None
+                continue
+            winner = min(covering, key=_rank)
+            if current is not None and current.kainos_eilute_id == winner.pk:
+                current.galioja_iki = seg_end
+                continue
+            current = KainosIntervalas(
+                pozicija_id=pozicija_id,
+                kainos_eilute_id=winner.pk,
+                matas=matas,
+                yra_fiksuota=fiks,
+                kiekis_nuo=nuo,
+                kiekis_iki=iki,
+                galioja_nuo=seg_start,
+                galioja_iki=seg_end,
+                kaina=winner.kaina,
+                prioritetas=winner.prioritetas,
+            )
+            out.append(current)
+    return out
+
+
+@transaction.atomic
+def rebuild_snapshot(pozicija_ids: Iterable[int]) -> int:
+    """
+    Perkuria nurodytų pozicijų periodus (iš karštos lentelės ir archyvo).
+    Grąžina sukurtų eilučių skaičių.
+    """
+    ids = sorted(set(pozicija_ids))
+    created = 0
+    for i in range(0, len(ids), _CHUNK):
+        chunk = ids[i:i + _CHUNK]
+        lines = list(KainosEilute.objects.filter(pozicija_id__in=chunk).order_by())
+        # archyvuotos (tik 'sena') eilutės – tie patys laukai ir id, praeities periodams
+        lines += KainosEiluteArchyvas.objects.filter(pozicija_id__in=chunk).order_by()
+        sena_ids = [l.pk for l in lines if l.busena not in ("aktuali", "laukianti")]
+        intervals = build_intervals(lines, _demotion_dates(sena_ids))
+        KainosIntervalas.objects.filter(pozicija_id__in=chunk).delete()
+        KainosIntervalas.objects.bulk_create(intervals, batch_size=500)
+        created += len(intervals)
+    return created
+
+
+class _SnapshotRebuild:
+    """on_commit callback'as; kaupia visas transakcijoje paliestas pozicijas."""
+
+    def __init__(self):
+        self.ids: Set[int] = set()
+        self.done = False
+
+    def __call__(self):
+        self.done = True
+        rebuild_snapshot(self.ids)
+
+
+# Laukiantis callback'as kiekvienam DB alias'ui (šiai gijai). Tik weakref: stipriai
+# jį laiko tik Django on_commit sąrašas, todėl atšaukus (sub)transakciją, kurioje
+# jis užregistruotas, callback'as su savo id aibe dingsta ir čia – kitas kvietimas
+# registruoja naują, o ne prideda id prie išmesto. Jei atšaukiamas tik vidinis
+# savepoint'as, o callback'as išorinis – tų pozicijų periodai tiesiog perkuriami
+# dar kartą (nekenksminga).
+_pending = threading.local()
+
+
+def schedule_snapshot_rebuild(pozicija_id: Optional[int], using: Optional[str] = None) -> None:
+    """
+    Pozicijos periodai perkuriami po commit'o – vieną kartą transakcijai,
+    kiek eilučių joje bepasikeistų (formset'as, set_aktuali_batch ir pan.).
+    Be transakcijos (autocommit) – iškart.
+    """
+    if pozicija_id is None:
+        return
+    alias = using or DEFAULT_DB_ALIAS
+    refs = getattr(_pending, "callbacks", None)
+    if refs is None:
+        refs = _pending.callbacks = {}
+
+    ref = refs.get(alias)
+    callback = ref() if ref is not None else None
+    if callback is None or callback.done:
+        callback = _SnapshotRebuild()
+        callback.ids.add(pozicija_id)
+        refs[alias] = weakref.ref(callback)
+        transaction.on_commit(callback, using=alias)
+    else:
+        callback.ids.add(pozicija_id)
+
+
+def prices_as_of(
+    as_of: date,
+    pozicijos: Optional[QuerySet] = None,
+    matas: Optional[str] = None,
+    qty: Optional[int] = None,
+) -> QuerySet[KainosIntervalas]:
+    """
+    Kainos, galiojusios datai as_of (pvz. visoms kliento pozicijoms:
+    prices_as_of(d, Pozicija.objects.filter(klientas=...))).
+    Su qty – tik juostos, į kurias kiekis patenka (fiksuotos pirmiau, tada prioritetas).
+    """
+    qs = KainosIntervalas.objects.filter(galioja_nuo__lte=as_of, galioja_iki__gte=as_of)
+    if pozicijos is not None:
+        qs = qs.filter(pozicija__in=pozicijos.values("pk"))
+    if matas:
+        qs = qs.filter(matas=matas)
+    if qty is not None:
+        qs = qs.exclude(kiekis_nuo__gt=qty).exclude(kiekis_iki__lt=qty)
+        return qs.order_by("pozicija_id", "matas", "-yra_fiksuota", "prioritetas")
+    return qs.order_by("pozicija_id", "matas", "kiekis_nuo")
@@ -0,0 +1,292 @@
+# pozicijos/services/pricing.py
+from __future__ import annotations
+
+import threading
+import time
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, List, NamedTuple, Optional
+
+from django.conf import settings
+from django.db import transaction
+
+from ..models import KainosEilute
+from . import versions
+
+
+# Kainos sprendimo taisyklės (tos pačios kaip services/kainos.find_for_qty iki variklio):
+#  - tik galiojančios eilutės: šiandien – busena='aktuali', su as_of – aktuali /
+#    laukianti, galiojanti tą dieną; 'sena' eilutės nekainuojamos;
+#  - matas privalomas ir lyginamas tiksliai – kaina grąžinama tik tame mate;
+#  - pirma fiksuotas kiekis, tada intervalas; eilutė be abiejų kiekio ribų –
+#    intervalas be ribų (tinka bet kuriam kiekiui);
+#  - keli kandidatai – mažesnis prioritetas, tada naujesnė (created, id);
+#  - fallback=True – jei nei fiksuota, nei intervalas netiko, pirma eilutė su kaina.
+# Senas Pozicija.get_kaina_for_qty ėjo per visas eilutes (ir senas), mato nežiūrėjo,
+# o eilutes be kiekio ribų praleisdavo – dabar jis kviečia šį variklį.
+
+# Matas, kai užklausoje jis nenurodytas (kaip kainų formos numatytasis, forms_kainos.MATAS_CHOICES)
+DEFAULT_MATAS = "Vnt."
+
+# Kainų eilučių versija (atskirai nuo sąrašo versijos – Pozicija įrašymai
+# sukompiliuotų kainų neįtakoja). Laikoma DB (services/versions.py), kad
+# kitų procesų (worker'ių, kainu_galiojimas, admin) pakeitimai būtų matomi.
+KAINOS_VERSION_KEY = versions.KAINOS
+
+# Atsarginis sukompiliuotų kainų galiojimas (s) – pakeitimams, kurie versijos
+# nepadidino (pvz. ranka per SQL ar QuerySet.update be invalidate_pozicija_prices)
+ENGINE_TTL_SECONDS = getattr(settings, "POZICIJOS_KAINOS_ENGINE_TTL", 300)
+
+# SQLite IN (...) parametrų riba – pozicijų id traukiam gabalais
+_FETCH_CHUNK = 900
+
+# Kiek pozicijų laikom sukompiliuotų viename procese; viršijus – išvalom
+MAX_COMPILED_POSITIONS = 50_000
+
+# Būsenos, kurios gali galioti (models.KainosEilute.busena): 'laukianti' – tik
+# užklausoms su as_of, šiandienai užtenka 'aktuali' (žr. kainos.current_lines_q)
+LIVE_BUSENOS = ("aktuali", "laukianti")
+
+REASON_FIXED = "fixed"
+REASON_INTERVAL = "interval"
+REASON_FALLBACK = "fallback"
+
+
+class QuoteRequest(NamedTuple):
+    pozicija_id: int
+    qty: Optional[int]
+    matas: str
+    as_of: Optional[date] = None  # None – šiandien (tik busena='aktuali', be datų)
+
+
+@dataclass(frozen=True)
+class QuoteResult:
+    pozicija_id: int
+    qty: Optional[int]
+    matas: str
+    kaina: Optional[Decimal] = None
+    line_id: Optional[int] = None
+    reason: Optional[str] = None  # fixed / interval / fallback / None (nerasta)
+
+    @property
+    def found(self) -> bool:
+        return self.line_id is not None
+
+
+@dataclass(frozen=True)
+class _Line:
+    id: int
+    kaina: Optional[Decimal]
+    kiekis_nuo: Optional[int]
+    kiekis_iki: Optional[int]
+    galioja_nuo: Optional[date]
+    galioja_iki: Optional[date]
+    aktuali: bool
+
+    def usable(self, as_of: Optional[date]) -> bool:
+        return self.aktuali if as_of is None else self.valid_on(as_of)
+
+    def valid_on(self, d: date) -> bool:
+        return (self.galioja_nuo is None or self.galioja_nuo <= d) and (
+            self.galioja_iki is None or self.galioja_iki >= d
+        )
+
+    def covers(self, qty: int) -> bool:
+        return (self.kiekis_nuo is None or self.kiekis_nuo <= qty) and (
+            self.kiekis_iki is None or qty <= self.kiekis_iki
+        )
+
+
+@dataclass
+class _Group:
+    """Vieno mato eilutės; kiekvienas sąrašas – pagal (prioritetas, -created)."""
+    fixed: Dict[int, List[_Line]] = field(default_factory=dict)
+    intervals: List[_Line] = field(default_factory=list)
+    ordered: List[_Line] = field(default_factory=list)
+
+    def resolve(self, qty: Optional[int], as_of: Optional[date], fallback: bool):
+        if qty is not None:
+            for line in self.fixed.get(qty, ()):
+                if line.usable(as_of):
+                    return line, REASON_FIXED
+            for line in self.intervals:
+                if line.covers(qty) and line.usable(as_of):
+                    return line, REASON_INTERVAL
+        if fallback:
+            for line in self.ordered:
+                if line.kaina is not None and line.usable(as_of):
+                    return line, REASON_FALLBACK
+        return None, None
+
+
+@dataclass
+class CompiledPrices:
+    by_matas: Dict[str, _Group] = field(default_factory=dict)
+
+
+_LINE_FIELDS = (
+    "id", "pozicija_id", "kaina", "matas", "yra_fiksuota", "fiksuotas_kiekis",
+    "kiekis_nuo", "kiekis_iki", "galioja_nuo", "galioja_iki", "busena",
+)
+
+
+def compile_rows(rows: Iterable[dict]) -> Dict[int, CompiledPrices]:
+    """
+    Aktualios / laukiančios eilutės (dict'ai iš values(), surikiuoti pagal prioritetas, -created)
+    -> {pozicija_id: CompiledPrices}. Tvarka ta pati kaip services/kainos.find_for_qty:
+    pirma fiksuotas kiekis, tada intervalas, laimi mažesnis prioritetas / naujesnė.
+    """
+    out: Dict[int, CompiledPrices] = {}
+    for r in rows:
+        compiled = out.setdefault(r["pozicija_id"], CompiledPrices())
+        line = _Line(
+            id=r["id"],
+            kaina=r["kaina"],
+            kiekis_nuo=r["kiekis_nuo"],
+            kiekis_iki=r["kiekis_iki"],
+            galioja_nuo=r["galioja_nuo"],
+            galioja_iki=r["galioja_iki"],
+            aktuali=r["busena"] == "aktuali",
+        )
+        group = compiled.by_matas.setdefault(r["matas"] or "", _Group())
+        group.ordered.append(line)
+        if r["yra_fiksuota"]:
+            if r["fiksuotas_kiekis"] is not None:
+                group.fixed.setdefault(r["fiksuotas_kiekis"], []).append(line)
+        else:
+            group.intervals.append(line)
+    return out
+
+
+def fetch_compiled(pozicija_ids: Iterable[int]) -> Dict[int, CompiledPrices]:
+    ids = list(pozicija_ids)
+    out: Dict[int, CompiledPrices] = {}
+    for i in range(0, len(ids), _FETCH_CHUNK):
+        rows = (
+            KainosEilute.objects
+            .filter(pozicija_id__in=ids[i:i + _FETCH_CHUNK], busena__in=LIVE_BUSENOS)
+            .order_by("pozicija_id", "prioritetas", "-created", "-id")
+            .values(*_LINE_FIELDS)
+        )
+        out.update(compile_rows(rows))
+    # pozicijos be aktualių kainų – irgi kešuojam (tuščios)
+    for pid in ids:
+        out.setdefault(pid, CompiledPrices())
+    return out
+
+
+def get_kainos_version() -> int:
+    return versions.get_version(KAINOS_VERSION_KEY)
+
+
+def bump_kainos_version() -> int:
+    """Padidina ir grąžina naują versiją (vienoje transakcijoje – be kitų procesų įsiterpimo)."""
+    with transaction.atomic():
+        versions.bump_version(KAINOS_VERSION_KEY)
+        return versions.get_version(KAINOS_VERSION_KEY)
+
+
+class PriceEngine:
+    """
+    Procese laikomos sukompiliuotos kainos. Vienas quote_many() kvietimas
+    trūkstamas pozicijas užkrauna vienu query (gabalais po _FETCH_CHUNK),
+    o visa kita – atmintyje. Kešas išvalomas, kai pasikeičia KAINOS_VERSION_KEY
+    (bendra visiems procesams) arba praėjus ENGINE_TTL_SECONDS.
+    """
+
+    def __init__(self):
+        self._compiled: Dict[int, CompiledPrices] = {}
+        self._version: Optional[int] = None
+        self._loaded_at = 0.0
+        self._lock = threading.Lock()
+
+    def _reset(self, version: int) -> None:
+        # kviečiama su self._lock
+        self._compiled.clear()
+        self._version = version
+        self._loaded_at = time.monotonic()
+
+    def invalidate(self, pozicija_id: Optional[int] = None) -> None:
+        """
+        Pozicijos kainos pasikeitė šiame procese: padidinam bendrą versiją
+        (kiti procesai išsivalys viską), o čia išmetam tik tą vieną poziciją.
+        Be pozicija_id – viską (pvz. po QuerySet.update()).
+        """
+        self.forget(pozicija_id, bump_kainos_version())
+
+    def forget(self, pozicija_id: Optional[int], version: int) -> None:
+        """
+        Versija jau padidinta (invalidate arba signalas, didinantis kelis raktus
+        vienu UPDATE): išmetama tik ta pozicija, jei tarp mūsų ir šio pakeitimo
+        kitų nebuvo, kitaip – viskas.
+        """
+        with self._lock:
+            if pozicija_id is None or self._version != version - 1:
+                self._reset(version)
+            else:
+                self._compiled.pop(pozicija_id, None)
+                self._version = version
+
+    def _ensure(self, pozicija_ids: Iterable[int]) -> Dict[int, CompiledPrices]:
+        """Grąžina {pozicija_id: CompiledPrices} prašytoms pozicijoms (trūkstamas užkrauna)."""
+        version = get_kainos_version()
+        with self._lock:
+            if version != self._version or time.monotonic() - self._loaded_at > ENGINE_TTL_SECONDS:
+                self._reset(version)
+            out = {pid: self._compiled[pid] for pid in pozicija_ids if pid in self._compiled}
+        missing = [pid for pid in pozicija_ids if pid not in out]
+        if missing:
+            fetched = fetch_compiled(sorted(missing))
+            out.update(fetched)
+            with self._lock:
+                if len(self._compiled) + len(fetched) > MAX_COMPILED_POSITIONS:
+                    self._compiled.clear()
+                self._compiled.update(fetched)
+        return out
+
+    def quote_many(self, items: Iterable, fallback: bool = True) -> List[QuoteResult]:
+        """
+        items – QuoteRequest arba (pozicija_id, qty, matas[, as_of]) tuple'ai.
+        Grąžina QuoteResult sąrašą ta pačia tvarka.
+        """
+        reqs = [it if isinstance(it, QuoteRequest) else QuoteRequest(*it) for it in items]
+        compiled = self._ensure({r.pozicija_id for r in reqs})
+
+        results: List[QuoteResult] = []
+        for r in reqs:
+            prices = compiled.get(r.pozicija_id)
+            line = reason = None
+            if prices is not None:
+                group = prices.by_matas.get(r.matas)
+                if group is not None:
+                    line, reason = group.resolve(r.qty, r.as_of, fallback)
+            results.append(QuoteResult(
+                pozicija_id=r.pozicija_id,
+                qty=r.qty,
+                matas=r.matas,
+                kaina=line.kaina if line else None,
+                line_id=line.id if line else None,
+                reason=reason,
+            ))
+        return results
+
+    def quote(self, pozicija_id: int, qty: Optional[int], matas: str,
+              as_of: Optional[date] = None, fallback: bool = True) -> QuoteResult:
+        return self.quote_many([QuoteRequest(pozicija_id, qty, matas, as_of)], fallback=fallback)[0]
+
+
+engine = PriceEngine()
+
+
+def invalidate_pozicija_prices(pozicija_id: Optional[int] = None) -> None:
+    engine.invalidate(pozicija_id)
+
+
+def quote_many(items: Iterable, fallback: bool = True) -> List[QuoteResult]:
+    return engine.quote_many(items, fallback=fallback)
+
+
+def quote(pozicija_id: int, qty: Optional[int], matas: str,
+          as_of: Optional[date] = None, fallback: bool = True) -> QuoteResult:
+    return engine.quote(pozicija_id, qty, matas, as_of, fallback)
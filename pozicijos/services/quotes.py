@@ -0,0 +1,190 @@
+# pozicijos/services/quotes.py
+from __future__ import annotations
+
+import csv
+import io
+import json
+from dataclasses import dataclass, field
+from datetime import date
+from decimal import Decimal
+from typing import Dict, Iterable, Iterator, List, Optional
+
+from ..models import Pozicija
+from .pricing import DEFAULT_MATAS, QuoteRequest, quote_many
+
+
+# SQLite IN (...) parametrų riba
+_CODE_CHUNK = 900
+
+# Priimami stulpelių pavadinimai (CSV header / JSON raktai)
+_CODE_KEYS = ("poz_kodas", "kodas", "Kodas", "code")
+_QTY_KEYS = ("qty", "kiekis", "Kiekis", "quantity")
+_MATAS_KEYS = ("matas", "Matas", "unit")
+
+QUOTE_RESULT_HEADER = [
+    "Eilutė", "Kodas", "Kiekis", "Matas", "Pozicijos ID",
+    "Kaina", "Suma", "Kainos eilutės ID", "Pagrindas", "Klaida",
+]
+# Tie patys stulpeliai JSON atsakyme
+QUOTE_RESULT_KEYS = [
+    "row", "poz_kodas", "qty", "matas", "pozicija_id",
+    "kaina", "suma", "line_id", "reason", "error",
+]
+
+
+@dataclass
+class QuoteInputRow:
+    row_number: int
+    poz_kodas: str
+    qty: Optional[int]
+    matas: str
+
+
+@dataclass
+class QuoteInputError:
+    row_number: int
+    message: str
+
+
+@dataclass
+class QuoteInput:
+    rows: List[QuoteInputRow] = field(default_factory=list)
+    errors: List[QuoteInputError] = field(default_factory=list)
+
+    @property
+    def input_error(self) -> str:
+        """Visos įvesties klaida (eilutė 0: blogas JSON ar jo forma); "" – jei nėra."""
+        return next((e.message for e in self.errors if e.row_number == 0), "")
+
+
+def _pick(record: dict, keys: Iterable[str]):
+    for k in keys:
+        if k in record and record[k] not in (None, ""):
+            return record[k]
+    return None
+
+
+def _add_record(result: QuoteInput, row_number: int, record: dict) -> None:
+    code = str(_pick(record, _CODE_KEYS) or "").strip()
+    if not code:
+        result.errors.append(QuoteInputError(row_number, "Trūksta 'poz_kodas' reikšmės."))
+        return
+
+    raw_qty = _pick(record, _QTY_KEYS)
+    qty: Optional[int] = None
+    if raw_qty is not None:
+        try:
+            value = Decimal(str(raw_qty).strip().replace(",", "."))
+        except Exception:
+            value = None
+        if isinstance(raw_qty, bool) or value is None or not value.is_finite():
+            result.errors.append(QuoteInputError(row_number, f"Neteisingas kiekis '{raw_qty}'."))
+            return
+        # kainos intervalai sveikiesiems kiekiams – 2.5 nepjaunam į 2
+        if value != value.to_integral_value():
+            result.errors.append(QuoteInputError(row_number, f"Kiekis turi būti sveikas skaičius: '{raw_qty}'."))
+            return
+        qty = int(value)
+
+    # matas visada konkretus – kaina grąžinama tik tame mate (services/pricing.py)
+    matas = str(_pick(record, _MATAS_KEYS) or "").strip() or DEFAULT_MATAS
+    result.rows.append(QuoteInputRow(row_number, code, qty, matas))
+
+
+def parse_quote_input(text: str) -> QuoteInput:
+    """
+    Užklausos eilutės iš JSON arba CSV teksto.
+
+    JSON: [{"poz_kodas": ..., "qty": ..., "matas": ...}, ...] arba {"lines": [...]};
+          kitokia forma – klaida eilutei 0 (QuoteInput.input_error).
+    CSV:  ';' arba ',' skyriklis; su header'iu (poz_kodas/Kodas, qty/kiekis, matas)
+          arba be jo – tada stulpeliai eina tokia tvarka: kodas, kiekis, matas.
+    Tuščias matas – DEFAULT_MATAS (Vnt.).
+    """
+    result = QuoteInput()
+    text = text.lstrip("\ufeff")
+    stripped = text.lstrip()
+
+    if stripped[:1] in ("[", "{"):
+        try:
+            data = json.loads(stripped)
+        except ValueError as e:
+            result.errors.append(QuoteInputError(0, f"Neteisingas JSON: {e}"))
+            return result
+        if isinstance(data, dict):
+            data = data.get("lines", [])
+        if not isinstance(data, list):
+            result.errors.append(QuoteInputError(0, 'JSON turi būti sąrašas arba {"lines": [...]}.'))
+            return result
+        for i, rec in enumerate(data, start=1):
+            if isinstance(rec, (list, tuple)):
+                rec = dict(zip(("poz_kodas", "qty", "matas"), rec))
+            if not isinstance(rec, dict):
+                result.errors.append(QuoteInputError(i, "Eilutė turi būti objektas arba sąrašas."))
+                continue
+            _add_record(result, i, rec)
+        return result
+
+    # skyriklis pagal pirmą eilutę: ';' (ir kablelis kaip dešimtainis) arba ','
+    first_line = text.split("\n", 1)[0]
+    delimiter = "," if first_line.count(",") > first_line.count(";") else ";"
+
+    reader = csv.reader(io.StringIO(text), delimiter=delimiter)
+    first = next(reader, None)
+    if first is None:
+        return result
+    header = [h.strip() for h in first]
+    has_header = bool(set(header) & set(_CODE_KEYS))
+    names = header if has_header else ["poz_kodas", "qty", "matas"]
+    start = 2
+    if not has_header:
+        reader = iter([first, *reader])
+        start = 1
+
+    for i, values in enumerate(reader, start=start):
+        if not any(v.strip() for v in values):
+            continue
+        _add_record(result, i, dict(zip(names, (v.strip() for v in values))))
+    return result
+
+
+def resolve_codes(codes: Iterable[str]) -> Dict[str, int]:
+    """
+    poz_kodas -> pozicija_id keliais IN (...) query. Kodas nėra unikalus –
+    jei kartojasi, imama seniausia (mažiausias id) pozicija, kaip ir importe.
+    """
+    codes = sorted(set(codes))
+    out: Dict[str, int] = {}
+    for i in range(0, len(codes), _CODE_CHUNK):
+        rows = (
+            Pozicija.objects
+            .filter(poz_kodas__in=codes[i:i + _CODE_CHUNK])
+            .order_by("poz_kodas", "id")
+            .values_list("poz_kodas", "id")
+        )
+        for code, pk in rows:
+            out.setdefault(code, pk)
+    return out
+
+
+def price_quote_rows(rows: List[QuoteInputRow], as_of: Optional[date] = None) -> Iterator[list]:
+    """
+    Įkainotos eilutės (QUOTE_RESULT_HEADER tvarka) ta pačia tvarka kaip įvestis.
+    Visa kaina sprendžiama vienu quote_many() – keli query nepriklausomai nuo eilučių skaičiaus.
+    """
+    ids = resolve_codes(r.poz_kodas for r in rows)
+    known = [r for r in rows if r.poz_kodas in ids]
+    quoted = iter(quote_many(
+        QuoteRequest(ids[r.poz_kodas], r.qty, r.matas, as_of) for r in known
+    ))
+
+    for r in rows:
+        pid = ids.get(r.poz_kodas)
+        if pid is None:
+            yield [r.row_number, r.poz_kodas, r.qty, r.matas, None, None, None, None, None,
+                   "Pozicija nerasta"]
+            continue
+        res = next(quoted)
+        suma = res.kaina * r.qty if res.kaina is not None and r.qty is not None else None
+        yield [r.row_number, r.poz_kodas, r.qty, r.matas, pid, res.kaina, suma, res.line_id,
+               res.reason, None if res.found else "Kaina nerasta"]
@@ -0,0 +1,191 @@
+# pozicijos/services/search.py
+from __future__ import annotations
+
+import re
+from typing import Dict, Iterable, List, Optional
+
+from django.db import connections, DEFAULT_DB_ALIAS
+from django.db.models import Q, QuerySet
+from django.db.models.expressions import RawSQL
+
+from ..schemas.columns import COLUMNS
+
+
+# Globalios ?q= paieškos laukai – visi COLUMNS su searchable=True.
+SEARCH_FIELDS: List[str] = [c["key"] for c in COLUMNS if c.get("searchable")]
+
+FTS_TABLE = "pozicijos_pozicija_fts"
+SOURCE_TABLE = "pozicijos_pozicija"
+
+# unicode61 + remove_diacritics 2: "Šiauliai" randamas ir per "siauliai";
+# prefix='2 3' – papildomi prefiksų indeksai, kad "ab*" nereikėtų skenuoti viso žodyno.
+FTS_TOKENIZE = "unicode61 remove_diacritics 2"
+FTS_PREFIX = "2 3"
+
+_TOKEN_RE = re.compile(r"\w+", re.UNICODE)
+
+# Trumpesnės užklausos (ir vien skaitmenys – kodų fragmentai) ieškomos icontains:
+# FTS randa tik žodžių pradžias, o "12" turi rasti ir "AB-312".
+FTS_MIN_LENGTH = 3
+
+FTS_TRIGGERS = tuple(f"{FTS_TABLE}_{suffix}" for suffix in ("ai", "ad", "au"))
+
+
+# =============================================================================
+#  Indekso kūrimas / trynimas (SQLite FTS5)
+# =============================================================================
+
+def fts_supported(connection) -> bool:
+    """Ar DB yra SQLite su sukompiliuotu FTS5 moduliu."""
+    if connection.vendor != "sqlite":
+        return False
+    with connection.cursor() as cur:
+        try:
+            cur.execute("CREATE VIRTUAL TABLE temp._fts5_probe USING fts5(x)")
+            cur.execute("DROP TABLE temp._fts5_probe")
+        except Exception:
+            return False
+    return True
+
+
+def drop_fts(connection) -> None:
+    with connection.cursor() as cur:
+        for name in FTS_TRIGGERS:
+            cur.execute(f"DROP TRIGGER IF EXISTS {name}")
+        cur.execute(f"DROP TABLE IF EXISTS {FTS_TABLE}")
+
+
+def _trigger_sql(fields: List[str]) -> List[str]:
+    cols = ", ".join(fields)
+    new_vals = ", ".join(f"new.{f}" for f in fields)
+    old_vals = ", ".join(f"old.{f}" for f in fields)
+    return [
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ai AFTER INSERT ON {SOURCE_TABLE} BEGIN "
+        f"INSERT INTO {FTS_TABLE}(rowid, {cols}) VALUES (new.id, {new_vals}); END",
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_ad AFTER DELETE ON {SOURCE_TABLE} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {cols}) "
+        f"VALUES ('delete', old.id, {old_vals}); END",
+        # tik kai keičiasi ieškomi laukai – kaina_eur/updated atnaujinimai FTS neliečia
+        f"CREATE TRIGGER IF NOT EXISTS {FTS_TABLE}_au AFTER UPDATE OF {cols} ON {SOURCE_TABLE} BEGIN "
+        f"INSERT INTO {FTS_TABLE}({FTS_TABLE}, rowid, {cols}) "
+        f"VALUES ('delete', old.id, {old_vals}); "
+        f"INSERT INTO {FTS_TABLE}(rowid, {cols}) VALUES (new.id, {new_vals}); END",
+    ]
+
+
+def install_fts(connection, fields: Optional[Iterable[str]] = None) -> bool:
+    """
+    (Per)kuria external-content FTS5 lentelę ir trigger'ius, kurie ją laiko
+    sinchronizuotą su pozicijos_pozicija (veikia ir su QuerySet.update / bulk_create).
+    Grąžina False, jei backend'as FTS5 nepalaiko (tada paieška lieka icontains).
+    """
+    if not fts_supported(connection):
+        return False
+
+    fields = list(fields or SEARCH_FIELDS)
+    drop_fts(connection)
+    with connection.cursor() as cur:
+        cur.execute(
+            f"CREATE VIRTUAL TABLE {FTS_TABLE} USING fts5("
+            f"{', '.join(fields)}, content='{SOURCE_TABLE}', content_rowid='id', "
+            f"tokenize='{FTS_TOKENIZE}', prefix='{FTS_PREFIX}')"
+        )
+        for sql in _trigger_sql(fields):
+            cur.execute(sql)
+        cur.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def _fts_objects(connection) -> Dict[str, str]:
+    """sqlite_master: FTS lentelės ir jos trigger'ių vardai -> tipas."""
+    with connection.cursor() as cur:
+        cur.execute(
+            "SELECT name, type FROM sqlite_master WHERE name = %s OR (type = 'trigger' AND tbl_name = %s)",
+            (FTS_TABLE, SOURCE_TABLE),
+        )
+        return dict(cur.fetchall())
+
+
+def ensure_fts_triggers(connection) -> bool:
+    """
+    SQLite schema editor'ius, perkurdamas pozicijos_pozicija (AlterField,
+    AddField su default ir pan.), trigger'ius numeta tyliai. Jei FTS lentelė
+    yra, o trigger'ių trūksta – sukuriami iš naujo (stulpeliai – iš pačios FTS
+    lentelės) ir indeksas perstatomas. Grąžina True, jei kažką taisė.
+    """
+    if connection.vendor != "sqlite":
+        return False
+    objects = _fts_objects(connection)
+    if FTS_TABLE not in objects or all(name in objects for name in FTS_TRIGGERS):
+        return False
+    with connection.cursor() as cur:
+        cur.execute(f"SELECT name FROM pragma_table_info('{FTS_TABLE}')")
+        fields = [row[0] for row in cur.fetchall()]
+        for sql in _trigger_sql(fields):
+            cur.execute(sql)
+        cur.execute(f"INSERT INTO {FTS_TABLE}({FTS_TABLE}) VALUES ('rebuild')")
+    return True
+
+
+def fts_available(using: str = DEFAULT_DB_ALIAS) -> bool:
+    """
+    Ar galima naudoti FTS: SQLite, lentelė ir visi trys trigger'iai yra
+    (be trigger'ių indeksas išsiderina – tada geriau icontains). Tikrinama
+    kiekvieną kartą – sqlite_master mažas, o schema gali pasikeisti po migrate.
+    """
+    connection = connections[using]
+    if connection.vendor != "sqlite":
+        return False
+    objects = _fts_objects(connection)
+    return FTS_TABLE in objects and all(name in objects for name in FTS_TRIGGERS)
+
+
+# =============================================================================
+#  Paieška
+# =============================================================================
+
+def fts_match_expr(text: str) -> str:
+    """
+    "ab-12 šiaul" -> '"ab"* "12"* "šiaul"*'
+    Kiekvienas žodis – prefiksas, visi privalomi (AND). Kabutės išvengia
+    FTS5 sintaksės (NOT, OR, :, -) interpretavimo iš vartotojo teksto.
+    """
+    tokens = _TOKEN_RE.findall(text or "")
+    return " ".join(f'"{t}"*' for t in tokens)
+
+
+def use_fts(text: str) -> bool:
+    """
+    FTS – žodžių prefiksai (ne poeilutė kaip icontains). Trumpoms ir vien
+    skaitmenų užklausoms (kodų fragmentams) paliekam poeilutės paiešką.
+    """
+    if len(text) < FTS_MIN_LENGTH:
+        return False
+    return not all(t.isdigit() for t in _TOKEN_RE.findall(text))
+
+
+def icontains_q(text: str) -> Q:
+    q = Q()
+    for field in SEARCH_FIELDS:
+        q |= Q(**{f"{field}__icontains": text})
+    return q
+
+
+def apply_global_search(qs: QuerySet, text: str) -> QuerySet:
+    """
+    Globali ?q= paieška: FTS5 indeksas, jei yra, kitaip – icontains per SEARCH_FIELDS.
+    Trumpos / vien skaitmenų užklausos – visada icontains (žr. use_fts).
+    """
+    text = (text or "").strip()
+    if not text:
+        return qs
+
+    expr = fts_match_expr(text)
+    if expr and use_fts(text) and fts_available(qs.db):
+        return qs.filter(
+            id__in=RawSQL(
+                f"SELECT rowid FROM {FTS_TABLE} WHERE {FTS_TABLE} MATCH %s",
+                (expr,),
+            )
+        )
+    return qs.filter(icontains_q(text))
@@ -0,0 +1,141 @@
+# pozicijos/services/suggest.py
+from __future__ import annotations
+
+import threading
+import time
+import unicodedata
+from bisect import bisect_left, insort
+from typing import Dict, List, Optional, Tuple
+
+from django.db import transaction
+
+from ..models import Pozicija
+from . import versions
+
+
+# Formos laukai, kuriems siūlomos jau naudotos reikšmės (typeahead)
+FORM_SUGGEST_FIELDS = [
+    "klientas",
+    "projektas",
+    "metalas",
+    "kabinimo_budas",
+    "kabinimas_reme",
+    "paruosimas",
+    "padengimas",
+    "padengimo_standartas",
+    "spalva",
+    "maskavimas",
+    "testai_kokybe",
+    "pakavimas",
+    "instrukcija",
+]
+
+DEFAULT_SUGGEST_LIMIT = 10
+MAX_SUGGEST_LIMIT = 50
+
+# Atsarginis perkūrimas – pakeitimams be signalų (bulk_create, QuerySet.update importuose)
+REBUILD_AFTER_SECONDS = 600
+
+
+def _norm(value: str) -> str:
+    # be diakritikų, kaip ir FTS paieškoje: "s" randa "Šiaulių metalas"
+    decomposed = unicodedata.normalize("NFKD", value.strip().casefold())
+    return "".join(ch for ch in decomposed if not unicodedata.combining(ch))
+
+
+class PrefixIndex:
+    """
+    Vieno lauko skirtingų reikšmių indeksas: surikiuotas [(casefold, reikšmė)]
+    sąrašas, prefix paieška – bisect + nuoseklus skaitymas kol sutampa prefix'as.
+
+    Kuriamas tingiai (vienas DISTINCT query) ir pildomas po kiekvieno šio
+    proceso Pozicija įrašymo (add). Perkuriamas, kai pasikeičia Pozicija
+    versija (versions.POZICIJOS – kitas procesas įrašė, kažkas ištrinta) arba
+    praėjus REBUILD_AFTER_SECONDS. Kainų / brėžinių įrašymai jo neliečia.
+    """
+
+    def __init__(self, field: str):
+        self.field = field
+        self.version: Optional[int] = None
+        self.built_at = 0.0
+        self._entries: List[Tuple[str, str]] = []
+        self._seen: set[str] = set()
+        self._lock = threading.Lock()
+
+    def rebuild(self, version: int) -> None:
+        values = (
+            Pozicija.objects.exclude(**{f"{self.field}__isnull": True})
+            .exclude(**{self.field: ""})
+            .values_list(self.field, flat=True)
+            .distinct()
+        )
+        seen = {v for v in values if v and v.strip()}
+        entries = sorted((_norm(v), v) for v in seen)
+        with self._lock:
+            self._seen = seen
+            self._entries = entries
+            self.version = version
+            self.built_at = time.monotonic()
+
+    def is_fresh(self, version: int) -> bool:
+        return self.version == version and time.monotonic() - self.built_at < REBUILD_AFTER_SECONDS
+
+    def add(self, value: Optional[str], version: int) -> None:
+        """
+        Šio proceso įrašymas: reikšmė įterpiama, o indeksas pažymimas nauja
+        versija tik jei tarp jo ir šio įrašymo kitų pakeitimų nebuvo.
+        """
+        with self._lock:
+            if self.version is None:
+                return
+            if value and value.strip() and value not in self._seen:
+                self._seen.add(value)
+                insort(self._entries, (_norm(value), value))
+            if self.version == version - 1:
+                self.version = version
+
+    def lookup(self, prefix: str, limit: int) -> List[str]:
+        key = _norm(prefix)
+        out: List[str] = []
+        with self._lock:
+            entries = self._entries
+            i = bisect_left(entries, (key, ""))
+            while i < len(entries) and len(out) < limit:
+                norm, value = entries[i]
+                if not norm.startswith(key):
+                    break
+                out.append(value)
+                i += 1
+        return out
+
+
+_indexes: Dict[str, PrefixIndex] = {f: PrefixIndex(f) for f in FORM_SUGGEST_FIELDS}
+
+
+def suggest(field: str, prefix: str = "", limit: int = DEFAULT_SUGGEST_LIMIT) -> List[str]:
+    """Iki `limit` reikšmių, prasidedančių `prefix` (be didžiųjų raidžių ir diakritikų skirtumo)."""
+    index = _indexes[field]
+    version = versions.get_version(versions.POZICIJOS)
+    if not index.is_fresh(version):
+        index.rebuild(version)
+    return index.lookup(prefix, max(1, min(limit, MAX_SUGGEST_LIMIT)))
+
+
+def index_pozicija(instance: Pozicija, version: Optional[int] = None) -> None:
+    """
+    post_save: naujos reikšmės iškart patenka į jau sukurtus indeksus.
+    version – jau padidinta ir perskaityta Pozicija versija (signalas ją didina
+    kartu su kitais raktais); be jos padidinama ir perskaitoma čia, vienoje
+    transakcijoje (kito proceso įrašymas tarp jų neįsiterps).
+    """
+    if version is None:
+        with transaction.atomic():
+            versions.bump_version(versions.POZICIJOS)
+            version = versions.get_version(versions.POZICIJOS)
+    for field, index in _indexes.items():
+        index.add(getattr(instance, field, None), version)
+
+
+def forget_pozicija() -> None:
+    """post_delete: reikšmės galėjo dingti – indeksai persikurs kitą kartą."""
+    versions.bump_version(versions.POZICIJOS)
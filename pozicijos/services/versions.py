@@ -0,0 +1,49 @@
+# pozicijos/services/versions.py
+from __future__ import annotations
+
+from django.db import IntegrityError, transaction
+from django.db.models import F
+
+from ..models import DuomenuVersija
+
+
+# Raktai (DuomenuVersija.raktas)
+LIST_DATA = "sarasas"      # sąrašo tbody/stats/data fragmentai (list_cache.py)
+KAINOS = "kainos"          # sukompiliuotos kainos (pricing.py)
+POZICIJOS = "pozicijos"    # tik Pozicija įrašai – typeahead indeksai (suggest.py)
+
+
+def get_version(key: str) -> int:
+    """Dabartinė versija (0 – dar nė karto nedidinta). Vienas PK SELECT."""
+    version = DuomenuVersija.objects.filter(raktas=key).values_list("versija", flat=True).first()
+    return version or 0
+
+
+def bump_version(key: str) -> None:
+    """
+    versija = versija + 1 vienu UPDATE (be skaitymo – lenktynių tarp procesų nėra).
+    Vykdoma esamoje transakcijoje: kiti procesai naują versiją pamato tik
+    po commit'o, kartu su pakeistais duomenimis.
+    """
+    bump_versions(key)
+
+
+def bump_versions(*keys: str) -> None:
+    """
+    Keli raktai vienu UPDATE … WHERE raktas IN (…) – signalai po kiekvieno
+    įrašymo didina kelias versijas iškart. Trūkstamos eilutės (pirmas kartas)
+    sukuriamos atskirai.
+    """
+    keys = tuple(dict.fromkeys(keys))
+    if DuomenuVersija.objects.filter(raktas__in=keys).update(versija=F("versija") + 1) == len(keys):
+        return
+    existing = set(DuomenuVersija.objects.filter(raktas__in=keys).values_list("raktas", flat=True))
+    for key in keys:
+        if key in existing:
+            continue
+        try:
+            with transaction.atomic():
+                DuomenuVersija.objects.create(raktas=key, versija=1)
+        except IntegrityError:
+            # kitas procesas sukūrė tuo pačiu metu
+            DuomenuVersija.objects.filter(raktas=key).update(versija=F("versija") + 1)
@@ -3,37 +3,83 @@ from __future__ import annotations
 
 import logging
 
+from django.db import DEFAULT_DB_ALIAS, connections, transaction
 from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 
-from .models import PozicijosBrezinys
-from .services.previews import regenerate_missing_preview
+from .models import KainosEilute, Pozicija, PozicijosBrezinys
+from .services import versions
+from .services.preview_queue import enqueue_preview
+from .services.price_snapshot import schedule_snapshot_rebuild
+from .services.pricing import engine as price_engine
+from .services.search import ensure_fts_triggers
+from .services.suggest import index_pozicija
 
 logger = logging.getLogger(__name__)
 
 
+# Versijų raktai didinami vienu UPDATE … WHERE raktas IN (…) per įrašymą;
+# perskaitoma tik ta versija, kurią naudoja šio proceso kešas (kainos / typeahead).
+# QuerySet.update()/bulk_update signalų nekelia – ten bump_data_version(),
+# invalidate_pozicija_prices() ir pan. kviesti ranka.
+
+
+@receiver(post_save, sender=Pozicija)
+def on_pozicija_saved(sender, instance: Pozicija, **kwargs):
+    """
+    Sąrašo tbody/stats kešas iškart nebegalioja, naujos formos reikšmės
+    patenka į typeahead indeksą.
+    """
+    with transaction.atomic():
+        versions.bump_versions(versions.LIST_DATA, versions.POZICIJOS)
+        version = versions.get_version(versions.POZICIJOS)
+    index_pozicija(instance, version)
+
+
+@receiver(post_delete, sender=Pozicija)
+def on_pozicija_deleted(sender, **kwargs):
+    """Ištrintos pozicijos reikšmės iš typeahead dingsta per kitą indekso perkūrimą."""
+    versions.bump_versions(versions.LIST_DATA, versions.POZICIJOS)
+
+
+@receiver(post_save, sender=KainosEilute)
+@receiver(post_delete, sender=KainosEilute)
+def on_kainos_eilute_changed(sender, instance: KainosEilute, **kwargs):
+    """
+    Kainų eilutė pasikeitė -> sąrašo kešas nebegalioja, kainų variklis šiame
+    procese išmeta tik tą poziciją, kituose – viską; pozicijos efektyvių kainų
+    periodai (KainosIntervalas) perkuriami po commit'o.
+    """
+    with transaction.atomic():
+        versions.bump_versions(versions.LIST_DATA, versions.KAINOS)
+        version = versions.get_version(versions.KAINOS)
+    price_engine.forget(instance.pozicija_id, version)
+    schedule_snapshot_rebuild(instance.pozicija_id)
+
+
+@receiver(post_save, sender=PozicijosBrezinys)
+@receiver(post_delete, sender=PozicijosBrezinys)
+def on_brezinys_changed(sender, **kwargs):
+    """Sąrašo kešas nebegalioja dėl brez_count stulpelio."""
+    versions.bump_versions(versions.LIST_DATA)
 
 
 @receiver(post_save, sender=PozicijosBrezinys)
 def auto_preview_on_create(sender, instance: PozicijosBrezinys, created: bool, **kwargs):
     """
-    Kiekvieno naujo brėžinio įkėlimo metu bandome sugeneruoti PNG miniatiūrą.
-    JPG/PNG/TIFF → sumažintas vaizdas, PDF → 1 puslapio PNG (per PyMuPDF),
-    STEP/STP → miniatiūros nenaudojam (šablone rodoma statinė "3D" ikona).
+    Naujas brėžinys -> miniatiūros užduotis eilėje (services/preview_queue.py).
+    Pats generavimas vyksta run_preview_worker procese, ne request'e, todėl
+    įkėlimo trukmė nuo failo dydžio nepriklauso. STEP/STP į eilę nepatenka.
     Jei nepavyksta – request'o negadinam, tik log.
     """
     if not created or not instance.failas:
         return
 
     try:
-        res = regenerate_missing_preview(instance)
-        if res.ok:
-            logger.debug("Preview ok for brezinys id=%s (%s)", instance.pk, res.message or "ok")
-        else:
-            logger.info("Preview not generated for brezinys id=%s: %s", instance.pk, res.message)
+        enqueue_preview(instance)
     except Exception as e:
         # niekada nemetam iš signalo – tik log'as
-        logger.exception("Preview generation failed for brezinys id=%s: %s", instance.pk, e)
+        logger.exception("Preview enqueue failed for brezinys id=%s: %s", instance.pk, e)
 
 
 @receiver(post_delete, sender=PozicijosBrezinys)
@@ -43,7 +89,7 @@ def cleanup_files_on_delete(sender, instance: PozicijosBrezinys, **kwargs):
     o masiškai (QuerySet.delete) ar per admin bulk action:
 
     - pašalinam originalų failą, jei dar egzistuoja
-    - pašalinam ImageField preview (jei yra)
+    - pašalinam miniatiūrų variantus ir ImageField preview (preview_paths)
     - pašalinam senus preview PNG failus pagal _preview_relpath / _legacy_preview_relpath
     """
     storage = instance.failas.storage
@@ -54,19 +100,13 @@ def cleanup_files_on_delete(sender, instance: PozicijosBrezinys, **kwargs):
     if orig:
         paths_to_delete.append(orig)
 
-    # ImageField preview failas (jei yra)
-    preview_name = instance.preview.name if getattr(instance, "preview", None) else None
-    if preview_name:
-        paths_to_delete.append(preview_name)
-
-    # naujas ir legacy preview keliai (jei helperiai veikia)
+    # miniatiūros: variantai (WebP/JPEG), preview ir senas PNG kelias
     try:
-        rel_new = instance._preview_relpath()
-        if rel_new:
-            paths_to_delete.append(rel_new)
+        paths_to_delete.extend(instance.preview_paths())
     except Exception:
-        rel_new = None
+        pass
 
+    # legacy preview kelias (jei helperis yra)
     try:
         rel_old = instance._legacy_preview_relpath()
         if rel_old:
@@ -85,3 +125,13 @@ def cleanup_files_on_delete(sender, instance: PozicijosBrezinys, **kwargs):
                 path,
                 instance.pk,
             )
+
+
+def restore_search_triggers(sender, using=DEFAULT_DB_ALIAS, **kwargs):
+    """
+    post_migrate (prijungiama apps.py): migracija, perkūrusi pozicijos_pozicija,
+    SQLite'e numeta FTS trigger'ius – čia jie atstatomi, kad paieškos indeksas
+    nesiderintų su duomenimis.
+    """
+    if ensure_fts_triggers(connections[using]):
+        logger.info("FTS trigger'iai atkurti po migrate (%s)", using)
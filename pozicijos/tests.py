@@ -0,0 +1,1330 @@
+import csv
+import io
+import json
+import math
+import os
+import random
+import statistics
+import tempfile
+import unittest
+import zipfile
+from array import array
+from datetime import date, datetime, timedelta
+from decimal import Decimal
+from unittest import mock
+from xml.etree import ElementTree
+
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.management import call_command
+from django.db import connection, transaction
+from django.db.models import F, Q
+from django.test import Client, RequestFactory, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from PIL import Image, ImageChops
+
+from .models import (
+    DuomenuVersija,
+    KainosEilute,
+    KainosEiluteArchyvas,
+    Pozicija,
+    PozicijosBrezinys,
+    PreviewJob,
+)
+from .schemas.columns import COLUMNS, indexed_fields
+from .services import analytics, preview_queue, previews, price_snapshot, pricing
+from .services.kainos import (
+    HEADLINE_ORDER,
+    aktualios_kainos,
+    expire_and_promote,
+    find_for_qty,
+    headline_kainos,
+    recompute_kaina_eur,
+    set_aktuali,
+    set_aktuali_batch,
+)
+from .services.previews import PreviewResult
+from .services.price_archive import archive_old_lines
+from .services.price_audit import (
+    KIND_DUPLICATE_FIXED,
+    KIND_GAP,
+    KIND_OVERLAP,
+    audit_price_lines,
+    cached_catalogue_audit,
+)
+from .services.price_snapshot import (
+    OPEN_END,
+    OPEN_START,
+    build_intervals,
+    prices_as_of,
+    schedule_snapshot_rebuild,
+)
+from .services import suggest as suggest_service
+from .services import versions
+from .services.list_cache import cached_list_fragment, get_data_version
+from .services.listing import (
+    SORTABLE_FIELDS,
+    annotate_virtual,
+    apply_filters,
+    apply_sorting,
+    encode_cursor,
+    paginate_keyset,
+    project_columns,
+)
+from .services.measures import fill_shadow_fields, parse_measure
+from .services.quotes import parse_quote_input
+from .services.search import (
+    FTS_TABLE,
+    apply_global_search,
+    ensure_fts_triggers,
+    fts_available,
+    fts_supported,
+    install_fts,
+)
+
+
+class GlobalSearchFtsTests(TestCase):
+    """FTS indeksas turi sekti pozicijos_pozicija per trigger'ius."""
+
+    def setUp(self):
+        if not fts_supported(connection):
+            self.skipTest("SQLite be FTS5")
+        install_fts(connection)
+
+    def _found(self, text):
+        return set(apply_global_search(Pozicija.objects.all(), text).values_list("pk", flat=True))
+
+    def test_create_update_delete_stay_in_sync(self):
+        p = Pozicija.objects.create(klientas="Šiaulių metalas", poz_kodas="AB-312", poz_pavad="Laikiklis")
+        self.assertTrue(fts_available())
+        self.assertEqual(self._found("siaul"), {p.pk})
+        self.assertEqual(self._found("laikikl"), {p.pk})
+
+        p.poz_pavad = "Kronšteinas"
+        p.save()
+        self.assertEqual(self._found("laikikl"), set())
+        self.assertEqual(self._found("kronstein"), {p.pk})
+
+        # QuerySet.update signalų nekelia – trigger'iai vis tiek suveikia
+        Pozicija.objects.filter(pk=p.pk).update(klientas="Kauno plienas")
+        self.assertEqual(self._found("siaul"), set())
+        self.assertEqual(self._found("kauno"), {p.pk})
+
+        p.delete()
+        self.assertEqual(self._found("kronstein"), set())
+
+    def test_short_and_numeric_queries_match_substrings(self):
+        p = Pozicija.objects.create(klientas="Metalas", poz_kodas="AB-312")
+        # FTS randa tik žodžių pradžias – "12" ir "31" ieškomi icontains
+        self.assertEqual(self._found("12"), {p.pk})
+        self.assertEqual(self._found("31"), {p.pk})
+        self.assertEqual(self._found("et"), {p.pk})
+
+    def test_dropped_triggers_are_restored(self):
+        p = Pozicija.objects.create(klientas="Vilniaus gamykla")
+        with connection.cursor() as cur:
+            cur.execute(f"DROP TRIGGER {FTS_TABLE}_au")
+        # be trigger'io indeksas nebesekamas – FTS nenaudojamas
+        self.assertFalse(fts_available())
+
+        Pozicija.objects.filter(pk=p.pk).update(klientas="Alytaus gamykla")
+        self.assertTrue(ensure_fts_triggers(connection))
+        self.assertTrue(fts_available())
+        self.assertEqual(self._found("alytaus"), {p.pk})
+        self.assertEqual(self._found("vilniaus"), set())
+        self.assertFalse(ensure_fts_triggers(connection))
+
+
+class ListCacheVersionTests(TestCase):
+    """Sąrašo fragmentų versija – DB, todėl matomi ir kito proceso pakeitimai."""
+
+    def test_save_and_foreign_bump_invalidate_fragments(self):
+        request = RequestFactory().get("/", {"q": "abc"})
+        builds = []
+
+        def build():
+            builds.append(1)
+            return len(builds)
+
+        self.assertEqual(cached_list_fragment(request, "test", build), 1)
+        self.assertEqual(cached_list_fragment(request, "test", build), 1)
+
+        Pozicija.objects.create(klientas="Naujas")
+        self.assertEqual(cached_list_fragment(request, "test", build), 2)
+
+        # kitas procesas (be šio proceso signalų) padidina versiją tiesiai DB
+        before = get_data_version()
+        DuomenuVersija.objects.filter(raktas="sarasas").update(versija=F("versija") + 1)
+        self.assertEqual(get_data_version(), before + 1)
+        self.assertEqual(cached_list_fragment(request, "test", build), 3)
+
+    def test_save_bumps_all_keys_in_one_update(self):
+        p = Pozicija.objects.create(poz_kodas="V-1")
+        KainosEilute.objects.create(pozicija=p, kaina=Decimal("1"), matas="vnt.", busena="aktuali")
+        before = {k: versions.get_version(k) for k in (versions.LIST_DATA, versions.KAINOS, versions.POZICIJOS)}
+
+        def version_writes(ctx):
+            return [
+                q["sql"] for q in ctx.captured_queries
+                if "duomenuversija" in q["sql"].lower() and q["sql"].lstrip().upper().startswith("UPDATE")
+            ]
+
+        with CaptureQueriesContext(connection) as ctx:
+            p.save()
+        self.assertEqual(len(version_writes(ctx)), 1)
+
+        with CaptureQueriesContext(connection) as ctx:
+            KainosEilute.objects.create(pozicija=p, kaina=Decimal("2"), matas="kg", busena="aktuali")
+        self.assertEqual(len(version_writes(ctx)), 1)
+
+        self.assertEqual(versions.get_version(versions.LIST_DATA), before[versions.LIST_DATA] + 2)
+        self.assertEqual(versions.get_version(versions.POZICIJOS), before[versions.POZICIJOS] + 1)
+        self.assertEqual(versions.get_version(versions.KAINOS), before[versions.KAINOS] + 1)
+
+    def test_bump_versions_creates_missing_keys(self):
+        DuomenuVersija.objects.create(raktas="test-a", versija=5)
+        versions.bump_versions("test-a", "test-b", "test-a")
+        self.assertEqual(versions.get_version("test-a"), 6)
+        self.assertEqual(versions.get_version("test-b"), 1)
+
+
+class SuggestIndexTests(TestCase):
+    def setUp(self):
+        for index in suggest_service._indexes.values():
+            index.version = None
+
+    def test_prefix_ignores_case_and_diacritics(self):
+        Pozicija.objects.create(klientas="Šiaulių metalas")
+        Pozicija.objects.create(klientas="Kauno plienas")
+        self.assertEqual(suggest_service.suggest("klientas", "s"), ["Šiaulių metalas"])
+        self.assertEqual(suggest_service.suggest("klientas", "ŠIAU"), ["Šiaulių metalas"])
+
+    def test_local_save_adds_without_rebuild_foreign_write_rebuilds(self):
+        Pozicija.objects.create(klientas="Alfa")
+        self.assertEqual(suggest_service.suggest("klientas", "a"), ["Alfa"])
+
+        index = suggest_service._indexes["klientas"]
+        built_at = index.built_at
+        Pozicija.objects.create(klientas="Alytus")
+        self.assertEqual(suggest_service.suggest("klientas", "al"), ["Alfa", "Alytus"])
+        self.assertEqual(index.built_at, built_at)
+
+        # kitas procesas: eilutė be signalų + Pozicija versijos padidinimas
+        Pozicija.objects.bulk_create([Pozicija(klientas="Alksnis")])
+        versions.bump_version(versions.POZICIJOS)
+        self.assertEqual(suggest_service.suggest("klientas", "al"), ["Alfa", "Alksnis", "Alytus"])
+        self.assertNotEqual(index.built_at, built_at)
+
+
+class PriceEngineVersionTests(TestCase):
+    def test_foreign_price_change_is_seen(self):
+        p = Pozicija.objects.create(poz_kodas="K-1")
+        line = KainosEilute.objects.create(
+            pozicija=p, kaina=Decimal("5"), matas="vnt.", kiekis_nuo=1, kiekis_iki=50, busena="aktuali"
+        )
+        self.assertEqual(pricing.quote(p.pk, 10, "vnt.").kaina, Decimal("5"))
+
+        # kitas procesas: kaina pakeista be šio proceso signalų + bendra versija padidinta
+        KainosEilute.objects.filter(pk=line.pk).update(kaina=Decimal("7"))
+        self.assertEqual(pricing.quote(p.pk, 10, "vnt.").kaina, Decimal("5"))
+        versions.bump_version(versions.KAINOS)
+        self.assertEqual(pricing.quote(p.pk, 10, "vnt.").kaina, Decimal("7"))
+
+    def test_local_save_invalidates_only_that_pozicija(self):
+        a = Pozicija.objects.create(poz_kodas="A")
+        b = Pozicija.objects.create(poz_kodas="B")
+        for poz in (a, b):
+            KainosEilute.objects.create(
+                pozicija=poz, kaina=Decimal("3"), matas="vnt.", kiekis_nuo=1, busena="aktuali"
+            )
+        pricing.quote_many([(a.pk, 5, "vnt."), (b.pk, 5, "vnt.")])
+
+        line = KainosEilute.objects.get(pozicija=a)
+        line.kaina = Decimal("4")
+        line.save()
+        self.assertEqual(pricing.quote(a.pk, 5, "vnt.").kaina, Decimal("4"))
+        self.assertIn(b.pk, pricing.engine._compiled)
+
+
+class PriceAuditTests(TestCase):
+    def setUp(self):
+        cache.clear()
+
+    def test_duplicate_fixed_checked_against_all_same_quantity_rows(self):
+        p = Pozicija.objects.create(poz_kodas="F-1")
+
+        def fixed(nuo, iki):
+            return KainosEilute.objects.create(
+                pozicija=p, kaina=Decimal("1"), matas="vnt.", yra_fiksuota=True, fiksuotas_kiekis=100,
+                busena="aktuali", galioja_nuo=nuo, galioja_iki=iki,
+            )
+
+        a = fixed(date(2025, 1, 1), date(2025, 12, 31))
+        fixed(date(2030, 1, 1), None)  # B – su niekuo nepersidengia
+        c = fixed(date(2025, 6, 1), date(2025, 7, 31))
+
+        issues = [i for i in audit_price_lines().issues if i.kind == KIND_DUPLICATE_FIXED]
+        self.assertEqual([i.line_ids for i in issues], [(a.pk, c.pk)])
+
+    def test_gaps_checked_per_validity_window(self):
+        p = Pozicija.objects.create(poz_kodas="G-1")
+
+        def line(nuo, iki, galioja_nuo, galioja_iki):
+            return KainosEilute.objects.create(
+                pozicija=p, kaina=Decimal("1"), matas="vnt.", kiekis_nuo=nuo, kiekis_iki=iki,
+                busena="aktuali", galioja_nuo=galioja_nuo, galioja_iki=galioja_iki,
+            )
+
+        y2025 = (date(2025, 1, 1), date(2025, 12, 31))
+        y2026 = (date(2026, 1, 1), date(2026, 12, 31))
+        line(1, 100, *y2025)
+        line(101, 200, *y2026)     # kitais metais – 2025 m. tarpo neuždengia
+        far = line(201, None, *y2025)
+        line(1, 100, *y2026)
+        line(300, None, date(2027, 1, 1), None)  # vienintelė 2027 m. – tarpo nėra
+
+        gaps = [i for i in audit_price_lines(pozicija_ids=[p.pk]).issues if i.kind == KIND_GAP]
+        self.assertEqual([i.line_ids for i in gaps], [(far.pk,)])
+        self.assertIn("101–200 (2025-01-01 – 2025-12-31)", gaps[0].detail)
+
+    def test_long_interval_stays_open_after_short_ones_end(self):
+        p = Pozicija.objects.create(poz_kodas="O-1")
+
+        def line(nuo, iki):
+            return KainosEilute.objects.create(
+                pozicija=p, kaina=Decimal("1"), matas="vnt.", kiekis_nuo=nuo, kiekis_iki=iki, busena="aktuali",
+            )
+
+        short = line(1, 10)
+        long_ = line(1, 1000)
+        later = line(20, 30)
+        overlaps = {
+            i.line_ids for i in audit_price_lines(pozicija_ids=[p.pk]).issues if i.kind == KIND_OVERLAP
+        }
+        self.assertEqual(overlaps, {(short.pk, long_.pk), (long_.pk, later.pk)})
+
+    def test_catalogue_audit_cached_until_prices_change(self):
+        p = Pozicija.objects.create(poz_kodas="F-2")
+        self.assertEqual(cached_catalogue_audit().lines, 0)
+        # iš kešo: tik kainų versijos užklausa, auditas nekartojamas
+        with self.assertNumQueries(1):
+            self.assertEqual(cached_catalogue_audit().lines, 0)
+
+        KainosEilute.objects.create(pozicija=p, kaina=Decimal("2"), matas="vnt.", kiekis_nuo=5, busena="aktuali")
+        self.assertEqual(cached_catalogue_audit().lines, 1)
+
+
+class PriceArchiveTests(TestCase):
+    def test_moved_lines_leave_no_delete_history(self):
+        p = Pozicija.objects.create(poz_kodas="S-1")
+        old = KainosEilute.objects.create(pozicija=p, kaina=Decimal("1"), matas="vnt.", kiekis_nuo=1, busena="sena")
+        keep = KainosEilute.objects.create(pozicija=p, kaina=Decimal("2"), matas="vnt.", kiekis_nuo=1, busena="aktuali")
+        KainosEilute.objects.filter(pk=old.pk).update(updated=timezone.now() - timedelta(days=400))
+
+        result = archive_old_lines(days=365)
+
+        self.assertEqual(result.moved, 1)
+        self.assertEqual(list(KainosEilute.objects.values_list("pk", flat=True)), [keep.pk])
+        self.assertTrue(KainosEiluteArchyvas.objects.filter(pk=old.pk).exists())
+        self.assertFalse(KainosEilute.history.filter(id=old.pk, history_type="-").exists())
+
+
+class PreviewPixelLimitTests(TestCase):
+    def test_pixel_limit_raised_only_while_opening(self):
+        buf = io.BytesIO()
+        Image.new("RGB", (50, 50), "white").save(buf, "PNG")
+        saved = Image.MAX_IMAGE_PIXELS
+        Image.MAX_IMAGE_PIXELS = 100  # 2500 px vaizdas Pillow'ui būtų „bomba“
+        try:
+            buf.seek(0)
+            with self.assertRaises(Image.DecompressionBombError):
+                Image.open(buf)
+            self.assertEqual(previews._open_bounded(buf, "png").size, (50, 50))
+            self.assertEqual(Image.MAX_IMAGE_PIXELS, 100)
+        finally:
+            Image.MAX_IMAGE_PIXELS = saved
+
+
+class TiffStreamTests(TestCase):
+    """Juostomis dekoduotas TIFF turi sutapti su viso vaizdo Image.reduce."""
+
+    SIZE = (301, 517)
+    FACTOR = 3
+
+    def _tiff(self, mode, compression, rows_per_strip=32):
+        src = Image.radial_gradient("L").resize(self.SIZE)
+        if mode == "RGB":
+            src = Image.merge("RGB", (src, src.transpose(Image.Transpose.FLIP_LEFT_RIGHT), src.rotate(90)))
+        buf = io.BytesIO()
+        src.convert(mode).save(buf, "TIFF", compression=compression, tiffinfo={278: rows_per_strip})
+        buf.seek(0)
+        return buf
+
+    def _compare(self, buf, max_diff=0):
+        expected = previews._reducible(Image.open(buf)).reduce(self.FACTOR)
+        buf.seek(0)
+        img = Image.open(buf)
+        # biudžetas ~100 eilučių – kelios juostos po 3 strip'us
+        budget = 2 * self.SIZE[0] * previews._bytes_per_pixel(img.mode) * 100
+        with mock.patch.object(previews, "_budget_bytes", return_value=budget), \
+                mock.patch.object(previews, "_reduce_factor", return_value=self.FACTOR):
+            streamed = previews._stream_tiff(img, buf)
+        self.assertIsNotNone(streamed)
+        self.assertEqual((streamed.mode, streamed.size), (expected.mode, expected.size))
+        extrema = ImageChops.difference(streamed, expected).getextrema()
+        worst = max(hi for _lo, hi in extrema) if isinstance(extrema[0], tuple) else extrema[1]
+        self.assertLessEqual(worst, max_diff)
+
+    def test_lossless_compressions_match_reduce(self):
+        for compression in ("tiff_lzw", "tiff_adobe_deflate", "packbits", "raw"):
+            for mode in ("L", "RGB", "1"):
+                with self.subTest(compression=compression, mode=mode):
+                    self._compare(self._tiff(mode, compression))
+
+    def test_jpeg_compressed_matches_reduce(self):
+        for mode in ("L", "RGB"):
+            with self.subTest(mode=mode):
+                self._compare(self._tiff(mode, "jpeg"), max_diff=2)
+
+    def test_single_uncompressed_strip_is_split(self):
+        for mode in ("L", "1"):
+            with self.subTest(mode=mode):
+                buf = self._tiff(mode, "raw", rows_per_strip=self.SIZE[1])
+                self.assertEqual(len(Image.open(buf).tag_v2[273]), 1)
+                buf.seek(0)
+                self._compare(buf)
+
+
+class PreviewFileTests(TestCase):
+    def setUp(self):
+        media = tempfile.TemporaryDirectory(prefix="pozicijos-test-")
+        self.addCleanup(media.cleanup)
+        settings = override_settings(MEDIA_ROOT=media.name)
+        settings.enable()
+        self.addCleanup(settings.disable)
+        self.poz = Pozicija.objects.create(poz_kodas="T-1")
+
+    def _brezinys(self, name: str, data: bytes) -> PozicijosBrezinys:
+        b = PozicijosBrezinys(pozicija=self.poz)
+        b.failas.save(name, ContentFile(data), save=False)
+        b.save()
+        b.failas.close()
+        return b
+
+    def _image(self, size, fmt="PNG", mode="RGB") -> bytes:
+        buf = io.BytesIO()
+        Image.radial_gradient("L").resize(size).convert(mode).save(buf, fmt)
+        return buf.getvalue()
+
+    def test_source_file_closed_after_decoding(self):
+        b = self._brezinys("brezinys.tif", self._image((300, 200), "TIFF", "L"))
+
+        result = previews.generate_preview_for_instance(b)
+        self.assertTrue(result.ok, result.message)
+        self.assertTrue(b.failas.closed)
+
+    def test_size_variants_and_srcset(self):
+        b = self._brezinys("didelis.png", self._image((2400, 1200)))
+        self.assertTrue(previews.generate_preview_for_instance(b).ok)
+        b.refresh_from_db()
+
+        self.assertEqual([(v["w"], v["h"]) for v in b.preview_variants], [(1000, 500), (480, 240), (160, 80)])
+        self.assertEqual(b.preview.name, b.preview_variants[0]["jpg"])
+        storage = b.preview.storage
+        for v in b.preview_variants:
+            self.assertTrue(storage.exists(v["jpg"]))
+            with storage.open(v["jpg"]) as fh:
+                self.assertEqual(Image.open(fh).size, (v["w"], v["h"]))
+            self.assertEqual("webp" in v, previews.WEBP_OK)
+
+        self.assertEqual(
+            b.jpeg_srcset,
+            ", ".join(f"{storage.url(v['jpg'])} {v['w']}w" for v in reversed(b.preview_variants)),
+        )
+        html = self.client.get(reverse("pozicijos:detail", args=[self.poz.pk])).content.decode()
+        self.assertIn(f'srcset="{b.jpeg_srcset}"', html)
+        if previews.WEBP_OK:
+            self.assertIn(f'<source type="image/webp" srcset="{b.webp_srcset}"', html)
+
+    def _pdf(self, width_pt: float, height_pt: float) -> bytes:
+        doc = previews.fitz.open()
+        page = doc.new_page(width=width_pt, height=height_pt)
+        page.draw_rect(page.rect, color=(0, 0, 0), width=5)
+        data = doc.tobytes()
+        doc.close()
+        return data
+
+    def test_pdf_rendered_at_thumbnail_size_from_disk(self):
+        if previews.fitz is None:
+            self.skipTest("PyMuPDF neįdiegtas")
+        b = self._brezinys("a0.pdf", self._pdf(2384, 3370))  # A0 stačias
+
+        with mock.patch.object(previews.fitz, "open", wraps=previews.fitz.open) as opened, \
+                mock.patch.object(previews.fitz.Page, "get_pixmap", autospec=True,
+                                  side_effect=previews.fitz.Page.get_pixmap) as pixmap:
+            self.assertTrue(previews.generate_preview_for_instance(b).ok)
+        self.assertEqual(opened.call_args.args[0], b.failas.path)   # iš disko, ne per read()
+        zoom = pixmap.call_args.kwargs["matrix"].a
+        self.assertAlmostEqual(zoom * 3370, previews.THUMB_MAX_H, delta=1)
+
+        b.refresh_from_db()
+        self.assertEqual(max(b.preview_variants[0]["w"], b.preview_variants[0]["h"]), 1000)
+
+    def test_small_pdf_page_capped_at_pdf_dpi(self):
+        if previews.fitz is None:
+            self.skipTest("PyMuPDF neįdiegtas")
+        b = self._brezinys("a6.pdf", self._pdf(298, 420))
+        self.assertTrue(previews.generate_preview_for_instance(b).ok)
+        b.refresh_from_db()
+        scale = previews.PDF_DPI / 72
+        largest = b.preview_variants[0]
+        self.assertEqual((largest["w"], largest["h"]), (round(298 * scale), round(420 * scale)))
+
+    def test_small_original_not_upscaled_and_old_variants_removed(self):
+        b = self._brezinys("brezinys.png", self._image((2400, 1200)))
+        previews.generate_preview_for_instance(b)
+        b.refresh_from_db()
+        old = b.preview_paths()
+
+        b.failas.save("mazas.png", ContentFile(self._image((300, 200))), save=False)
+        b.save()
+        b.failas.close()
+        self.assertTrue(previews.generate_preview_for_instance(b).ok)
+        b.refresh_from_db()
+
+        # 1000 / 480 nedidinama – originalo dydžio variantas + mažesni
+        self.assertEqual([(v["w"], v["h"]) for v in b.preview_variants], [(300, 200), (160, 107)])
+        self.assertTrue(old - b.preview_paths())
+        storage = b.preview.storage
+        for path in old - b.preview_paths():
+            self.assertFalse(storage.exists(path), path)
+
+
+class PreviewQueueTests(TestCase):
+    def setUp(self):
+        poz = Pozicija.objects.create(poz_kodas="B-1")
+        self.brezinys = PozicijosBrezinys.objects.create(pozicija=poz, failas="pozicijos/breziniai/b1.pdf")
+        self.job = PreviewJob.objects.get(brezinys=self.brezinys)  # įtraukė post_save signalas
+
+    def _run_claimed(self, **result):
+        (job,) = preview_queue.claim_jobs(worker="w")
+        with mock.patch.object(preview_queue, "regenerate_missing_preview", return_value=PreviewResult(**result)):
+            preview_queue.run_job(job)
+        self.job.refresh_from_db()
+
+    def test_stale_runs_count_as_attempts(self):
+        for attempt in range(1, preview_queue.MAX_ATTEMPTS + 1):
+            (job,) = preview_queue.claim_jobs(worker="w")
+            later = job.pradeta + preview_queue.STALE_AFTER + timedelta(seconds=1)
+            requeued = preview_queue.requeue_stale(now=later)
+            self.job.refresh_from_db()
+            self.assertEqual(self.job.bandymai, attempt)
+            if attempt < preview_queue.MAX_ATTEMPTS:
+                self.assertEqual((requeued, self.job.busena), (1, PreviewJob.LAUKIA))
+
+        self.assertEqual((requeued, self.job.busena), (0, PreviewJob.KLAIDA))
+        self.assertEqual(preview_queue.claim_jobs(worker="w"), [])
+
+    def test_force_during_run_requeues_instead_of_done(self):
+        (job,) = preview_queue.claim_jobs(worker="w")
+        preview_queue.enqueue_preview(self.brezinys, force=True)
+        with mock.patch.object(preview_queue, "regenerate_missing_preview", return_value=PreviewResult(ok=True)):
+            preview_queue.run_job(job)
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.busena, self.job.force), (PreviewJob.LAUKIA, True))
+
+        # antras vykdymas – su force, be naujų užklausų -> atlikta
+        (job,) = preview_queue.claim_jobs(worker="w")
+        with mock.patch.object(preview_queue, "generate_preview_for_instance", return_value=PreviewResult(ok=True)):
+            preview_queue.run_job(job)
+        self.job.refresh_from_db()
+        self.assertEqual((self.job.busena, self.job.force), (PreviewJob.ATLIKTA, False))
+
+    def test_plain_run_is_done(self):
+        self._run_claimed(ok=True)
+        self.assertEqual((self.job.busena, self.job.bandymai), (PreviewJob.ATLIKTA, 1))
+
+
+class KainuGaliojimasTests(TestCase):
+    """Būsenų suvedimas pagal datas (kainu_galiojimas) ir skaitymas tik pagal busena."""
+
+    def setUp(self):
+        self.poz = Pozicija.objects.create(poz_kodas="G-1")
+
+    def _line(self, kaina, busena="aktuali", nuo=None, iki=None, kiekis=(1, 100)):
+        return KainosEilute.objects.create(
+            pozicija=self.poz, kaina=Decimal(kaina), matas="Vnt.", kiekis_nuo=kiekis[0], kiekis_iki=kiekis[1],
+            busena=busena, galioja_nuo=nuo, galioja_iki=iki,
+        )
+
+    def _states(self, *lines):
+        return [KainosEilute.objects.get(pk=l.pk).busena for l in lines]
+
+    def test_promotes_one_line_per_group(self):
+        old = self._line("5")
+        first = self._line("6", "laukianti", nuo=date(2026, 2, 1))
+        latest = self._line("7", "laukianti", nuo=date(2026, 2, 15))
+        future = self._line("8", "laukianti", nuo=date(2026, 4, 1))
+        expired = self._line("9", iki=date(2026, 2, 28), kiekis=(101, 200))
+
+        res = expire_and_promote(date(2026, 3, 1))
+
+        self.assertEqual(
+            self._states(old, first, latest, future, expired),
+            ["sena", "sena", "aktuali", "laukianti", "sena"],
+        )
+        self.assertEqual((res.expired, res.promoted, res.superseded), (1, 1, 2))
+        self.assertEqual([l.pk for l in aktualios_kainos(self.poz)], [latest.pk])
+        self.poz.refresh_from_db()
+        self.assertEqual(self.poz.kaina_eur, Decimal("7"))
+
+    def test_dry_run_writes_nothing(self):
+        line = self._line("5", "laukianti", nuo=date(2026, 2, 1))
+        res = expire_and_promote(date(2026, 3, 1), dry_run=True)
+        self.assertEqual(res.promoted, 1)
+        self.assertEqual(self._states(line), ["laukianti"])
+
+    def test_future_start_waits_and_shortens_current(self):
+        current = self._line("5")
+        new = KainosEilute(
+            pozicija=self.poz, kaina=Decimal("6"), matas="Vnt.", kiekis_nuo=1, kiekis_iki=100,
+            galioja_nuo=date.today() + timedelta(days=10),
+        )
+        set_aktuali(new)
+
+        current.refresh_from_db()
+        self.assertEqual(self._states(current, new), ["aktuali", "laukianti"])
+        self.assertEqual(current.galioja_iki, date.today() + timedelta(days=9))
+        self.assertEqual(pricing.quote(self.poz.pk, 10, "Vnt.").line_id, current.pk)
+        later = date.today() + timedelta(days=10)
+        self.assertEqual(pricing.quote(self.poz.pk, 10, "Vnt.", later).line_id, new.pk)
+
+    def test_today_reads_use_busena_only(self):
+        # kainu_galiojimas dar nepaleistas: pasibaigusi, bet 'aktuali' – šiandien dar rodoma
+        line = self._line("5", iki=date.today() - timedelta(days=1))
+        self.assertEqual([l.pk for l in aktualios_kainos(self.poz)], [line.pk])
+        self.assertEqual(pricing.quote(self.poz.pk, 10, "Vnt.").line_id, line.pk)
+        self.assertEqual(list(aktualios_kainos(self.poz, as_of=date.today())), [])
+        self.assertIsNone(pricing.quote(self.poz.pk, 10, "Vnt.", date.today()).line_id)
+
+
+class SetAktualiTests(TestCase):
+    """Grupės konfliktai (set_aktuali / set_aktuali_batch) ir formset'o išsaugojimas."""
+
+    def setUp(self):
+        self.poz = Pozicija.objects.create(poz_kodas="A-1")
+
+    def _line(self, kaina, kiekis=(1, 100), busena="aktuali", **kw):
+        return KainosEilute.objects.create(
+            pozicija=self.poz, kaina=Decimal(kaina), matas="Vnt.", kiekis_nuo=kiekis[0], kiekis_iki=kiekis[1],
+            busena=busena, **kw
+        )
+
+    def _busena(self, line):
+        return KainosEilute.objects.get(pk=line.pk).busena
+
+    def test_new_line_demotes_only_its_group(self):
+        old = self._line("5")
+        other = self._line("4", kiekis=(101, 200))
+        new = self._line("6", busena="sena", galioja_nuo=date.today())
+
+        set_aktuali(new)
+
+        old.refresh_from_db()
+        self.assertEqual((old.busena, old.galioja_iki), ("sena", date.today() - timedelta(days=1)))
+        self.assertEqual(self._busena(other), "aktuali")
+        self.assertEqual(self._busena(new), "aktuali")
+        self.assertEqual(old.history.first().history_type, "~")
+        self.poz.refresh_from_db()
+        self.assertEqual(self.poz.kaina_eur, Decimal("6"))
+
+    def test_batch_with_mixed_groups_keeps_last_per_group(self):
+        old_a = self._line("5")
+        old_b = self._line("4", kiekis=(101, 200))
+        a1 = self._line("6", busena="sena")
+        b1 = self._line("3", kiekis=(101, 200), busena="sena")
+        a2 = self._line("7", busena="sena")
+
+        set_aktuali_batch(self.poz, [a1, b1, a2])
+
+        self.assertEqual(
+            [self._busena(l) for l in (old_a, old_b, a1, b1, a2)],
+            ["sena", "sena", "sena", "aktuali", "aktuali"],
+        )
+        self.assertEqual(
+            KainosEilute.objects.filter(pozicija=self.poz, busena="aktuali").count(), 2
+        )
+
+    def test_formset_save_with_deletion(self):
+        gone = self._line("5")
+        kept = self._line("4", kiekis=(101, 200))
+
+        def form(i, line=None, **values):
+            data = {
+                "kaina": "", "matas": "Vnt.", "kiekis_nuo": "", "kiekis_iki": "",
+                "galioja_nuo": "", "galioja_iki": "", "pastaba": "", "busena_ui": "aktuali",
+                "id": line.pk if line else "",
+            }
+            data.update(values)
+            return {f"kainos-{i}-{k}": v for k, v in data.items()}
+
+        post = {
+            "kainos-TOTAL_FORMS": "3", "kainos-INITIAL_FORMS": "2",
+            "kainos-MIN_NUM_FORMS": "0", "kainos-MAX_NUM_FORMS": "1000",
+            **form(0, gone, kaina="5", kiekis_nuo="1", kiekis_iki="100", DELETE="on"),
+            **form(1, kept, kaina="3", kiekis_nuo="101", kiekis_iki="200"),
+            **form(2, kaina="6", kiekis_nuo="1", kiekis_iki="100"),
+        }
+        response = self.client.post(reverse("pozicijos:kainos_list", kwargs={"pk": self.poz.pk}), post)
+        self.assertEqual(response.status_code, 302)
+
+        self.assertFalse(KainosEilute.objects.filter(pk=gone.pk).exists())
+        self.assertEqual(KainosEilute.history.filter(id=gone.pk).first().history_type, "-")
+        kept.refresh_from_db()
+        self.assertEqual((kept.kaina, kept.busena), (Decimal("3"), "aktuali"))
+        new = KainosEilute.objects.get(pozicija=self.poz, kiekis_nuo=1)
+        self.assertEqual((new.kaina, new.busena), (Decimal("6"), "aktuali"))
+        self.poz.refresh_from_db()
+        self.assertEqual(self.poz.kaina_eur, Decimal("6"))
+
+
+class RecomputeKainaEurTests(TestCase):
+    def _headline_per_row(self, poz):
+        """Ta pati taisyklė po vieną poziciją (paprastas ORM) – atskaitos taškas set-based keliui."""
+        if not poz.kainos_eilutes.exists():
+            return poz.kaina_eur
+        line = aktualios_kainos(poz).exclude(kaina=None).order_by(*HEADLINE_ORDER).first()
+        return line.kaina if line else None
+
+    def test_set_based_matches_per_row_rule(self):
+        def line(poz, kaina, prioritetas=0, busena="aktuali", **kw):
+            KainosEilute.objects.create(
+                pozicija=poz, kaina=None if kaina is None else Decimal(kaina), matas="Vnt.",
+                prioritetas=prioritetas, busena=busena, **kw
+            )
+
+        naujausia, be_kainos, tik_null, fiksuota, be_eiluciu, prioritetas = (
+            Pozicija.objects.create(poz_kodas=f"R-{i}") for i in range(6)
+        )
+        line(naujausia, "5", kiekis_nuo=1)
+        line(naujausia, "6", kiekis_nuo=1)
+        line(be_kainos, "3", prioritetas=1)
+        line(be_kainos, None)
+        line(tik_null, None)
+        line(fiksuota, "9", yra_fiksuota=True, fiksuotas_kiekis=100)
+        line(fiksuota, "1", busena="sena")
+        line(prioritetas, "7", prioritetas=2, kiekis_nuo=1)
+        line(prioritetas, "8", prioritetas=1, yra_fiksuota=True, fiksuotas_kiekis=50)
+        Pozicija.objects.update(kaina_eur=Decimal("42"))
+
+        pozicijos = list(Pozicija.objects.order_by("pk"))
+        expected = {p.pk: self._headline_per_row(p) for p in pozicijos}
+        self.assertEqual(
+            [expected[p.pk] for p in pozicijos],
+            [Decimal("6"), Decimal("3"), None, Decimal("9"), Decimal("42"), Decimal("8")],
+        )
+
+        check = recompute_kaina_eur(verify=True, chunk_size=2)
+        self.assertEqual(
+            {d.pozicija_id: d.new for d in check.drift},
+            {pk: v for pk, v in expected.items() if v != Decimal("42")},
+        )
+        self.assertEqual(Pozicija.objects.exclude(kaina_eur=Decimal("42")).count(), 0)
+
+        res = recompute_kaina_eur(chunk_size=2)
+        self.assertEqual((res.checked, res.updated), (6, 5))
+        self.assertEqual(dict(Pozicija.objects.values_list("pk", "kaina_eur")), expected)
+
+        out = io.StringIO()
+        call_command("recompute_kaina_eur", "--verify", stdout=out)
+        self.assertIn("neatitinka: 0", out.getvalue())
+
+
+class PriceSnapshotTests(TestCase):
+    def _line(self, pk, busena="aktuali", nuo=None, iki=None, kiekis=(1, 100), prioritetas=0, day=1):
+        return KainosEilute(
+            pk=pk, pozicija_id=1, kaina=Decimal(pk), matas="Vnt.", kiekis_nuo=kiekis[0], kiekis_iki=kiekis[1],
+            busena=busena, galioja_nuo=nuo, galioja_iki=iki, prioritetas=prioritetas,
+            created=timezone.make_aware(datetime(2024, 1, day)),
+        )
+
+    def _spans(self, intervals):
+        return sorted(
+            (i.kiekis_nuo, i.galioja_nuo, i.galioja_iki, i.kainos_eilute_id) for i in intervals
+        )
+
+    def test_build_intervals_splits_by_rank_and_demotion(self):
+        lines = [
+            self._line(1, "sena"),                                   # pasenta 2024-12-15
+            self._line(2, nuo=date(2025, 1, 1), iki=date(2025, 6, 30), day=2),
+            self._line(3, nuo=date(2025, 4, 1), day=3),              # naujesnė – laimi nuo 04-01
+            self._line(4, nuo=date(2025, 5, 1), prioritetas=1, day=4),  # prastesnis prioritetas – niekada
+            self._line(5, "laukianti", nuo=date(2025, 3, 1), kiekis=(101, 200)),
+            self._line(6, "sena", kiekis=(101, 200)),                # be pasenimo istorijoje – praleidžiama
+        ]
+        intervals = build_intervals(lines, {1: date(2024, 12, 15)})
+
+        self.assertEqual(self._spans(intervals), [
+            (1, OPEN_START, date(2024, 12, 14), 1),
+            (1, date(2025, 1, 1), date(2025, 3, 31), 2),
+            (1, date(2025, 4, 1), OPEN_END, 3),
+            (101, date(2025, 3, 1), OPEN_END, 5),
+        ])
+
+    def test_one_rebuild_per_transaction_and_rollback_drops_ids(self):
+        with mock.patch.object(price_snapshot, "rebuild_snapshot") as rebuild:
+            with self.captureOnCommitCallbacks(execute=True):
+                with transaction.atomic():
+                    schedule_snapshot_rebuild(1)
+                    schedule_snapshot_rebuild(2)
+                    try:
+                        with transaction.atomic():
+                            schedule_snapshot_rebuild(3)
+                            raise RuntimeError
+                    except RuntimeError:
+                        pass
+                    schedule_snapshot_rebuild(4)
+            self.assertEqual([c.args[0] for c in rebuild.call_args_list], [{1, 2, 3, 4}])
+
+            # callback'as, užregistruotas atšauktame savepoint'e, dingsta kartu su jo id
+            rebuild.reset_mock()
+            with self.captureOnCommitCallbacks(execute=True):
+                try:
+                    with transaction.atomic():
+                        schedule_snapshot_rebuild(5)
+                        raise RuntimeError
+                except RuntimeError:
+                    pass
+                schedule_snapshot_rebuild(6)
+            self.assertEqual([c.args[0] for c in rebuild.call_args_list], [{6}])
+
+    def test_saved_line_is_visible_as_of_date(self):
+        poz = Pozicija.objects.create(poz_kodas="S-2")
+        with self.captureOnCommitCallbacks(execute=True):
+            line = KainosEilute.objects.create(
+                pozicija=poz, kaina=Decimal("4"), matas="Vnt.", kiekis_nuo=1, kiekis_iki=100,
+                busena="aktuali", galioja_nuo=date(2025, 1, 1),
+            )
+        self.assertEqual(
+            list(prices_as_of(date(2025, 2, 1), qty=10).values_list("kainos_eilute_id", flat=True)), [line.pk]
+        )
+        self.assertFalse(prices_as_of(date(2024, 12, 31)).exists())
+
+
+class PriceEngineParityTests(TestCase):
+    """Variklis (find_for_qty per quote) == ankstesnis ORM find_for_qty kelias."""
+
+    def _orm_find_for_qty(self, poz, qty, matas, as_of=None):
+        qs = aktualios_kainos(poz, matas=matas, as_of=as_of)
+        fx = qs.filter(yra_fiksuota=True, fiksuotas_kiekis=qty).order_by("prioritetas", "-created").first()
+        if fx:
+            return fx
+        return (
+            qs.filter(yra_fiksuota=False)
+            .filter(Q(kiekis_nuo__isnull=True) | Q(kiekis_nuo__lte=qty))
+            .filter(Q(kiekis_iki__isnull=True) | Q(kiekis_iki__gte=qty))
+            .order_by("prioritetas", "-created")
+            .first()
+        )
+
+    def test_matches_orm_lookup(self):
+        poz = Pozicija.objects.create(poz_kodas="P-1")
+        today = date.today()
+
+        def line(kaina, matas="Vnt.", nuo=None, iki=None, prioritetas=0, busena="aktuali", **kw):
+            KainosEilute.objects.create(
+                pozicija=poz, kaina=Decimal(kaina), matas=matas, kiekis_nuo=nuo, kiekis_iki=iki,
+                prioritetas=prioritetas, busena=busena, **kw
+            )
+
+        line("10", nuo=1, iki=99)
+        line("9", nuo=50, iki=199, prioritetas=1)
+        line("8", nuo=100)                                     # be viršutinės ribos
+        line("7")                                              # be abiejų ribų – bet kuriam kiekiui
+        line("6", nuo=1, iki=99, prioritetas=2)
+        line("5", yra_fiksuota=True, fiksuotas_kiekis=100)
+        line("4", yra_fiksuota=True, fiksuotas_kiekis=100, prioritetas=-1)
+        line("3", matas="kg", iki=500)                         # be apatinės ribos
+        line("2", nuo=1, iki=1000, busena="sena")
+        line("1", nuo=1, iki=1000, busena="laukianti", galioja_nuo=today + timedelta(days=30))
+        line("11", nuo=1, iki=20, galioja_iki=today - timedelta(days=10))
+
+        checked = 0
+        for as_of in (None, today, today - timedelta(days=20), today + timedelta(days=40)):
+            for matas in ("Vnt.", "kg", "komplektas"):
+                for qty in (0, 1, 10, 49, 50, 99, 100, 101, 199, 200, 500, 1000, 5000):
+                    expected = self._orm_find_for_qty(poz, qty, matas, as_of)
+                    got = find_for_qty(poz, qty, matas, as_of)
+                    self.assertEqual(
+                        got.pk if got else None, expected.pk if expected else None,
+                        (as_of, matas, qty),
+                    )
+                    checked += bool(expected)
+        self.assertGreater(checked, 50)
+
+    def test_price_only_in_requested_matas(self):
+        poz = Pozicija.objects.create(poz_kodas="P-2")
+        KainosEilute.objects.create(pozicija=poz, kaina=Decimal("3"), matas="kg", kiekis_nuo=1, busena="aktuali")
+
+        self.assertIsNone(poz.get_kaina_for_qty(10))
+        self.assertEqual(poz.get_kaina_for_qty(10, "kg"), Decimal("3"))
+        res = pricing.quote(poz.pk, 10, "kg")
+        self.assertEqual((res.matas, res.reason), ("kg", pricing.REASON_INTERVAL))
+
+
+class KeysetPagingTests(TestCase):
+    """Cursor puslapiai turi sutapti su nepuslapiuotu (field, id) rikiavimu."""
+
+    def setUp(self):
+        for kaina in (None, None, "5", "5", "5", "3", None, "7"):
+            Pozicija.objects.create(kaina_eur=Decimal(kaina) if kaina else None)
+
+    def _walk(self, params, page_size=2):
+        ids, cursor = [], ""
+        for _ in range(20):
+            request = RequestFactory().get("/", {**params, "cursor": cursor} if cursor else params)
+            qs = apply_sorting(Pozicija.objects.all(), request).values("id", "kaina_eur")
+            page = paginate_keyset(qs, request, page_size)
+            ids.extend(row["id"] for row in page.items)
+            if not page.next_cursor:
+                return ids
+            cursor = page.next_cursor
+        self.fail("puslapiavimas nesibaigia")
+
+    def test_null_sort_keys_and_tie_breaker(self):
+        for direction in ("asc", "desc"):
+            params = {"sort": "kaina_eur", "dir": direction}
+            expected = list(
+                apply_sorting(Pozicija.objects.all(), RequestFactory().get("/", params))
+                .values_list("id", flat=True)
+            )
+            for page_size in (1, 2, 3):
+                ids = self._walk(params, page_size)
+                self.assertEqual(ids, expected, (direction, page_size))
+                self.assertEqual(len(ids), len(set(ids)))
+
+    def test_bad_or_foreign_cursor_ends_scroll(self):
+        url = reverse("pozicijos:data")
+        foreign = encode_cursor("created", timezone.now(), 1)
+        for cursor in ("garbage!", "bm90LWpzb24", foreign):
+            data = self.client.get(url, {"sort": "kaina_eur", "cursor": cursor}).json()
+            self.assertEqual((data["html"].strip(), data["next_cursor"]), ("", ""), cursor)
+
+        response = self.client.get(reverse("pozicijos:list"), {"sort": "kaina_eur", "cursor": "garbage!"})
+        self.assertRedirects(response, reverse("pozicijos:list") + "?sort=kaina_eur", fetch_redirect_response=False)
+
+
+class ParseMeasureTests(TestCase):
+    def test_single_values(self):
+        cases = {
+            "1.25 m2": (Decimal("1.25"), "m2"),
+            "12,5kg": (Decimal("12.5"), "kg"),
+            "~ 40": (Decimal("40"), ""),
+            "1 250,5 kg": (Decimal("1250.5"), "kg"),
+            "-3": (Decimal("-3"), ""),
+            "3 m²": (Decimal("3"), "m2"),
+            "nėra": (None, ""),
+            "": (None, ""),
+            "1" * 20: (None, ""),
+        }
+        for raw, expected in cases.items():
+            self.assertEqual(parse_measure(raw), expected, raw)
+
+    def test_ranges_and_products_are_not_numbers(self):
+        for raw in ("10-20", "10 - 20 kg", "10–20", "1..5", "2x3", "2 X 3 m", "2×3", "2*3"):
+            self.assertEqual(parse_measure(raw), (None, ""), raw)
+
+    def test_shadow_fields_follow_text(self):
+        poz = Pozicija(plotas="10-20 m2", svoris="12,5 kg")
+        fill_shadow_fields(poz)
+        self.assertEqual((poz.plotas_num, poz.plotas_vnt), (None, ""))
+        self.assertEqual((poz.svoris_num, poz.svoris_vnt), (Decimal("12.5"), "kg"))
+
+
+class PriceAnalyticsTests(TestCase):
+    def test_per_unit_converts_measure_units(self):
+        for plotas, svoris in (("2 m2", "4 kg"), ("200 dm2", "4000 g"), ("5 cm", "2 lb")):
+            poz = Pozicija.objects.create(plotas=plotas, svoris=svoris)
+            KainosEilute.objects.create(pozicija=poz, kaina=Decimal("10"), matas="Vnt.", busena="aktuali")
+
+        frame = analytics.load_price_frame()
+        per_m2 = analytics.per_unit(frame, "plotas")
+        per_kg = analytics.per_unit(frame, "svoris")
+        self.assertEqual(sorted(v for v in per_m2 if not math.isnan(v)), [5.0, 5.0])
+        self.assertEqual(sorted(v for v in per_kg if not math.isnan(v)), [2.5, 2.5])
+        self.assertEqual(sum(map(math.isnan, per_m2)), 1)
+
+    def test_trend_by_validity_month_over_history(self):
+        poz = Pozicija.objects.create()
+        now = timezone.now()
+
+        def line(kaina, busena, nuo=None, matas="Vnt."):
+            return KainosEilute.objects.create(
+                pozicija=poz, kaina=Decimal(kaina), matas=matas, busena=busena, galioja_nuo=nuo,
+            )
+
+        line("10", "sena", date(2025, 1, 15))
+        line("14", "sena", date(2025, 1, 20))
+        line("12", "aktuali", date(2025, 3, 1))
+        line("99", "aktuali", date(2025, 3, 1), matas="kg")      # ne vieneto kaina
+        line("20", "aktuali")                                    # be galioja_nuo -> sukūrimo mėnuo
+        KainosEiluteArchyvas.objects.create(
+            id=10_000, pozicija=poz, kaina=Decimal("8"), matas="vnt", busena="sena",
+            galioja_nuo=date(2024, 12, 1), created=now, updated=now,
+        )
+
+        trend = analytics.price_analytics()["trend"]
+        this_month = f"{timezone.localdate():%Y-%m}"
+        self.assertEqual(trend["labels"], ["2024-12", "2025-01", "2025-03", this_month])
+        self.assertEqual(trend["count"], [1, 2, 1, 1])
+        self.assertEqual(trend["median"], [8.0, 12.0, 12.0, 20.0])
+
+    def test_python_quantiles_match_statistics(self):
+        rnd = random.Random(7)
+        codes = [rnd.randrange(4) for _ in range(200)]
+        values = [math.nan if rnd.random() < 0.1 else rnd.uniform(0, 100) for _ in codes]
+        out = analytics._quantiles_python(codes, values)
+
+        for i, code in enumerate(out["codes"]):
+            group = [v for c, v in zip(codes, values) if c == code and not math.isnan(v)]
+            deciles = statistics.quantiles(group, n=10, method="inclusive")
+            quartiles = statistics.quantiles(group, n=4, method="inclusive")
+            self.assertEqual(out["count"][i], len(group))
+            self.assertAlmostEqual(out["p10"][i], deciles[0])
+            self.assertAlmostEqual(out["p25"][i], quartiles[0])
+            self.assertAlmostEqual(out["median"][i], statistics.median(group))
+            self.assertAlmostEqual(out["p75"][i], quartiles[2])
+            self.assertAlmostEqual(out["p90"][i], deciles[8])
+            self.assertAlmostEqual(out["mean"][i], statistics.fmean(group))
+
+    @unittest.skipIf(analytics.np is None, "numpy neįdiegtas")
+    def test_numpy_matches_python(self):
+        rnd = random.Random(11)
+        for n in (0, 1, 2, 500):
+            codes = array("q", (rnd.randrange(6) for _ in range(n)))
+            values = array("d", (math.nan if rnd.random() < 0.1 else rnd.uniform(-5, 50) for _ in range(n)))
+            fast = analytics._quantiles_numpy(codes, values)
+            slow = analytics._quantiles_python(codes, values)
+            self.assertEqual(fast["codes"], slow["codes"])
+            self.assertEqual(fast["count"], slow["count"])
+            for name in ("p10", "p25", "median", "p75", "p90", "mean"):
+                for a, b in zip(fast[name], slow[name]):
+                    self.assertAlmostEqual(a, b, places=9)
+
+
+class QuoteInputTests(TestCase):
+    def test_fractional_and_non_numeric_qty_rejected(self):
+        parsed = parse_quote_input('[["A", "2.5"], ["B", 3.0], ["C", "1,0"], ["D", true], ["E", "NaN"], ["F", 7]]')
+        self.assertEqual([(r.poz_kodas, r.qty) for r in parsed.rows], [("B", 3), ("C", 1), ("F", 7)])
+        self.assertEqual([e.row_number for e in parsed.errors], [1, 4, 5])
+        self.assertIn("sveikas", parsed.errors[0].message)
+
+    def test_bad_json_shape_is_input_error(self):
+        for text in ('{"lines": 5}', '{"lines": null}', '{"lines": "A;1"}', "[1,"):
+            parsed = parse_quote_input(text)
+            self.assertEqual(parsed.rows, [], text)
+            self.assertTrue(parsed.input_error, text)
+        self.assertEqual(parse_quote_input('{"lines": []}').input_error, "")
+
+
+@override_settings(KAINOS_API_TOKENS=["slaptas"])
+class QuoteApiTests(TestCase):
+    def setUp(self):
+        self.url = reverse("pozicijos:kainos_quote_api")
+        self.client = Client(enforce_csrf_checks=True)
+        poz = Pozicija.objects.create(poz_kodas="A-1")
+        KainosEilute.objects.create(pozicija=poz, kaina=Decimal("4"), matas="Vnt.", busena="aktuali")
+
+    def _post(self, body, token="slaptas"):
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        data = body if isinstance(body, str) else json.dumps(body)
+        return self.client.post(self.url, data, content_type="application/json", headers=headers)
+
+    def test_token_required_and_csrf_not(self):
+        self.assertEqual(self._post([["A-1", 2]], token=None).status_code, 401)
+        self.assertEqual(self._post([["A-1", 2]], token="kitas").status_code, 401)
+
+        response = self._post({"lines": [{"poz_kodas": "A-1", "qty": 2}]})
+        self.assertEqual(response.status_code, 200)
+        line = response.json()["lines"][0]
+        self.assertEqual((line["kaina"], line["suma"], line["matas"]), ("4.00", "8.00", "Vnt."))
+
+    def test_bad_payload_is_400(self):
+        for body in ({"lines": 5}, "[1,", "A-1;2", []):
+            self.assertEqual(self._post(body).status_code, 400, body)
+
+        errors = self._post([["A-1", "1.5"]]).json()["errors"]
+        self.assertEqual([e["row"] for e in errors], [1])
+
+    def test_form_view_json_body_shape_error(self):
+        client = Client()
+        response = client.post(
+            reverse("pozicijos:kainos_quote"), '{"lines": 5}', content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ExportTests(TestCase):
+    COLS = "poz_kodas,klientas,poz_pavad"
+
+    def setUp(self):
+        Pozicija.objects.create(poz_kodas="E-1", klientas='A; "B"\nC', poz_pavad="ok\x01\x0b\x1f & <tag>")
+
+    def _export(self, fmt):
+        response = self.client.get(reverse("pozicijos:export"), {"format": fmt, "cols": self.COLS})
+        self.assertEqual(response.status_code, 200)
+        return b"".join(response.streaming_content)
+
+    def _header(self):
+        keys = self.COLS.split(",")
+        return [c["label"] for c in COLUMNS if c["key"] in keys]
+
+    def test_csv_round_trips(self):
+        text = self._export("csv").decode("utf-8")
+        self.assertTrue(text.startswith("\ufeff"))
+        header, *rows = csv.reader(io.StringIO(text[1:], newline=""), delimiter=";")
+        self.assertEqual(header, self._header())
+        by_label = dict(zip(header, rows[0]))
+        self.assertEqual(len(rows), 1)
+        self.assertEqual(by_label["Klientas"], 'A; "B"\nC')
+
+    def test_xlsx_is_well_formed(self):
+        ns = {"s": "http://schemas.openxmlformats.org/spreadsheetml/2006/main"}
+        with zipfile.ZipFile(io.BytesIO(self._export("xlsx"))) as zf:
+            self.assertIsNone(zf.testzip())
+            parts = {name: ElementTree.fromstring(zf.read(name)) for name in zf.namelist()}
+
+        sheet = parts["xl/worksheets/sheet1.xml"]
+        rows = [
+            ["".join(c.itertext()) for c in row.findall("s:c", ns)]
+            for row in sheet.iterfind("s:sheetData/s:row", ns)
+        ]
+        self.assertEqual(rows[0], self._header())
+        by_label = dict(zip(rows[0], rows[1]))
+        self.assertEqual(by_label["Pozicijos pavadinimas"], "ok & <tag>")
+
+
+class ListIndexPlanTests(TestCase):
+    """Rikiavimas pagal indeksuotą stulpelį (ir jo filtras) – be SCAN / TEMP B-TREE."""
+
+    def setUp(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("EXPLAIN QUERY PLAN – tik SQLite")
+
+    def test_indexed_sorts_and_range_filters_use_indexes(self):
+        out = io.StringIO()
+        call_command("explain_list_queries", "--all", stdout=out)
+        report = out.getvalue()
+
+        indexed = set(indexed_fields())
+        keys = [k for k, f in SORTABLE_FIELDS.items() if f in indexed]
+        self.assertIn("created", keys)
+        self.assertIn("[OK] filtras=—, sort=(default)", report)
+        for key in keys:
+            for direction in ("asc", "desc"):
+                self.assertIn(f"[OK] filtras=—, sort={key} {direction}", report)
+
+        ranged = [c["key"] for c in COLUMNS if c.get("filter") in ("range", "date") and c["key"] in keys]
+        self.assertTrue(ranged)
+        for key in ranged:
+            self.assertIn(f"[OK] filtras={key}, sort={key} asc", report)
+
+
+class VirtualCountColumnTests(TestCase):
+    def setUp(self):
+        files = {
+            "A": ["a.pdf"],
+            "B": ["b.pdf", "b.docx", "b.XLSX"],
+            "C": [],
+            "D": ["d.tif", "d.txt"],
+        }
+        self.ids = {}
+        for kodas, names in files.items():
+            poz = Pozicija.objects.create(poz_kodas=kodas)
+            self.ids[kodas] = poz.pk
+            for name in names:
+                PozicijosBrezinys.objects.create(pozicija=poz, failas=f"pozicijos/breziniai/{name}")
+
+    def _rows(self, **params):
+        cols = ["poz_kodas", "brez_count", "dok_count"]
+        request = RequestFactory().get("/", {"cols": ",".join(cols), **params})
+        qs = annotate_virtual(Pozicija.objects.all(), cols)
+        qs = apply_sorting(apply_filters(qs, request), request)
+        with self.assertNumQueries(1):
+            return list(project_columns(qs, cols, request))
+
+    def test_counts_and_sorting_in_one_query(self):
+        rows = self._rows(sort="brez_count", dir="desc")
+        self.assertEqual(
+            [(r["poz_kodas"], r["brez_count"], r["dok_count"]) for r in rows],
+            [("B", 3, 2), ("D", 2, 1), ("A", 1, 0), ("C", 0, 0)],
+        )
+        rows = self._rows(sort="dok_count")
+        self.assertEqual([r["poz_kodas"] for r in rows], ["A", "C", "D", "B"])  # lygūs – pagal id
+
+    def test_range_filter_on_count(self):
+        self.assertEqual([r["poz_kodas"] for r in self._rows(**{"f[brez_count]": ">=2", "sort": "poz_kodas"})], ["B", "D"])
+        self.assertEqual([r["poz_kodas"] for r in self._rows(**{"f[dok_count]": "0", "sort": "poz_kodas"})], ["A", "C"])
+
+
+class ColumnProjectionTests(TestCase):
+    def setUp(self):
+        Pozicija.objects.create(
+            poz_kodas="P-1", klientas="K", maskavimo_tipas="yra",
+            instrukcija="ilgas tekstas " * 100, pastabos="x", kaina_eur=Decimal("2.50"),
+        )
+
+    def test_only_visible_columns_and_sort_field_loaded(self):
+        request = RequestFactory().get("/", {"sort": "kaina_eur"})
+        qs = project_columns(
+            apply_sorting(Pozicija.objects.all(), request), ["poz_kodas", "nezinomas", "maskavimo_tipas"], request,
+        )
+        sql = str(qs.query)
+        self.assertNotIn("instrukcija", sql)
+        self.assertNotIn("pastabos", sql)
+        (row,) = qs
+        self.assertEqual(set(row), {"id", "poz_kodas", "maskavimo_tipas", "kaina_eur"})
+
+    def test_tbody_renders_projected_rows_with_choice_labels(self):
+        response = self.client.get(reverse("pozicijos:tbody"), {"cols": "poz_kodas,maskavimo_tipas"})
+        html = response.content.decode()
+        self.assertIn("P-1", html)
+        self.assertIn(dict(Pozicija._meta.get_field("maskavimo_tipas").flatchoices)["yra"], html)
+        self.assertNotIn("ilgas tekstas", html)
+
+
+class ListDataEndpointTests(TestCase):
+    def setUp(self):
+        cache.clear()
+        for klientas, n in (("Alfa", 4), ("Beta", 2), ("", 3)):
+            for i in range(n):
+                Pozicija.objects.create(klientas=klientas, poz_kodas=f"{klientas or 'X'}-{i}")
+        Pozicija.objects.create(klientas="Kitas", poz_kodas="Z-1", metalas="plienas")
+
+    def test_rows_counts_and_chart_in_one_payload(self):
+        params = {"page_size": "6", "cols": "poz_kodas,klientas"}
+        data = self.client.get(reverse("pozicijos:data"), params).json()
+
+        self.assertEqual(data["total"], 10)
+        self.assertEqual(data["labels"], ["Alfa", "Nepriskirta", "Beta", "Kitas"])
+        self.assertEqual(data["values"], [4, 3, 2, 1])
+        self.assertEqual(data["html"].count("<tr onclick"), 6)
+        self.assertTrue(data["next_cursor"])
+
+        stats = self.client.get(reverse("pozicijos:stats"), params).json()
+        self.assertEqual(
+            {k: stats[k] for k in ("labels", "values", "total")},
+            {k: data[k] for k in ("labels", "values", "total")},
+        )
+
+        more = self.client.get(reverse("pozicijos:data"), {**params, "cursor": data["next_cursor"]}).json()
+        self.assertEqual(set(more), {"html", "next_cursor"})
+        self.assertEqual(more["html"].count("<tr onclick"), 4)
+        self.assertEqual(more["next_cursor"], "")
+
+    def test_filtered_payload(self):
+        data = self.client.get(reverse("pozicijos:data"), {"f[klientas]": "alf"}).json()
+        self.assertEqual((data["labels"], data["values"], data["total"]), (["Alfa"], [4], 4))
+
+
+class KainosIndexPlanTests(TestCase):
+    """Kainų paieškos keliai skaito per KainosEilute indeksus (ne pilnu skenavimu)."""
+
+    def setUp(self):
+        if connection.vendor != "sqlite":
+            self.skipTest("EXPLAIN QUERY PLAN – tik SQLite")
+        self.poz = Pozicija.objects.create(poz_kodas="I-1")
+        self.line = KainosEilute.objects.create(
+            pozicija=self.poz, kaina=Decimal("1"), matas="Vnt.", kiekis_nuo=1, busena="aktuali",
+        )
+
+    def _plan(self, fn) -> str:
+        table = KainosEilute._meta.db_table
+        with CaptureQueriesContext(connection) as ctx:
+            fn()
+        lines = []
+        with connection.cursor() as cursor:
+            for q in ctx.captured_queries:
+                if table in q["sql"] and q["sql"].lstrip().upper().startswith("SELECT"):
+                    cursor.execute("EXPLAIN QUERY PLAN " + q["sql"])
+                    lines += [row[-1] for row in cursor.fetchall()]
+        self.assertTrue(lines)
+        for line in lines:
+            if line.startswith(f"SCAN {table}"):
+                self.assertIn("USING", line)
+        return "\n".join(lines)
+
+    def test_lookup_paths_use_indexes(self):
+        pricing.invalidate_pozicija_prices()
+        self.assertRegex(self._plan(lambda: pricing.fetch_compiled([self.poz.pk])), r"pz_ke_(list|akt_prio)_idx")
+        self.assertIn("pz_ke_akt_prio_idx", self._plan(lambda: headline_kainos([self.poz.pk])))
+        self.assertRegex(self._plan(lambda: set_aktuali(self.line, save=False)), r"pz_ke_(list|akt_group)_idx")
+
+        expiry = self._plan(lambda: expire_and_promote(dry_run=True))
+        self.assertIn("pz_ke_akt_iki_idx", expiry)
+        self.assertIn("pz_ke_lauk_nuo_idx", expiry)
+
+
+class RegenPreviewsCheckpointTests(TestCase):
+    def setUp(self):
+        tmp = tempfile.TemporaryDirectory(prefix="pozicijos-regen-")
+        self.addCleanup(tmp.cleanup)
+        self.checkpoint = f"{tmp.name}/regen.checkpoint"
+        poz = Pozicija.objects.create(poz_kodas="R-1")
+        self.ids = [
+            PozicijosBrezinys.objects.create(pozicija=poz, failas=f"pozicijos/breziniai/r{i}.pdf").pk
+            for i in range(4)
+        ]
+
+    def _run(self, *args, failing=()):
+        seen = []
+
+        def fake(b):
+            seen.append(b.pk)
+            if b.pk in failing:
+                return PreviewResult(ok=False, message="PDF preview klaida: sugadintas")
+            return PreviewResult(ok=True)
+
+        out = io.StringIO()
+        with mock.patch("pozicijos.management.commands.regen_previews.generate_preview_for_instance", fake):
+            call_command(
+                "regen_previews", "--force", "--workers", "1", "--chunk-size", "1",
+                "--checkpoint", self.checkpoint, *args, stdout=out,
+            )
+        return sorted(seen), out.getvalue()
+
+    def _checkpoint_ids(self):
+        with open(self.checkpoint) as fh:
+            return sorted(int(x) for x in fh.read().split())
+
+    def test_failed_ids_retried_on_resume(self):
+        bad = self.ids[2]
+        seen, out = self._run(failing={bad})
+        self.assertEqual(seen, self.ids)
+        self.assertIn("nepavyko: 1", out)
+        self.assertIn("PDF preview klaida: 1", out)
+        self.assertEqual(self._checkpoint_ids(), [i for i in self.ids if i != bad])
+
+        seen, _out = self._run()
+        self.assertEqual(seen, [bad])
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+    def test_interrupted_run_resumes_and_restart_ignores_checkpoint(self):
+        with open(self.checkpoint, "w") as fh:
+            fh.write(f"{self.ids[0]}\n{self.ids[1]}\n")
+        seen, out = self._run()
+        self.assertEqual(seen, self.ids[2:])
+        self.assertIn("Tęsiama: 2", out)
+        self.assertFalse(os.path.exists(self.checkpoint))
+
+        with open(self.checkpoint, "w") as fh:
+            fh.write(f"{self.ids[0]}\n")
+        seen, _out = self._run("--restart")
+        self.assertEqual(seen, self.ids)
+
+    def test_skip_failed_closes_the_run(self):
+        seen, _out = self._run("--skip-failed", failing={self.ids[0]})
+        self.assertEqual(seen, self.ids)
+        self.assertFalse(os.path.exists(self.checkpoint))
@@ -11,6 +11,10 @@ urlpatterns = [
     path("", views.pozicijos_list, name="list"),
     path("tbody/", views.pozicijos_tbody, name="tbody"),
     path("stats/", views.pozicijos_stats, name="stats"),
+    path("analytics/", views.pozicijos_analytics, name="analytics"),
+    path("data/", views.pozicijos_data, name="data"),
+    path("export/", views.pozicijos_export, name="export"),
+    path("suggest/<str:field>/", views.pozicijos_suggest, name="suggest"),
 
     # kurti / redaguoti
     path("nauja/", views.pozicija_create, name="create"),
@@ -21,6 +25,7 @@ urlpatterns = [
 
     # brėžiniai/importai
     path("<int:pk>/breziniai/upload/", views.brezinys_upload, name="brezinys_upload"),
+    path("<int:pk>/breziniai/previews/", views.brezinys_preview_status, name="brezinys_preview_status"),
     path("<int:pk>/breziniai/<int:bid>/delete/", views.brezinys_delete, name="brezinys_delete"),
     path("_import_csv/", views.pozicijos_import_csv, name="import_csv"),
 
@@ -34,6 +39,9 @@ urlpatterns = [
     path("kainos/<int:id>/redaguoti/", kainos_views.kaina_update, name="kaina_update"),
     path("kainos/<int:id>/aktuali/", kainos_views.kaina_set_aktuali, name="kaina_set_aktuali"),
     path("kainos/<int:id>/salinti/", kainos_views.kaina_delete, name="kaina_delete"),
+    path("kainos/pasiulymas/", kainos_views.kainos_quote, name="kainos_quote"),
+    path("kainos/pasiulymas/api/", kainos_views.kainos_quote_api, name="kainos_quote_api"),
+    path("kainos/auditas/", kainos_views.kainos_audit, name="kainos_audit"),
     path("kainos/<int:id>/history/", kainos_views.kaina_history, name="kaina_history"),
     path("<int:pk>/breziniai/<int:bid>/3d/", views.brezinys_3d, name="brezinys_3d"),
 ]
@@ -3,9 +3,10 @@ from __future__ import annotations
 
 from django.contrib import messages
 from django.db import transaction
-from django.db.models import Count
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404, render, redirect
+from django.template.loader import render_to_string
+from django.utils import timezone
 from django.views.decorators.http import require_POST
 from django.views.decorators.clickjacking import xframe_options_sameorigin
 
@@ -14,56 +15,51 @@ from .models import Pozicija, PozicijosBrezinys, KainosEilute
 from .forms import PozicijaForm, PozicijosBrezinysForm
 from .forms_kainos import KainaFormSet
 from .schemas.columns import COLUMNS
-from .services.previews import regenerate_missing_preview
+from .services.kainos import sync_kaina_eur
+from .services.preview_queue import needs_preview
+from .services.export import EXPORT_CHUNK_SIZE, iter_csv, iter_xlsx
+from .services.analytics import price_analytics
+from .services.list_cache import cached_list_fragment, normalized_list_query
+from .services.suggest import DEFAULT_SUGGEST_LIMIT, FORM_SUGGEST_FIELDS, suggest
 from .services.listing import (
+    VIRTUAL_ANNOTATIONS,
+    annotate_virtual,
+    apply_choice_labels,
+    choice_labels_for,
+    klientas_breakdown,
+    project_columns,
     visible_cols_from_request,
     apply_filters,
     apply_sorting,
+    page_size_from_request,
+    paginate_keyset,
 )
 
 
-FORM_SUGGEST_FIELDS = [
-    "klientas",
-    "projektas",
-    "metalas",
-    "kabinimo_budas",
-    "kabinimas_reme",
-    "paruosimas",
-    "padengimas",
-    "padengimo_standartas",
-    "spalva",
-    "maskavimas",
-    "testai_kokybe",
-    "pakavimas",
-    "instrukcija",
-]
-
-
-def _get_form_suggestions() -> dict[str, list[str]]:
-    suggestions: dict[str, list[str]] = {}
-    qs = Pozicija.objects.all()
-    for field in FORM_SUGGEST_FIELDS:
-        values = qs.order_by(field).values_list(field, flat=True).distinct()
-        suggestions[field] = [v for v in values if v]
-    return suggestions
-
-
 def pozicijos_list(request):
     visible_cols = visible_cols_from_request(request)
     q = request.GET.get("q", "").strip()
-    page_size = int(request.GET.get("page_size", 25))
+    page_size = page_size_from_request(request)
 
     current_sort = request.GET.get("sort", "")
     current_dir = request.GET.get("dir", "asc")
 
-    qs = Pozicija.objects.all()
+    qs = annotate_virtual(Pozicija.objects.all(), visible_cols)
     qs = apply_filters(qs, request)
-    qs = apply_sorting(qs, request)[:page_size]
+    qs = apply_sorting(qs, request)
+    qs = project_columns(qs, visible_cols, request)
+    page = paginate_keyset(qs, request, page_size)
+    if page.cursor_invalid:
+        # pasenusi nuoroda su cursor'iu – tas pats sąrašas nuo pradžios
+        params = request.GET.copy()
+        params.pop("cursor", None)
+        return redirect(f"{request.path}?{params.urlencode()}" if params else request.path)
 
     context = {
         "columns_schema": COLUMNS,
         "visible_cols": visible_cols,
-        "items": qs,
+        "items": apply_choice_labels(page.items, visible_cols, Pozicija),
+        "next_cursor": page.next_cursor,
         "q": q,
         "page_size": page_size,
         "f": request.GET,
@@ -73,51 +69,156 @@ def pozicijos_list(request):
     return render(request, "pozicijos/list.html", context)
 
 
-def pozicijos_tbody(request):
+def _filtered_queryset(request, visible_cols: list[str]):
+    qs = annotate_virtual(Pozicija.objects.all(), visible_cols)
+    return apply_filters(qs, request)
+
+
+def _render_tbody(request, filtered=None) -> tuple[str, str]:
+    """Grąžina (tbody HTML, kito puslapio cursor)."""
     visible_cols = visible_cols_from_request(request)
-    page_size = int(request.GET.get("page_size", 25))
+    if filtered is None:
+        filtered = _filtered_queryset(request, visible_cols)
 
     current_sort = request.GET.get("sort", "")
     current_dir = request.GET.get("dir", "asc")
 
-    qs = Pozicija.objects.all()
-    qs = apply_filters(qs, request)
-    qs = apply_sorting(qs, request)[:page_size]
+    qs = apply_sorting(filtered, request)
+    qs = project_columns(qs, visible_cols, request)
+    page = paginate_keyset(qs, request)
 
-    return render(
-        request,
+    html = render_to_string(
         "pozicijos/_tbody.html",
         {
             "columns_schema": COLUMNS,
             "visible_cols": visible_cols,
-            "items": qs,
+            "items": apply_choice_labels(page.items, visible_cols, Pozicija),
+            "next_cursor": page.next_cursor,
+            "append": bool(request.GET.get("cursor")),
             "current_sort": current_sort,
             "current_dir": current_dir,
         },
+        request=request,
     )
+    return html, page.next_cursor
+
+
+def _list_data_payload(request) -> dict:
+    """
+    Filtruotas queryset sukuriamas vieną kartą: iš jo – puslapio eilutės ir
+    (pirmam puslapiui) klientų pasiskirstymas su bendru skaičiumi.
+    """
+    visible_cols = visible_cols_from_request(request)
+    filtered = _filtered_queryset(request, visible_cols)
+
+    html, next_cursor = _render_tbody(request, filtered)
+    payload = {"html": html, "next_cursor": next_cursor}
+    if not request.GET.get("cursor"):
+        payload.update(klientas_breakdown(filtered))
+    return payload
+
+
+def pozicijos_tbody(request):
+    """
+    AJAX tbody. Su ?cursor=... grąžina tik kito puslapio eilutes (append režimas
+    begaliniam scroll'ui); paskutinė eilutė – "load-more" su kitu cursor'iu.
+    Identiškos užklausos (kol duomenys nepasikeitė) grąžinamos iš kešo.
+    """
+    html = cached_list_fragment(request, "tbody", lambda: _render_tbody(request)[0])
+    return HttpResponse(html)
 
 
 def pozicijos_stats(request):
-    qs = Pozicija.objects.all()
-    qs = apply_filters(qs, request)
+    data = cached_list_fragment(
+        request,
+        "stats",
+        lambda: klientas_breakdown(apply_filters(Pozicija.objects.all(), request)),
+        rows=False,
+    )
+    return JsonResponse(data)
+
 
-    data = qs.values("klientas").annotate(cnt=Count("id")).order_by("-cnt")
+def pozicijos_analytics(request):
+    """
+    Kainų analitika (kaina už m² / kg pagal metalą ir padengimą, pasiskirstymas
+    pagal klientą, tendencija pagal mėnesį) tam pačiam q / f[...] rinkiniui kaip stats.
+    Kešuojama pagal duomenų versiją – perskaičiuojama tik pasikeitus duomenims.
+    """
+    def build():
+        filtered = bool(normalized_list_query(request, rows=False))
+        return price_analytics(apply_filters(Pozicija.objects.all(), request) if filtered else None)
 
-    labels: list[str] = []
-    values: list[int] = []
-    total = 0
-    for row in data:
-        name = row["klientas"] or "Nepriskirta"
-        labels.append(name)
-        values.append(row["cnt"])
-        total += row["cnt"]
+    return JsonResponse(cached_list_fragment(request, "analytics", build, rows=False))
 
-    return JsonResponse({"labels": labels, "values": values, "total": total})
+
+def pozicijos_data(request):
+    """
+    Sąrašo puslapio vienas round-trip'as: {html, next_cursor, labels, values, total}.
+    Su ?cursor=... – tik html ir next_cursor (statistika nesikeičia).
+    """
+    data = cached_list_fragment(request, "data", lambda: _list_data_payload(request))
+    return JsonResponse(data)
+
+
+EXPORT_FORMATS = {
+    "csv": ("text/csv; charset=utf-8", "csv", iter_csv),
+    "xlsx": ("application/vnd.openxmlformats-officedocument.spreadsheetml.sheet", "xlsx", iter_xlsx),
+}
+
+
+def pozicijos_export(request):
+    """
+    Filtruoto ir surikiuoto sąrašo eksportas (?format=csv|xlsx) su tais pačiais
+    q / f[...] / sort / cols parametrais kaip sąrašas. Eilutės traukiamos
+    QuerySet.iterator() gabalais ir srautu siunčiamos klientui – atmintis
+    nepriklauso nuo įrašų skaičiaus.
+    """
+    fmt = (request.GET.get("format") or "csv").lower()
+    if fmt not in EXPORT_FORMATS:
+        fmt = "csv"
+    content_type, ext, writer = EXPORT_FORMATS[fmt]
+
+    visible_cols = visible_cols_from_request(request)
+    qs = _filtered_queryset(request, visible_cols)
+    qs = apply_sorting(qs, request)
+    qs = project_columns(qs, visible_cols)
+
+    selected = set(qs.query.values_select) | set(qs.query.annotation_select)
+    cols = [c for c in COLUMNS if c["key"] in visible_cols and c["key"] in selected]
+    keys = [c["key"] for c in cols]
+    header = [c["label"] for c in cols]
+    labels = choice_labels_for(keys, Pozicija)
+
+    def rows():
+        for row in qs.iterator(chunk_size=EXPORT_CHUNK_SIZE):
+            for name, mapping in labels.items():
+                row[name] = mapping.get(row[name], row[name])
+            yield [row[k] for k in keys]
+
+    response = StreamingHttpResponse(writer(header, rows()), content_type=content_type)
+    filename = f"pozicijos_{timezone.localdate():%Y%m%d}.{ext}"
+    response["Content-Disposition"] = f'attachment; filename="{filename}"'
+    return response
+
+
+def pozicijos_suggest(request, field: str):
+    """
+    Formos typeahead: ?prefix=...&limit=... -> {"field", "results": [...]}.
+    Atsakoma iš atmintyje laikomo prefix indekso (services/suggest.py).
+    """
+    if field not in FORM_SUGGEST_FIELDS:
+        return JsonResponse({"error": f"Laukas '{field}' nepalaikomas."}, status=404)
+    try:
+        limit = int(request.GET.get("limit", DEFAULT_SUGGEST_LIMIT))
+    except (TypeError, ValueError):
+        limit = DEFAULT_SUGGEST_LIMIT
+    prefix = request.GET.get("prefix", "")
+    return JsonResponse({"field": field, "results": suggest(field, prefix, limit)})
 
 
 def pozicija_detail(request, pk):
-    poz = get_object_or_404(Pozicija, pk=pk)
-    breziniai = PozicijosBrezinys.objects.filter(pozicija=poz).order_by("id")
+    poz = get_object_or_404(annotate_virtual(Pozicija.objects.all(), VIRTUAL_ANNOTATIONS), pk=pk)
+    breziniai = PozicijosBrezinys.objects.filter(pozicija=poz).select_related("preview_job").order_by("id")
     kainos_akt = poz.aktualios_kainos()
 
     context = {
@@ -129,16 +230,6 @@ def pozicija_detail(request, pk):
     return render(request, "pozicijos/detail.html", context)
 
 
-def _sync_kaina_eur_from_lines(poz: Pozicija) -> None:
-    """
-    Sąrašo stulpeliui: atnaujinam pozicija.kaina_eur iš aktualios kainos eilutės.
-    (Kadangi pas tave kaina susideda iš eilučių, čia laikom "headline" = pirmą aktualią.)
-    """
-    akt = poz.aktualios_kainos().first()
-    poz.kaina_eur = akt.kaina if akt else None
-    poz.save(update_fields=["kaina_eur", "updated"])
-
-
 def pozicija_create(request):
     pozicija = None
 
@@ -162,7 +253,7 @@ def pozicija_create(request):
                     if f.instance.pk:
                         f.instance.delete()
 
-                _sync_kaina_eur_from_lines(pozicija)
+                sync_kaina_eur(pozicija)
 
             messages.success(request, "Pozicija sukurta.")
             return redirect("pozicijos:detail", pk=pozicija.pk)
@@ -175,7 +266,7 @@ def pozicija_create(request):
     context = {
         "form": form,
         "pozicija": pozicija,
-        "suggestions": _get_form_suggestions(),
+        "suggest_fields": FORM_SUGGEST_FIELDS,
         "kainos_formset": formset,
     }
     return render(request, "pozicijos/form.html", context)
@@ -209,7 +300,7 @@ def pozicija_edit(request, pk):
                     if f.instance.pk:
                         f.instance.delete()
 
-                _sync_kaina_eur_from_lines(pozicija)
+                sync_kaina_eur(pozicija)
 
             messages.success(request, "Pozicija atnaujinta.")
             return redirect("pozicijos:detail", pk=pozicija.pk)
@@ -222,7 +313,7 @@ def pozicija_edit(request, pk):
     context = {
         "form": form,
         "pozicija": pozicija,
-        "suggestions": _get_form_suggestions(),
+        "suggest_fields": FORM_SUGGEST_FIELDS,
         "kainos_formset": formset,
     }
     return render(request, "pozicijos/form.html", context)
@@ -234,15 +325,38 @@ def brezinys_upload(request, pk):
     if request.method == "POST" and request.FILES.get("failas"):
         f = request.FILES["failas"]
         title = request.POST.get("pavadinimas", "").strip()
+        # miniatiūrą į eilę įtraukia post_save signalas (auto_preview_on_create)
         br = PozicijosBrezinys.objects.create(pozicija=poz, failas=f, pavadinimas=title)
-        res = regenerate_missing_preview(br)
-        if res.ok:
-            messages.success(request, "Įkelta. Miniatiūra paruošta.")
+        if needs_preview(br):
+            messages.success(request, "Įkelta. Miniatiūra generuojama fone.")
         else:
-            messages.info(request, f"Įkelta. Miniatiūros sugeneruoti nepavyko: {res.message}")
+            messages.success(request, "Įkelta.")
     return redirect("pozicijos:detail", pk=poz.pk)
 
 
+def brezinys_preview_status(request, pk):
+    """
+    Detalės puslapio polling'ui: {brezinys_id: {status, thumb_url, *_srcset, message}}
+    nurodytiems (?ids=1,2,3) arba visiems pozicijos brėžiniams.
+    """
+    qs = PozicijosBrezinys.objects.filter(pozicija_id=pk).select_related("preview_job")
+    ids = [i for i in (request.GET.get("ids") or "").split(",") if i.strip().isdigit()]
+    if ids:
+        qs = qs.filter(pk__in=ids)
+
+    data = {}
+    for br in qs:
+        job = getattr(br, "preview_job", None)  # be užduoties – None (RelatedObjectDoesNotExist yra AttributeError)
+        data[br.pk] = {
+            "status": job.busena if job else None,
+            "thumb_url": br.thumb_url,
+            "webp_srcset": br.webp_srcset,
+            "jpeg_srcset": br.jpeg_srcset,
+            "message": job.pranesimas if job else "",
+        }
+    return JsonResponse({"breziniai": data})
+
+
 def brezinys_delete(request, pk, bid):
     poz = get_object_or_404(Pozicija, pk=pk)
     br = get_object_or_404(PozicijosBrezinys, pk=bid, pozicija=poz)
@@ -2,6 +2,7 @@
 Django settings for registras project.
 """
 
+import os
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parent.parent
@@ -105,3 +106,7 @@ DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 OFFER_COMPANY_NAME = "UAB Elameta"
 OFFER_COMPANY_LINE1 = "Adresas, LT-00000, Miestas"
 OFFER_COMPANY_LINE2 = "Tel. +370 000 00000, el. paštas info@elameta.lt"
+
+# Mašininis masinio įkainojimo API (kainos/pasiulymas/api/): be CSRF, tik su
+# antrašte "Authorization: Bearer <raktas>". Tuščias sąrašas – API išjungtas.
+KAINOS_API_TOKENS = [t.strip() for t in os.environ.get("KAINOS_API_TOKENS", "").split(",") if t.strip()]